@@ -0,0 +1,65 @@
+"""
+Argon2 hashing microbenchmark.
+
+Reports hashes/sec for each (time_cost, memory_cost, parallelism) configuration
+when `workers` threads hash concurrently, which is how PasswordHashingService
+runs them. Run from the backend folder:
+
+    python -m benchmarks.argon2_bench --workers 4 --hashes 64
+    python -m benchmarks.argon2_bench --config 2,19456,1 --config 3,65536,4
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+
+# argon2-cffi defaults and the OWASP recommended minimum
+DEFAULT_CONFIGS = [(3, 65536, 4), (2, 19456, 1)]
+
+
+def parse_config(value: str) -> tuple[int, int, int]:
+    time_cost, memory_cost, parallelism = (int(part) for part in value.split(","))
+    return time_cost, memory_cost, parallelism
+
+
+def run(time_cost: int, memory_cost: int, parallelism: int, workers: int, hashes: int) -> dict:
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed = hasher.hash("warmup-password")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        list(executor.map(hasher.hash, (f"password-{i}" for i in range(hashes))))
+        hash_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        list(executor.map(lambda _: hasher.verify(hashed, "warmup-password"), range(hashes)))
+        verify_elapsed = time.perf_counter() - start
+
+    return {
+        "time_cost": time_cost,
+        "memory_cost_kib": memory_cost,
+        "parallelism": parallelism,
+        "workers": workers,
+        "hashes": hashes,
+        "hashes_per_sec": round(hashes / hash_elapsed, 2),
+        "verifies_per_sec": round(hashes / verify_elapsed, 2),
+        "mean_hash_ms": round(hash_elapsed / hashes * 1000 * workers, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", type=parse_config, help="time_cost,memory_cost_kib,parallelism (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--hashes", type=int, default=32)
+    args = parser.parse_args()
+
+    results = [run(*config, workers=args.workers, hashes=args.hashes) for config in args.config or DEFAULT_CONFIGS]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
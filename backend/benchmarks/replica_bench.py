@@ -0,0 +1,114 @@
+"""
+Read replica routing benchmark.
+
+Runs the user directory read (getUsersPage) from `--readers` concurrent tasks
+while `--writers` tasks write to the primary (queue and ack offline messages),
+and reports read throughput, p50/p99 read latency and how the reads were
+routed. Run it with and without DB_REPLICA_DSNS to compare:
+
+    DB_REPLICA_DSNS="host=localhost port=5433 dbname=chatcraze user=chatcraze_user password=..." \\
+        python -m benchmarks.replica_bench --duration 30 --output replicas.json
+    python -m benchmarks.replica_bench --duration 30 --output primary.json
+
+Two local Postgres instances are enough: a streaming replica of the primary,
+or a second server with the migrations applied. `--pinned` also runs one
+write-then-read "request" per writer iteration with the primary pin set,
+whose reads must all stay on the primary. Stop a replica during a run to see
+it ejected and the reads fail over.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from src.db.async_database import (
+    close_async_pool,
+    close_async_replica_pools,
+    get_async_db_manager,
+)
+from src.db.database import peek_replica_set, primary_pin
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def reader(deadline: float, latencies: list[float], errors: list[str]):
+    db_manager = get_async_db_manager()
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            await db_manager.getUsersPage(limit=100)
+        except Exception as err:
+            errors.append(str(err))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def writer(index: int, deadline: float, pinned: bool, counts: dict):
+    db_manager = get_async_db_manager()
+    receiver = f"__replica_bench_{index}"
+    while time.monotonic() < deadline:
+        token = primary_pin.set([False]) if pinned else None
+        try:
+            await db_manager.queuePendingMessage(receiver, "{}")
+            if pinned:
+                # would read from a replica if the pin were ignored
+                await db_manager.getUsersPage(limit=1)
+                counts["pinned_requests"] += 1
+            rows = await db_manager.getPendingMessages(receiver, 0, 100)
+            if rows:
+                await db_manager.ackPendingMessages(receiver, rows[-1]["pending_id"])
+            counts["writes"] += 1
+        finally:
+            if token is not None:
+                primary_pin.reset(token)
+
+
+async def run(args) -> dict:
+    deadline = time.monotonic() + args.duration
+    latencies: list[float] = []
+    errors: list[str] = []
+    counts = {"writes": 0, "pinned_requests": 0}
+    await asyncio.gather(
+        *(reader(deadline, latencies, errors) for _ in range(args.readers)),
+        *(writer(i, deadline, args.pinned, counts) for i in range(args.writers)),
+    )
+    replicas = peek_replica_set()
+    report = {
+        "readers": args.readers,
+        "writers": args.writers,
+        "duration_s": args.duration,
+        "reads_per_s": round(len(latencies) / args.duration, 1),
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "read_p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "read_errors": len(errors),
+        **counts,
+        "routing": replicas.stats if replicas else None,
+        "replicas": replicas.report() if replicas else [],
+    }
+    await close_async_replica_pools()
+    await close_async_pool()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--pinned", action="store_true", help="check read-your-writes with the primary pin set")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    text = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Application cold start benchmark.
+
+Measures, each in a fresh interpreter:
+
+    import   time to `import main` (module level work of every router and service)
+    serve    time from spawning uvicorn until /v1/hs answers, which includes the
+             startup handlers (migration check, pool open, background services)
+
+and lists the slowest imports from `python -X importtime`, to see where import
+time goes. Run from the backend folder:
+
+    python -m benchmarks.startup_bench --runs 10
+    python -m benchmarks.startup_bench --runs 5 --serve --output startup.json
+
+`--serve` needs the usual DB_* variables pointing at a reachable Postgres.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def summary(values: list[float]) -> dict:
+    return {
+        "min_ms": round(min(values) * 1000, 1),
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def time_import() -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list[dict]:
+    """Modules with the largest cumulative import time, direct imports of main only."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # the name is indented two spaces per level, after the separator's own space
+        if not cumulative.strip().isdigit() or len(name) - len(name.lstrip()) != 3:
+            continue
+        modules.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True)[:top]
+
+
+def time_serve(port: int, timeout: float) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/hs", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            if time.monotonic() > deadline:
+                raise TimeoutError("server did not become ready")
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--serve", action="store_true", help="also time until the server answers requests")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a server to be ready")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "runs": args.runs,
+        "import": summary([time_import() for _ in range(args.runs)]),
+        "slowest_imports": slowest_imports(args.top),
+    }
+    if args.serve:
+        report["serve"] = summary([time_serve(args.port, args.timeout) for _ in range(args.runs)])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Websocket load test and delivery latency benchmark.
+
+Starts the backend with uvicorn (or targets a running one with --url), opens
+`--clients` concurrent websocket clients and drives one of these patterns:
+
+    one-to-one  each client sends to a fixed partner
+    fanout      each client sends every message to `--fanout` random clients
+    offline     each client sends to users that are not connected (offline queue path)
+
+Every message carries its send time, so receivers measure delivery latency.
+The report is one JSON document with throughput, p50/p99/p999 latency, server
+memory per connection and server CPU time, for comparing runs:
+
+    python -m benchmarks.ws_load --clients 2000 --messages 20 --output before.json
+
+The started server uses the usual DB_* variables, so point them at a local
+Postgres with the schema applied (the app applies it on startup). Its
+per-client and per-connection rate limits are lifted so the run measures
+delivery rather than the throttle; --keep-rate-limits starts it with the
+WS_* limits of the current environment instead. The limits in effect are
+part of the report.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from websockets.asyncio.client import connect
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# rates far above anything the load generator reaches, see src/routers/websocket.py for the defaults
+UNLIMITED_RATES = {
+    "WS_CLIENT_RATE": "1000000000",
+    "WS_CLIENT_BURST": "1000000000",
+    "WS_CONNECTION_RATE": "1000000000",
+    "WS_CONNECTION_BURST": "1000000000",
+}
+RATE_LIMIT_DEFAULTS = {
+    "WS_CLIENT_RATE": "20",
+    "WS_CLIENT_BURST": "40",
+    "WS_CONNECTION_RATE": "10",
+    "WS_CONNECTION_BURST": "20",
+    "WS_MAX_FRAME_BYTES": "16384",
+    "WS_RATE_LIMIT_POLICY": "throttle",
+}
+
+
+def read_proc(pid: int) -> dict:
+    """RSS (bytes) and CPU seconds of a process from /proc, empty where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return {"rss": rss, "cpu": cpu}
+    except (OSError, StopIteration):
+        return {}
+
+
+def percentile(values: list, pct: float) -> float | None:
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Client:
+    def __init__(self, name: str):
+        self.name = name
+        self.socket = None
+        self.received = 0
+        self.offline_notices = 0
+        self.latencies: list[float] = []
+
+    async def open(self, url: str, coalesce: bool = False):
+        query = "?coalesce=1" if coalesce else ""
+        self.socket = await connect(f"{url}/{self.name}{query}", max_queue=None, open_timeout=60)
+
+    async def send(self, to: str, seq: int):
+        frame = {
+            "type": "message",
+            "from": self.name,
+            "to": to,
+            "message": f"{seq}",
+            "sentAt": time.perf_counter(),
+        }
+        await self.socket.send(json.dumps(frame))
+
+    async def receive(self):
+        async for data in self.socket:
+            now = time.perf_counter()
+            frame = json.loads(data)
+            frames = frame if isinstance(frame, list) else [frame]
+            for item in frames:
+                if item.get("type") == "message" and "sentAt" in item:
+                    self.received += 1
+                    self.latencies.append(now - item["sentAt"])
+                elif item.get("type") == "offline":
+                    self.offline_notices += 1
+                elif item.get("type") == "ping":
+                    await self.socket.send('{"type": "pong"}')
+
+
+def server_env(keep_rate_limits: bool) -> dict:
+    env = dict(os.environ)
+    if not keep_rate_limits:
+        env.update(UNLIMITED_RATES)
+    return env
+
+
+def rate_limits(env: dict) -> dict:
+    """The WS_* rate limit settings a server started with `env` runs with."""
+    return {key: env.get(key, default) for key, default in RATE_LIMIT_DEFAULTS.items()}
+
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    return process
+
+
+async def wait_for_server(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with connect(f"{url}/__bench_probe", open_timeout=2):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def targets_for(pattern: str, index: int, clients: list, fanout: int) -> list[str]:
+    if pattern == "one-to-one":
+        return [clients[index ^ 1].name] if index ^ 1 < len(clients) else [clients[0].name]
+    if pattern == "fanout":
+        return [client.name for client in random.sample(clients, min(fanout, len(clients)))]
+    return [f"bench_offline_{index}"]
+
+
+async def run(args) -> dict:
+    server = None
+    url = args.url
+    # a server started elsewhere runs with limits this process cannot see
+    limits = None
+    if url is None:
+        env = server_env(args.keep_rate_limits)
+        limits = rate_limits(env)
+        server = start_server(args.port, env)
+        url = f"ws://127.0.0.1:{args.port}/ws"
+    try:
+        await wait_for_server(url)
+        pid = server.pid if server else args.server_pid
+        baseline = read_proc(pid) if pid else {}
+
+        clients = [Client(f"bench_{args.run_id}_{i}") for i in range(args.clients)]
+        connect_start = time.perf_counter()
+        for i in range(0, len(clients), args.connect_batch):
+            await asyncio.gather(*(client.open(url, args.coalesce) for client in clients[i : i + args.connect_batch]))
+        connect_elapsed = time.perf_counter() - connect_start
+        connected = read_proc(pid) if pid else {}
+
+        readers = [asyncio.create_task(client.receive()) for client in clients]
+
+        async def drive(index: int, client: Client):
+            for seq in range(args.messages):
+                for target in targets_for(args.pattern, index, clients, args.fanout):
+                    await client.send(target, seq)
+                if args.interval:
+                    await asyncio.sleep(args.interval)
+
+        send_start = time.perf_counter()
+        await asyncio.gather(*(drive(i, client) for i, client in enumerate(clients)))
+        sent = sum(len(targets_for(args.pattern, i, clients, args.fanout)) for i in range(len(clients))) * args.messages
+        expected = 0 if args.pattern == "offline" else sent
+
+        # wait for the deliveries that are still in flight
+        deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < deadline:
+            delivered = sum(client.received for client in clients)
+            notices = sum(client.offline_notices for client in clients)
+            if (expected and delivered >= expected) or (not expected and notices >= sent):
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - send_start
+        finished = read_proc(pid) if pid else {}
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*(client.socket.close() for client in clients), return_exceptions=True)
+    finally:
+        if server:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=30)
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    delivered = len(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "pattern": args.pattern,
+        "clients": args.clients,
+        "messages_per_client": args.messages,
+        "fanout": args.fanout if args.pattern == "fanout" else None,
+        "coalesce": args.coalesce,
+        "rate_limits": limits,
+        "connect_seconds": round(connect_elapsed, 3),
+        "sent": sent,
+        "delivered": delivered,
+        "offline_notices": sum(client.offline_notices for client in clients),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_msgs_per_sec": round((delivered or sent) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p99": ms(percentile(latencies, 99)),
+            "p999": ms(percentile(latencies, 99.9)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "server": {
+            "rss_baseline_bytes": baseline.get("rss"),
+            "rss_connected_bytes": connected.get("rss"),
+            "memory_per_connection_bytes": (round((connected["rss"] - baseline["rss"]) / args.clients) if baseline and connected else None),
+            "cpu_seconds": round(finished["cpu"] - connected["cpu"], 3) if connected and finished else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pattern", choices=["one-to-one", "fanout", "offline"], default="one-to-one")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=10, help="messages sent by each client")
+    parser.add_argument("--fanout", type=int, default=10, help="recipients per message for --pattern fanout")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between a client's messages")
+    parser.add_argument("--connect-batch", type=int, default=200, help="clients connecting at the same time")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--coalesce", action="store_true", help="clients opt into server side frame coalescing")
+    parser.add_argument("--url", help="websocket base url of a running server, e.g. ws://localhost:8000/ws")
+    parser.add_argument("--server-pid", type=int, help="pid of the --url server, for memory and CPU figures")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="start the server with the WS_* rate limits of this environment")
+    parser.add_argument("--port", type=int, default=8765, help="port for the server started by the benchmark")
+    parser.add_argument("--run-id", default=str(os.getpid()), help="prefix that keeps usernames unique per run")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from src.db.database import DatabaseManager
+
+# before the app modules are imported, so their settings see the .env values
+load_dotenv()
+
+import os
+from fastapi import FastAPI, Request
+from src.db.database import close_pool, close_replica_pools, primary_pin, query_counter
+from src.db.async_database import close_async_pool, close_async_replica_pools
+from src.db.migrate import run_migrations
 from fastapi.middleware.cors import CORSMiddleware
-from src.routers.auth import router as auth_router
-from src.routers.websocket import router as ws_router
+from src.routers.auth import router as auth_router, email_outbox, pending_signups
+from src.routers.websocket import router as ws_router, manager, presence, message_store, presence_feed, rooms, heartbeat
 from src.routers.users import router as users_router
+from src.routers.messages import router as messages_router
+from src.routers.rooms import router as rooms_router
+from src.routers.metrics import router as metrics_router
+from src.services.password_hashing import shutdown_password_hasher
+from src.services.profiler import profiler
 
 app = FastAPI()
 
-load_dotenv()
-origins = ["http://localhost:3000", "https://chatcraze.akashtwt.tech", "http://app-network:3000" ]
+origins = ["http://localhost:3000", "https://chatcraze.akashtwt.tech", "http://app-network:3000"]
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,17 +28,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-db_manager = DatabaseManager()
 
+# reports how many queries a request made in X-DB-Queries, the API tests use it to keep endpoints at their query budget
+if os.getenv("DB_QUERY_COUNT_HEADER", "False").lower() == "true":
+
+    @app.middleware("http")
+    async def count_db_queries(request: Request, call_next):
+        counter = [0]
+        token = query_counter.set(counter)
+        try:
+            response = await call_next(request)
+        finally:
+            query_counter.reset(token)
+        response.headers["X-DB-Queries"] = str(counter[0])
+        return response
 
-# connecting to db on start
+
+# read-your-writes: after a request uses the primary, its remaining reads skip the replicas
+@app.middleware("http")
+async def pin_reads_after_write(request: Request, call_next):
+    token = primary_pin.set([False])
+    try:
+        return await call_next(request)
+    finally:
+        primary_pin.reset(token)
+
+
+# one query on an up to date database, the sync pool is only opened when something first uses it
 @app.on_event("startup")
-def create_db():
-    db_manager.init_db()
+async def open_async_db():
+    await run_migrations()
+    await manager.start()
+    await presence.start()
+    await message_store.start()
+    await presence_feed.start()
+    await rooms.start()
+    await heartbeat.start()
+    await email_outbox.start()
+    await pending_signups.start()
+
+
+@app.on_event("shutdown")
+async def close_db():
+    await pending_signups.stop()
+    await email_outbox.stop()
+    await heartbeat.stop()
+    await presence_feed.stop()
+    await message_store.stop()
+    await presence.stop()
+    await manager.stop()
+    await close_async_replica_pools()
+    await close_async_pool()
+    close_replica_pools()
+    close_pool()
+    shutdown_password_hasher()
+    profiler.stop()
 
 
 app.include_router(auth_router)
 app.include_router(ws_router)
 app.include_router(users_router)
+app.include_router(messages_router)
+app.include_router(rooms_router)
+app.include_router(metrics_router)
@@ -0,0 +1,552 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncContextManager, AsyncIterator, Tuple
+import psycopg
+from fastapi import HTTPException
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from src.db.database import get_db_settings, count_query, choose_replica, get_replica_set, peek_replica_set, pin_primary
+from src.model.req_body_model import signUpModel
+from src.services.auth_cache import invalidate_user
+from src.services.metrics import db_query_seconds, instrument_methods
+
+_async_pool: AsyncConnectionPool | None = None
+# tasks arriving while the pool is being opened wait for it instead of opening their own
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Return the process wide async connection pool, opening it on first use."""
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                settings = get_db_settings()
+                pool = AsyncConnectionPool(
+                    kwargs={**settings["conn_params"], "row_factory": dict_row},
+                    **settings["async_pool"],
+                    check=AsyncConnectionPool.check_connection,
+                    name="chatcraze-async",
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool():
+    """Close the shared async pool (called on application shutdown)."""
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+@asynccontextmanager
+async def async_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    A connection from the async pool, or a new one when DB_POOL_ENABLED is false.
+    Either way the transaction commits on a clean exit and rolls back if the block raises.
+    """
+    settings = get_db_settings()
+    if settings["use_pool"]:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            yield conn
+    else:
+        async with await psycopg.AsyncConnection.connect(**settings["conn_params"], row_factory=dict_row) as conn:
+            yield conn
+
+
+def get_async_pool_stats() -> dict[str, int]:
+    if _async_pool is None:
+        return {}
+    return _async_pool.get_stats()
+
+
+async def close_async_replica_pools():
+    """Close the async replica pools (called on application shutdown)."""
+    replicas = peek_replica_set()
+    if replicas is not None:
+        await replicas.close_async()
+
+
+@instrument_methods(db_query_seconds)
+class AsyncDatabaseManager:
+    """asyncio counterpart of DatabaseManager, safe to call from the event loop."""
+
+    async def __execute_query(
+        self,
+        query: str,
+        param: Tuple = (),
+        fetch: bool = False,
+        fetch_type: int = 1,
+        update: bool = False,
+        prepare: bool = False,
+        replica: bool = False,
+    ) -> Any:
+        count_query()
+        prepare = prepare and get_db_settings()["use_prepared"]
+        replicas = get_replica_set() if replica else None
+        if (chosen := choose_replica(replicas)) is not None:
+            try:
+                pool = await chosen.get_async_pool(replicas.pool_config)
+                # a replica too far behind is ejected and this read goes to the primary
+                fresh = not replicas.lag_due(chosen) or replicas.record_lag(chosen, await chosen.measure_lag_async(pool))
+                start = time.perf_counter()
+                if fresh:
+                    result = await self.__run_query(pool.connection(), query, param, fetch, fetch_type, update, prepare, True)
+            except psycopg.OperationalError:
+                # replica down or out of connections, eject it after repeated failures and use the primary
+                replicas.record_failure(chosen)
+            else:
+                if fresh:
+                    replicas.record_success(chosen, time.perf_counter() - start)
+                    return result
+
+        pin_primary()
+        return await self.__run_query(async_connection(), query, param, fetch, fetch_type, update, prepare)
+
+    async def __run_query(
+        self,
+        connection: AsyncContextManager[psycopg.AsyncConnection],
+        query: str,
+        param: Tuple,
+        fetch: bool,
+        fetch_type: int,
+        update: bool,
+        prepare: bool,
+        replica: bool = False,
+    ) -> Any:
+        try:
+            async with connection as conn:
+                async with conn.cursor() as cursor:
+                    # prepared statements live on the connection, so each pooled connection prepares once and reuses it
+                    await cursor.execute(query, param, prepare=prepare or None)
+                    if update:
+                        return cursor.rowcount
+                    if fetch:
+                        if fetch_type == 1:
+                            return await cursor.fetchone()
+                        elif fetch_type == 2:
+                            return await cursor.fetchmany()
+                        else:
+                            return await cursor.fetchall()
+        except psycopg.IntegrityError as err:
+            raise HTTPException(status_code=409, detail=f"Integrity error: {err}")
+        except psycopg.ProgrammingError as err:
+            raise HTTPException(status_code=400, detail=f"Programming error: {err}")
+        except psycopg.OperationalError as err:
+            # connection failures and pool timeouts on a replica go back to the caller, which retries on the primary
+            if replica:
+                raise
+            if isinstance(err, PoolTimeout):
+                raise HTTPException(status_code=503, detail=f"Database busy, try again later: {err}")
+            raise HTTPException(status_code=500, detail=f"Database error occurred: {str(err)}")
+        except Exception as err:
+            raise HTTPException(status_code=500, detail=f"Database error occurred: {str(err)}")
+
+    async def insertPendingSignup(self, user: signUpModel, otp: str, ttl: timedelta, email: dict[str, str]) -> bool:
+        """
+        Store an unverified sign-up and queue its OTP email in one statement.
+
+        Returns False if the username belongs to a user or to a sign-up that has
+        not expired yet; an expired sign-up for the same username is replaced.
+        """
+        query = """
+            WITH signup AS (
+                INSERT INTO pending_signups (username, email, password, otp, expires_at)
+                SELECT %(username)s, %(email)s, %(password)s, %(otp)s, %(expires_at)s
+                WHERE NOT EXISTS (SELECT 1 FROM users WHERE username = %(username)s)
+                ON CONFLICT (username) DO UPDATE SET
+                    email = EXCLUDED.email, password = EXCLUDED.password, otp = EXCLUDED.otp,
+                    attempts = 0, expires_at = EXCLUDED.expires_at, createdat = CURRENT_TIMESTAMP
+                WHERE pending_signups.expires_at <= CURRENT_TIMESTAMP
+                RETURNING username
+            ),
+            mail AS (
+                INSERT INTO email_outbox (dedupe_key, recipient, subject, html)
+                SELECT %(dedupe_key)s, %(recipient)s, %(subject)s, %(html)s FROM signup
+                ON CONFLICT (dedupe_key) DO NOTHING
+            )
+            SELECT EXISTS (SELECT 1 FROM signup) AS created
+        """
+        result = await self.__execute_query(
+            query,
+            {
+                "username": user.username,
+                "email": user.email,
+                "password": user.password,
+                "otp": otp,
+                "expires_at": datetime.now() + ttl,
+                "dedupe_key": email["dedupe_key"],
+                "recipient": email["recipient"],
+                "subject": email["subject"],
+                "html": email["html"],
+            },
+            fetch=True,
+        )
+        return result["created"]
+
+    async def usernameTaken(self, username: str) -> bool:
+        """True if a user or an unexpired sign-up holds the username, two primary key lookups."""
+        query = """
+            SELECT EXISTS (SELECT 1 FROM users WHERE username = %(username)s)
+                OR EXISTS (SELECT 1 FROM pending_signups WHERE username = %(username)s AND expires_at > CURRENT_TIMESTAMP)
+                AS taken
+        """
+        result = await self.__execute_query(query, {"username": username}, fetch=True, prepare=True, replica=True)
+        return result["taken"]
+
+    async def emailTaken(self, email: str) -> bool:
+        """True if a user or an unexpired sign-up uses the email."""
+        query = """
+            SELECT EXISTS (SELECT 1 FROM users WHERE email = %(email)s)
+                OR EXISTS (SELECT 1 FROM pending_signups WHERE email = %(email)s AND expires_at > CURRENT_TIMESTAMP)
+                AS taken
+        """
+        result = await self.__execute_query(query, {"email": email}, fetch=True, prepare=True, replica=True)
+        return result["taken"]
+
+    async def purgeExpiredSignups(self, limit: int) -> int:
+        """Delete up to `limit` expired sign-ups, oldest first, along the expires_at index."""
+        query = """
+            DELETE FROM pending_signups WHERE username IN (
+                SELECT username FROM pending_signups
+                WHERE expires_at <= CURRENT_TIMESTAMP
+                ORDER BY expires_at
+                LIMIT %s
+            )
+        """
+        return await self.__execute_query(query, (limit,), update=True)
+
+    async def enqueueEmail(self, dedupe_key: str, recipient: str, subject: str, html: str) -> bool:
+        """Queue an email in the outbox, a second email with the same dedupe_key is ignored."""
+        query = """
+            INSERT INTO email_outbox (dedupe_key, recipient, subject, html)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (dedupe_key) DO NOTHING
+        """
+        return await self.__execute_query(query, (dedupe_key, recipient, subject, html), update=True) == 1
+
+    async def claimOutboxEmails(self, limit: int, lease_seconds: float, max_attempts: int):
+        """
+        Claim due outbox emails for sending.
+
+        Rows stuck in 'sending' longer than the lease (the worker that claimed
+        them died) are claimed again, or marked failed once they already used
+        `max_attempts`. SKIP LOCKED lets several workers share the outbox
+        without sending an email twice.
+        """
+        query = """
+            WITH due AS (
+                SELECT outbox_id, attempts >= %(max_attempts)s AS exhausted FROM email_outbox
+                WHERE next_attempt_at <= CURRENT_TIMESTAMP
+                  AND (status = 'pending'
+                       OR (status = 'sending' AND claimedat < CURRENT_TIMESTAMP - make_interval(secs => %(lease)s)))
+                ORDER BY next_attempt_at, outbox_id
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            ),
+            gave_up AS (
+                UPDATE email_outbox SET status = 'failed', last_error = 'lease expired on the last attempt'
+                WHERE outbox_id IN (SELECT outbox_id FROM due WHERE exhausted)
+            )
+            UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, claimedat = CURRENT_TIMESTAMP
+            WHERE outbox_id IN (SELECT outbox_id FROM due WHERE NOT exhausted)
+            RETURNING outbox_id, dedupe_key, recipient, subject, html, attempts
+        """
+        return await self.__execute_query(
+            query, {"max_attempts": max_attempts, "lease": lease_seconds, "limit": limit}, fetch=True, fetch_type=3
+        )
+
+    async def markOutboxSent(self, outbox_ids: list[int]):
+        query = "UPDATE email_outbox SET status = 'sent', sentat = CURRENT_TIMESTAMP WHERE outbox_id = ANY(%s)"
+        await self.__execute_query(query, (outbox_ids,))
+
+    async def markOutboxFailed(self, outbox_ids: list[int], error: str, base_delay: float, max_attempts: int):
+        """Reschedule failed emails with exponential backoff, giving up after `max_attempts`."""
+        query = """
+            UPDATE email_outbox SET
+                status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s * power(2, attempts - 1)),
+                last_error = %s
+            WHERE outbox_id = ANY(%s)
+        """
+        await self.__execute_query(query, (max_attempts, base_delay, error, outbox_ids))
+
+    async def purgeOutbox(self, limit: int, retention_seconds: float) -> int:
+        """Delete up to `limit` sent or failed emails created more than `retention_seconds` ago, oldest first."""
+        query = """
+            DELETE FROM email_outbox WHERE outbox_id IN (
+                SELECT outbox_id FROM email_outbox
+                WHERE status IN ('sent', 'failed')
+                AND createdat <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+                ORDER BY createdat
+                LIMIT %s
+            )
+        """
+        return await self.__execute_query(query, (retention_seconds, limit), update=True)
+
+    async def user_exists(self, username: str = None, email: str = None):
+        """Check if a user exists based on username or email."""
+        if not (username or email):
+            raise ValueError("At least one of username or email must be provided.")
+
+        conditions, parameters = [], []
+        if username:
+            conditions.append("username = %s")
+            parameters.append(username)
+        if email:
+            conditions.append("email = %s")
+            parameters.append(email)
+
+        query = "SELECT isverified FROM users WHERE " + " OR ".join(conditions)
+        return await self.__execute_query(query, tuple(parameters), fetch=True, prepare=True, replica=True)
+
+    async def getLoginState(self, username: str) -> dict[str, Any] | None:
+        """Get the password hash and verification state for a login in one query."""
+        query = "SELECT password, isverified FROM users WHERE username = %s"
+        return await self.__execute_query(query, (username,), fetch=True, prepare=True)
+
+    async def verifyPendingSignup(self, username: str, otp: str, max_attempts: int, email: dict[str, str]):
+        """
+        Check the OTP of a sign-up and, if it is right, move the sign-up into
+        users and queue the confirmation email, all in one statement.
+
+        Returns None if there is no sign-up for the username, otherwise a row with
+        `attempts_left`, `otp_valid`, `otp_fresh`, `expires_in` (seconds until the
+        sign-up expires), `attempts` (wrong OTPs so far when this one was wrong,
+        else NULL) and `verified` (true only when the user was created). Once
+        `max_attempts` wrong OTPs were given no OTP is accepted. `email` is the
+        outbox row, `recipient` is taken from the sign-up.
+        """
+        query = """
+            WITH target AS (
+                SELECT username, email, password, attempts < %(max_attempts)s AS attempts_left,
+                       otp = %(otp)s AS otp_valid, expires_at > CURRENT_TIMESTAMP AS otp_fresh,
+                       EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)::float AS expires_in
+                FROM pending_signups WHERE username = %(username)s
+                FOR UPDATE
+            ),
+            moved AS (
+                DELETE FROM pending_signups AS p USING target AS t
+                WHERE p.username = t.username AND t.otp_valid AND t.otp_fresh AND t.attempts_left
+                RETURNING p.username, p.email, p.password
+            ),
+            created AS (
+                INSERT INTO users (username, email, password, isverified, createdat)
+                SELECT username, email, password, TRUE, CURRENT_TIMESTAMP FROM moved
+                RETURNING email
+            ),
+            failed AS (
+                UPDATE pending_signups AS p SET attempts = p.attempts + 1
+                FROM target AS t
+                WHERE p.username = t.username AND NOT t.otp_valid AND t.attempts_left
+                RETURNING p.attempts
+            ),
+            mail AS (
+                INSERT INTO email_outbox (dedupe_key, recipient, subject, html)
+                SELECT %(dedupe_key)s, email, %(subject)s, %(html)s FROM created
+                ON CONFLICT (dedupe_key) DO NOTHING
+            )
+            SELECT t.attempts_left, t.otp_valid, t.otp_fresh, t.expires_in, (SELECT attempts FROM failed) AS attempts,
+                   EXISTS (SELECT 1 FROM created) AS verified
+            FROM target AS t
+        """
+        result = await self.__execute_query(
+            query,
+            {
+                "otp": otp,
+                "max_attempts": max_attempts,
+                "username": username,
+                "dedupe_key": email["dedupe_key"],
+                "subject": email["subject"],
+                "html": email["html"],
+            },
+            fetch=True,
+            prepare=True,
+        )
+        if result and result["verified"]:
+            invalidate_user(username)
+        return result
+
+    async def getPass(self, username: str):
+        """Get the password for the given username."""
+        query = "SELECT password FROM users WHERE username = %s"
+        result = await self.__execute_query(query, (username,), fetch=True, replica=True)
+        return result["password"] if result else None
+
+    async def updatePassword(self, username: str, hashed_password: str) -> bool:
+        """Replace the stored password hash for the given username."""
+        query = "UPDATE users SET password = %s WHERE username = %s"
+        await self.__execute_query(query, (hashed_password, username))
+        return True
+
+    async def getAllUsers(self):
+        """Get all users."""
+        query = "SELECT username, isonline FROM users"
+        data = await self.__execute_query(query, fetch=True, fetch_type=3, replica=True)
+        return [{"username": row["username"], "isOnline": row["isonline"]} for row in data]
+
+    async def getUsersPage(self, after: str | None = None, prefix: str | None = None, limit: int = 100):
+        """
+        Get a page of users ordered by username, optionally filtered by username prefix.
+
+        Keyset pagination: `after` is the last username of the previous page.
+        Prefix queries compare with the pattern operators so that filter, seek
+        and ordering all come from users_username_pattern_idx.
+        """
+        if prefix:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = "SELECT username, isonline FROM users WHERE username LIKE %s"
+            param = [escaped + "%"]
+            if after is not None:
+                query += " AND username ~>~ %s"
+                param.append(after)
+            query += " ORDER BY username USING ~<~ LIMIT %s"
+        else:
+            query = "SELECT username, isonline FROM users"
+            param = []
+            if after is not None:
+                query += " WHERE username > %s"
+                param.append(after)
+            query += " ORDER BY username LIMIT %s"
+        param.append(limit)
+        data = await self.__execute_query(query, tuple(param), fetch=True, fetch_type=3, replica=True)
+        return [{"username": row["username"], "isOnline": row["isonline"]} for row in data]
+
+    async def streamAllUsers(self, batch_size: int = 1000):
+        """
+        Yield every user through a server-side cursor, memory stays flat however many users exist.
+
+        Read from a replica when one is available. A replica that fails before
+        the first row falls back to the primary, a failure mid-export is raised.
+        """
+        replicas = get_replica_set()
+        chosen = choose_replica(replicas)
+        if chosen is not None:
+            yielded = False
+            try:
+                pool = await chosen.get_async_pool(replicas.pool_config)
+                if not replicas.lag_due(chosen) or replicas.record_lag(chosen, await chosen.measure_lag_async(pool)):
+                    async for user in self.__stream_users(pool.connection(), batch_size):
+                        yielded = True
+                        yield user
+                    return
+            except psycopg.OperationalError:
+                replicas.record_failure(chosen)
+                if yielded:
+                    raise
+        pin_primary()
+        async for user in self.__stream_users(async_connection(), batch_size):
+            yield user
+
+    @staticmethod
+    async def __stream_users(connection: AsyncContextManager[psycopg.AsyncConnection], batch_size: int):
+        async with connection as conn:
+            async with conn.cursor(name="users_export") as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute("SELECT username, isonline FROM users ORDER BY username")
+                async for row in cursor:
+                    yield {"username": row["username"], "isOnline": row["isonline"]}
+
+    async def getConversation(self, user1: str, user2: str, before: tuple[datetime, int] | None, limit: int):
+        """
+        Get one page of messages between two users, newest first.
+
+        Keyset pagination: `before` is the (createdat, message_id) of the oldest
+        message already seen, so every page is a single index range scan no
+        matter how far back it is.
+        """
+        user_a, user_b = (user1, user2) if user1 <= user2 else (user2, user1)
+        query = """
+            SELECT message_id, sender, body, createdat FROM messages
+            WHERE user_a = %s AND user_b = %s
+        """
+        param = [user_a, user_b]
+        if before:
+            query += " AND (createdat, message_id) < (%s, %s)"
+            param.extend(before)
+        query += " ORDER BY createdat DESC, message_id DESC LIMIT %s"
+        param.append(limit)
+        return await self.__execute_query(query, tuple(param), fetch=True, fetch_type=3, prepare=True, replica=True)
+
+    async def queuePendingMessage(self, receiver: str, payload: str):
+        """Store a message for a receiver who is offline."""
+        query = "INSERT INTO pending_messages (receiver, payload) VALUES (%s, %s)"
+        await self.__execute_query(query, (receiver, payload), prepare=True)
+
+    async def getPendingMessages(self, receiver: str, after_id: int, limit: int):
+        """Get queued messages for a receiver in arrival order."""
+        query = """
+            SELECT pending_id, payload FROM pending_messages
+            WHERE receiver = %s AND pending_id > %s
+            ORDER BY pending_id LIMIT %s
+        """
+        return await self.__execute_query(query, (receiver, after_id, limit), fetch=True, fetch_type=3)
+
+    async def ackPendingMessages(self, receiver: str, upto_id: int) -> int:
+        """Delete every queued message up to and including `upto_id` in one statement."""
+        query = "DELETE FROM pending_messages WHERE receiver = %s AND pending_id <= %s"
+        return await self.__execute_query(query, (receiver, upto_id), update=True)
+
+    async def createRoom(self, name: str, creator: str, members: list[str]) -> int:
+        """Create a room with its members (the creator included) in one statement, returns the room id."""
+        query = """
+            WITH room AS (
+                INSERT INTO rooms (name, createdby) VALUES (%s, %s) RETURNING room_id
+            ),
+            members AS (
+                INSERT INTO room_members (room_id, username)
+                SELECT room.room_id, member FROM room, unnest(%s::text[]) AS member
+            )
+            SELECT room_id FROM room
+        """
+        result = await self.__execute_query(query, (name, creator, list({creator, *members})), fetch=True)
+        return result["room_id"]
+
+    async def getRoom(self, room_id: int):
+        query = "SELECT room_id, name, createdby FROM rooms WHERE room_id = %s"
+        return await self.__execute_query(query, (room_id,), fetch=True)
+
+    async def addRoomMember(self, room_id: int, username: str) -> bool:
+        query = "INSERT INTO room_members (room_id, username) VALUES (%s, %s) ON CONFLICT DO NOTHING"
+        return await self.__execute_query(query, (room_id, username), update=True) == 1
+
+    async def removeRoomMember(self, room_id: int, username: str) -> bool:
+        query = "DELETE FROM room_members WHERE room_id = %s AND username = %s"
+        return await self.__execute_query(query, (room_id, username), update=True) == 1
+
+    async def getAllRoomMembers(self):
+        """Every (room_id, username) pair, used to build the in-memory membership indexes."""
+        query = "SELECT room_id, username FROM room_members"
+        return await self.__execute_query(query, fetch=True, fetch_type=3)
+
+    async def makeCustomQuery(self, query: str, param: Tuple, update=True):
+        """Execute custom SQL queries."""
+        return await self.__execute_query(query, param=param, fetch=True, update=update)
+
+
+_manager: AsyncDatabaseManager | None = None
+
+
+def get_async_db_manager() -> AsyncDatabaseManager:
+    """The AsyncDatabaseManager shared by every module of the process."""
+    global _manager
+    if _manager is None:
+        _manager = AsyncDatabaseManager()
+    return _manager
+
+
+__all__ = [
+    "AsyncDatabaseManager",
+    "get_async_db_manager",
+    "get_async_pool",
+    "async_connection",
+    "close_async_pool",
+    "get_async_pool_stats",
+    "close_async_replica_pools",
+]
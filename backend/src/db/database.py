@@ -1,41 +1,228 @@
 import os
+import threading
+import time
+from contextvars import ContextVar
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from src.model.req_body_model import signUpModel
-from datetime import datetime
+from src.services.metrics import db_query_seconds, instrument_methods
 from typing import Any, Tuple
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
+from src.db.replicas import Replica, ReplicaSet
 
-load_dotenv()
+_settings: dict | None = None
 
-conn_params = {
-    "host": os.environ["DB_HOST"],
-    "dbname": os.environ["DB_NAME"],
-    "user": os.environ["DB_USER"],
-    "password": os.environ["DB_PASS"],
-    "port": os.environ["DB_PORT"],
-}
 
+def get_db_settings() -> dict:
+    """Connection and pool settings, read from the environment on first use instead of at import."""
+    global _settings
+    if _settings is None:
+        load_dotenv()
+        _settings = {
+            "conn_params": {
+                "host": os.environ["DB_HOST"],
+                "dbname": os.environ["DB_NAME"],
+                "user": os.environ["DB_USER"],
+                "password": os.environ["DB_PASS"],
+                "port": os.environ["DB_PORT"],
+            },
+            # pool settings, every DatabaseManager in a process shares the same pool. It only serves the
+            # few sync code paths left, so it is small; the async pool below carries most of the traffic
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "4")),
+                "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            },
+            # sized on its own: connections held against Postgres are the sum of both pools
+            "async_pool": {
+                "min_size": int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "10")),
+                "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            },
+            "use_pool": os.getenv("DB_POOL_ENABLED", "True").lower() == "true",
+            # server-side prepared statements for hot queries, turn off behind a transaction-mode pgbouncer
+            "use_prepared": os.getenv("DB_PREPARED_STATEMENTS", "True").lower() == "true",
+            # read replicas for read-only queries, comma separated libpq connection strings
+            "replica": {
+                "dsns": [dsn.strip() for dsn in os.getenv("DB_REPLICA_DSNS", "").split(",") if dsn.strip()],
+                "strategy": os.getenv("DB_REPLICA_STRATEGY", "round_robin"),
+                "eject_after": int(os.getenv("DB_REPLICA_EJECT_AFTER", "3")),
+                "cooldown": float(os.getenv("DB_REPLICA_COOLDOWN", "30")),
+                # seconds of replay lag before a replica is ejected, 0 turns the check off
+                "max_lag": float(os.getenv("DB_REPLICA_MAX_LAG", "10")),
+                "lag_check_interval": float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "5")),
+                # a short checkout timeout, a replica that cannot hand out a connection falls back to the primary
+                "pool": {
+                    "min_size": int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "2")),
+                    "max_size": int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "10")),
+                    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+                    "timeout": float(os.getenv("DB_REPLICA_TIMEOUT", "2")),
+                },
+            },
+        }
+    return _settings
+
+
+# per-request query counter, installed by the query counting middleware in main.py
+query_counter: ContextVar[list[int] | None] = ContextVar("query_counter", default=None)
+
+
+def count_query():
+    counter = query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# per-request primary pin, installed by the middleware in main.py. Once a request
+# has used the primary its later reads stay there, so it reads its own writes and
+# never sees older data than it already has. Without a pin (background tasks)
+# every read-only query may go to a replica.
+primary_pin: ContextVar[list[bool] | None] = ContextVar("primary_pin", default=None)
+
+
+def pin_primary():
+    pin = primary_pin.get()
+    if pin is not None:
+        pin[0] = True
+
+
+def pinned_to_primary() -> bool:
+    pin = primary_pin.get()
+    return pin is not None and pin[0]
+
+
+_pool: ConnectionPool | None = None
+# sync routes run on a threadpool, concurrent first uses must not each open a pool
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_db_settings()
+                _pool = ConnectionPool(
+                    kwargs={**settings["conn_params"], "row_factory": dict_row},
+                    **settings["pool"],
+                    # health check on checkout so a connection dropped by the server is replaced, not handed out
+                    check=ConnectionPool.check_connection,
+                    name="chatcraze",
+                    open=True,
+                )
+    return _pool
+
+
+def close_pool():
+    """Close the shared pool (called on application shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def get_pool_stats() -> dict[str, int]:
+    """Return pool statistics (size, idle connections, waiting clients, ...)."""
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+
+_replica_set: ReplicaSet | None = None
+# reached from threadpool routes too, a losing set's replica pools would never be closed
+_replica_set_lock = threading.Lock()
+
+
+def get_replica_set() -> ReplicaSet | None:
+    """The replica set shared by the sync and async managers, None when DB_REPLICA_DSNS is empty."""
+    global _replica_set
+    if _replica_set is None:
+        replica = get_db_settings()["replica"]
+        if replica["dsns"]:
+            with _replica_set_lock:
+                if _replica_set is None:
+                    _replica_set = ReplicaSet(
+                        replica["dsns"],
+                        strategy=replica["strategy"],
+                        eject_after=replica["eject_after"],
+                        cooldown=replica["cooldown"],
+                        pool_config=replica["pool"],
+                        max_lag=replica["max_lag"],
+                        lag_check_interval=replica["lag_check_interval"],
+                    )
+    return _replica_set
+
+
+def peek_replica_set() -> ReplicaSet | None:
+    """The replica set if it was created, without creating it."""
+    return _replica_set
+
+
+def choose_replica(replicas: ReplicaSet | None) -> Replica | None:
+    """The replica of `replicas` (from get_replica_set) a read-only query should use, None for the primary."""
+    if replicas is None:
+        return None
+    if pinned_to_primary():
+        replicas.stats["pinned_reads"] += 1
+        return None
+    return replicas.choose()
+
+
+def close_replica_pools():
+    """Close the sync replica pools (called on application shutdown)."""
+    if _replica_set is not None:
+        _replica_set.close()
+
+
+@instrument_methods(db_query_seconds)
 class DatabaseManager:
 
     def get_connection(self):
         """Establish a connection to the PostgreSQL database."""
         try:
-            conn = psycopg.connect(**conn_params, row_factory=dict_row)
+            conn = psycopg.connect(**get_db_settings()["conn_params"], row_factory=dict_row)
             return conn
         except psycopg.Error as err:
-            raise HTTPException(
-                status_code=500, detail=f"Error connecting to database: {err}"
-            )
-
-    def __execute_query(self,
-                        query: str,
-                        param: Tuple = (),
-                        fetch: bool = False,
-                        fetch_type: int = 1,
-                        update: bool = False
-                        ) -> Any:
+            raise HTTPException(status_code=500, detail=f"Error connecting to database: {err}")
+
+    def __execute_query(
+        self,
+        query: str,
+        param: Tuple = (),
+        fetch: bool = False,
+        fetch_type: int = 1,
+        update: bool = False,
+        prepare: bool = False,
+        replica: bool = False,
+    ) -> Any:
+        count_query()
+        settings = get_db_settings()
+        prepare = prepare and settings["use_prepared"]
+        replicas = get_replica_set() if replica and settings["use_pool"] else None
+        if (chosen := choose_replica(replicas)) is not None:
+            try:
+                pool = chosen.get_pool(replicas.pool_config)
+                # a replica too far behind is ejected and this read goes to the primary
+                fresh = not replicas.lag_due(chosen) or replicas.record_lag(chosen, chosen.measure_lag(pool))
+                start = time.perf_counter()
+                if fresh:
+                    result = self.__execute_pooled_query(pool, query, param, fetch, fetch_type, update, prepare, True)
+            except psycopg.OperationalError:
+                # replica down or out of connections, eject it after repeated failures and use the primary
+                replicas.record_failure(chosen)
+            else:
+                if fresh:
+                    replicas.record_success(chosen, time.perf_counter() - start)
+                    return result
+
+        pin_primary()
+        if settings["use_pool"]:
+            return self.__execute_pooled_query(get_pool(), query, param, fetch, fetch_type, update, prepare)
+
         conn = None
         cursor = None
         try:
@@ -43,84 +230,69 @@ class DatabaseManager:
             cursor = conn.cursor()
             cursor.execute(query, param)
             conn.commit()
-
-            if update:
-                return cursor.rowcount
-            if fetch:
-                if fetch_type == 1:
-                    return cursor.fetchone()
-                elif fetch_type == 2:
-                    return cursor.fetchmany()
-                else:
-                    return cursor.fetchall()
+            return self.__read_result(cursor, fetch, fetch_type, update)
 
         except psycopg.IntegrityError as err:
             if conn:
                 conn.rollback()
-            raise HTTPException(
-                status_code=409, detail=f"Integrity error: {err}")
+            raise HTTPException(status_code=409, detail=f"Integrity error: {err}")
         except psycopg.ProgrammingError as err:
             if conn:
                 conn.rollback()
-            raise HTTPException(
-                status_code=400, detail=f"Programming error: {err}")
+            raise HTTPException(status_code=400, detail=f"Programming error: {err}")
         except Exception as err:
             if conn:
                 conn.rollback()
-            raise HTTPException(
-                status_code=500, detail=f"Database error occurred: {str(err)}")
+            raise HTTPException(status_code=500, detail=f"Database error occurred: {str(err)}")
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 conn.close()
 
-    def init_db(self):
-        """Initialize the database with the schema file."""
-        current_directory = os.path.dirname(os.path.abspath(__file__))
-        with open(os.path.join(current_directory, "schema.sql"), "r") as f:
-            schema = f.read()
-        for stmt in schema.split(";"):
-            stmt = stmt.strip()
-            if stmt:
-                self.__execute_query(stmt)
-
-    def insert_user_data(self, user: signUpModel, otp: str, verified: bool) -> bool:
-        """Insert or delete based on verification status."""
-        if not verified:
-            delete_query = "DELETE FROM users WHERE username = %s OR email = %s"
-            self.__execute_query(delete_query, (user.username, user.email))
-        else:
-            insert_query = """
-                INSERT INTO users (username, email, password, otp, createdat)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            self.__execute_query(
-                insert_query,
-                (
-                    user.username,
-                    user.email,
-                    user.password,
-                    otp,
-                    datetime.now(),
-                ),
-            )
-        return True
-
-    def verify_otp(self, username: str) -> dict[str, Any]:
-        """Check and return the OTP for the given username."""
-        query = "SELECT otp, createdat, email FROM users WHERE username = %s"
-        result = self.__execute_query(query, (username,), fetch=True)
-        if result:
-            return result  # Return the first result as a dictionary (RealDictCursor)
-        else:
-            raise HTTPException(status_code=404, detail="User not found!")
-
-    def verified_user(self, username: str) -> bool:
-        """Set the user as verified."""
-        update_query = "UPDATE users SET isverified = %s WHERE username = %s"
-        self.__execute_query(update_query, (True, username))
-        return True
+    def __execute_pooled_query(
+        self,
+        pool: ConnectionPool,
+        query: str,
+        param: Tuple,
+        fetch: bool,
+        fetch_type: int,
+        update: bool,
+        prepare: bool,
+        replica: bool = False,
+    ) -> Any:
+        try:
+            # the pool commits on a clean exit and rolls back if the block raises
+            with pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    # prepared statements live on the connection, so each pooled connection prepares once and reuses it
+                    cursor.execute(query, param, prepare=prepare or None)
+                    return self.__read_result(cursor, fetch, fetch_type, update)
+        except psycopg.IntegrityError as err:
+            raise HTTPException(status_code=409, detail=f"Integrity error: {err}")
+        except psycopg.ProgrammingError as err:
+            raise HTTPException(status_code=400, detail=f"Programming error: {err}")
+        except psycopg.OperationalError as err:
+            # connection failures and pool timeouts on a replica go back to the caller, which retries on the primary
+            if replica:
+                raise
+            if isinstance(err, PoolTimeout):
+                raise HTTPException(status_code=503, detail=f"Database busy, try again later: {err}")
+            raise HTTPException(status_code=500, detail=f"Database error occurred: {str(err)}")
+        except Exception as err:
+            raise HTTPException(status_code=500, detail=f"Database error occurred: {str(err)}")
+
+    @staticmethod
+    def __read_result(cursor, fetch: bool, fetch_type: int, update: bool) -> Any:
+        if update:
+            return cursor.rowcount
+        if fetch:
+            if fetch_type == 1:
+                return cursor.fetchone()
+            elif fetch_type == 2:
+                return cursor.fetchmany()
+            else:
+                return cursor.fetchall()
 
     def user_exists(self, username: str = None, email: str = None):
         """Check if a user exists based on username or email."""
@@ -136,22 +308,49 @@ class DatabaseManager:
             parameters.append(email)
 
         query = "SELECT isverified FROM users WHERE " + " OR ".join(conditions)
-        return self.__execute_query(query, tuple(parameters), fetch=True)
+        return self.__execute_query(query, tuple(parameters), fetch=True, prepare=True, replica=True)
 
     def getPass(self, username: str):
         """Get the password for the given username."""
         query = "SELECT password FROM users WHERE username = %s"
-        result = self.__execute_query(query, (username,), fetch=True)
-        return result['password'] if result else None
+        result = self.__execute_query(query, (username,), fetch=True, replica=True)
+        return result["password"] if result else None
 
     def getAllUsers(self):
         """Get all users."""
         query = "SELECT username, isonline FROM users"
-        data = self.__execute_query(query, fetch=True, fetch_type=3)
+        data = self.__execute_query(query, fetch=True, fetch_type=3, replica=True)
         return [{"username": row["username"], "isOnline": row["isonline"]} for row in data]
 
     def makeCustomQuery(self, query: str, param: Tuple, update=True):
         """Execute custom SQL queries."""
         return self.__execute_query(query, param=param, fetch=True, update=update)
 
-__all__ = ["DatabaseManager"]
+
+_manager: DatabaseManager | None = None
+
+
+def get_db_manager() -> DatabaseManager:
+    """The DatabaseManager shared by every module of the process."""
+    global _manager
+    if _manager is None:
+        _manager = DatabaseManager()
+    return _manager
+
+
+__all__ = [
+    "DatabaseManager",
+    "get_db_manager",
+    "get_db_settings",
+    "get_pool",
+    "close_pool",
+    "get_pool_stats",
+    "query_counter",
+    "primary_pin",
+    "get_replica_set",
+    "peek_replica_set",
+    "choose_replica",
+    "pinned_to_primary",
+    "pin_primary",
+    "close_replica_pools",
+]
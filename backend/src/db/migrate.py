@@ -0,0 +1,73 @@
+import os
+import re
+from typing import List, NamedTuple
+import psycopg
+from src.db.async_database import async_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# any constant works, it only has to be the same for every worker
+MIGRATION_LOCK_ID = 727_001
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+
+def load_migrations() -> List[Migration]:
+    """Migration files named <version>_<name>.sql, in version order."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", filename)
+        if match:
+            migrations.append(Migration(int(match[1]), match[2], os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+async def run_migrations() -> List[int]:
+    """
+    Bring the database up to the newest migration, returns the versions applied.
+
+    An up to date database costs one query. Otherwise the pending files run in
+    one transaction under an advisory lock, so workers starting together
+    apply each migration once. The first migrations use IF NOT EXISTS, which
+    lets databases created from the old schema.sql be adopted as they are.
+    """
+    migrations = load_migrations()
+    latest = migrations[-1].version if migrations else 0
+
+    async with async_connection() as conn:
+        try:
+            cursor = await conn.execute("SELECT max(version) AS version FROM schema_migrations")
+            current = (await cursor.fetchone())["version"] or 0
+        except psycopg.errors.UndefinedTable:
+            current = 0
+        # end the implicit transaction of the check, the migrations get their own
+        await conn.rollback()
+        if current >= latest:
+            return []
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    appliedat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """)
+            # another worker may have migrated while we waited for the lock
+            cursor = await conn.execute("SELECT version FROM schema_migrations")
+            applied = {row["version"] for row in await cursor.fetchall()}
+            pending = [migration for migration in migrations if migration.version not in applied]
+            for migration in pending:
+                with open(migration.path) as f:
+                    # no parameters, so the whole file goes to the server as one multi-statement query
+                    await conn.execute(f.read())
+                await conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (migration.version, migration.name))
+        return [migration.version for migration in pending]
+
+
+__all__ = ["run_migrations", "load_migrations", "Migration"]
@@ -1,4 +1,3 @@
--- schema.sql
 -- Create the Users table
 CREATE TABLE IF NOT EXISTS Users (
     user_id SERIAL PRIMARY KEY,
@@ -11,3 +10,6 @@ CREATE TABLE IF NOT EXISTS Users (
     isonline BOOLEAN DEFAULT FALSE,
     createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Prefix search and keyset pagination of the user directory (LIKE 'prefix%' and ~>~ / ~<~)
+CREATE INDEX IF NOT EXISTS users_username_pattern_idx ON Users (username text_pattern_ops);
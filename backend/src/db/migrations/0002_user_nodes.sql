@@ -0,0 +1,8 @@
+-- Which node (worker/container) each connected user's socket lives on
+CREATE TABLE IF NOT EXISTS user_nodes (
+    username VARCHAR(255) PRIMARY KEY,
+    node_id VARCHAR(255) NOT NULL,
+    updatedat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS user_nodes_node_id_idx ON user_nodes (node_id);
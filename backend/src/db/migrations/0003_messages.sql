@@ -0,0 +1,11 @@
+-- Chat messages, a conversation is the (user_a, user_b) pair with user_a < user_b
+CREATE TABLE IF NOT EXISTS messages (
+    message_id BIGSERIAL PRIMARY KEY,
+    user_a VARCHAR(255) NOT NULL,
+    user_b VARCHAR(255) NOT NULL,
+    sender VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS messages_conversation_createdat_idx ON messages (user_a, user_b, createdat DESC, message_id DESC);
@@ -0,0 +1,9 @@
+-- Messages waiting for an offline receiver, deleted once the receiver acknowledges them
+CREATE TABLE IF NOT EXISTS pending_messages (
+    pending_id BIGSERIAL PRIMARY KEY,
+    receiver VARCHAR(255) NOT NULL,
+    payload TEXT NOT NULL,
+    createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS pending_messages_receiver_idx ON pending_messages (receiver, pending_id);
@@ -0,0 +1,17 @@
+-- Outgoing emails, written in the same statement as the change that triggers them and sent by the outbox dispatcher
+CREATE TABLE IF NOT EXISTS email_outbox (
+    outbox_id BIGSERIAL PRIMARY KEY,
+    dedupe_key VARCHAR(255) NOT NULL UNIQUE,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    html TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimedat TIMESTAMP,
+    createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sentat TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS email_outbox_due_idx ON email_outbox (next_attempt_at) WHERE status IN ('pending', 'sending');
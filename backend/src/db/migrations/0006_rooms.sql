@@ -0,0 +1,16 @@
+-- Group chat rooms and their members
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    createdby VARCHAR(255) NOT NULL,
+    createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS room_members (
+    room_id INTEGER NOT NULL REFERENCES rooms (room_id) ON DELETE CASCADE,
+    username VARCHAR(255) NOT NULL,
+    joinedat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (room_id, username)
+);
+
+CREATE INDEX IF NOT EXISTS room_members_username_idx ON room_members (username);
@@ -0,0 +1,24 @@
+-- Sign-ups waiting for OTP verification, moved into users once verified and purged once expired
+CREATE TABLE IF NOT EXISTS pending_signups (
+    username VARCHAR(255) PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    otp VARCHAR(10) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    expires_at TIMESTAMP NOT NULL,
+    createdat TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS pending_signups_expires_at_idx ON pending_signups (expires_at);
+CREATE INDEX IF NOT EXISTS pending_signups_email_idx ON pending_signups (email);
+
+-- unverified rows move out of users, those already past the 10 minute OTP window are purged on the next run
+INSERT INTO pending_signups (username, email, password, otp, expires_at, createdat)
+SELECT username, email, password, otp, createdat + INTERVAL '10 minutes', createdat
+FROM users WHERE isverified IS NOT TRUE
+ON CONFLICT (username) DO NOTHING;
+
+DELETE FROM users WHERE isverified IS NOT TRUE;
+
+-- users only holds verified accounts, the OTP lives in pending_signups
+ALTER TABLE users ALTER COLUMN otp DROP NOT NULL;
@@ -0,0 +1,3 @@
+-- A user can be connected to several nodes at once, one row per (user, node)
+ALTER TABLE user_nodes DROP CONSTRAINT IF EXISTS user_nodes_pkey;
+ALTER TABLE user_nodes ADD PRIMARY KEY (username, node_id);
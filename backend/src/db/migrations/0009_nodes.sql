@@ -0,0 +1,14 @@
+-- Leases of the running nodes, a node renews its row while it runs and rows past expires_at are purged
+-- together with their user_nodes rows
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id VARCHAR(255) PRIMARY KEY,
+    owner VARCHAR(64) NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS nodes_expires_at_idx ON nodes (expires_at);
+
+-- nodes running from before leases existed get a minute to come back, then their rows are purged
+INSERT INTO nodes (node_id, owner, expires_at)
+SELECT DISTINCT node_id, 'legacy', CURRENT_TIMESTAMP + INTERVAL '1 minute' FROM user_nodes
+ON CONFLICT (node_id) DO NOTHING;
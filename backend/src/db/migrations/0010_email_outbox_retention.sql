@@ -0,0 +1,2 @@
+-- Sent and failed emails are purged once past the outbox retention, along this index
+CREATE INDEX IF NOT EXISTS email_outbox_done_idx ON email_outbox (createdat) WHERE status IN ('sent', 'failed');
@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import threading
+import time
+from typing import List
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+# seconds of replay lag, 0 when every received WAL record has been replayed (an idle primary
+# leaves pg_last_xact_replay_timestamp() behind without the replica being stale) or when the
+# server is not a standby; NULL when it never replayed anything
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - pg_last_xact_replay_timestamp())::float
+    END AS lag
+"""
+
+
+def _lag(row: dict | None) -> float:
+    return float("inf") if row is None or row["lag"] is None else row["lag"]
+
+
+class Replica:
+    """One read replica: its lazily opened pools and health/latency state."""
+
+    __slots__ = (
+        "dsn",
+        "name",
+        "latency",
+        "failures",
+        "ejected_until",
+        "reads",
+        "lag",
+        "lag_checked_until",
+        "pool",
+        "async_pool",
+        "_lock",
+        "_async_lock",
+    )
+
+    def __init__(self, dsn: str, name: str):
+        self.dsn = dsn
+        self.name = name
+        # EWMA of query time in seconds, 0 until measured so new replicas get tried first
+        self.latency = 0.0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.reads = 0
+        # replay lag in seconds as last measured, and when it has to be measured again
+        self.lag = 0.0
+        self.lag_checked_until = 0.0
+        self.pool: ConnectionPool | None = None
+        self.async_pool: AsyncConnectionPool | None = None
+        # concurrent first uses (threadpool routes, tasks awaiting the open) must not each open a pool
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+
+    def get_pool(self, pool_config: dict) -> ConnectionPool:
+        if self.pool is None:
+            with self._lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        conninfo=self.dsn,
+                        kwargs={"row_factory": dict_row},
+                        **pool_config,
+                        check=ConnectionPool.check_connection,
+                        name=f"chatcraze-{self.name}",
+                        open=True,
+                    )
+        return self.pool
+
+    async def get_async_pool(self, pool_config: dict) -> AsyncConnectionPool:
+        if self.async_pool is None:
+            async with self._async_lock:
+                if self.async_pool is None:
+                    pool = AsyncConnectionPool(
+                        conninfo=self.dsn,
+                        kwargs={"row_factory": dict_row},
+                        **pool_config,
+                        check=AsyncConnectionPool.check_connection,
+                        name=f"chatcraze-async-{self.name}",
+                        open=False,
+                    )
+                    await pool.open()
+                    self.async_pool = pool
+        return self.async_pool
+
+    def measure_lag(self, pool: ConnectionPool) -> float:
+        with pool.connection() as conn:
+            return _lag(conn.execute(LAG_QUERY).fetchone())
+
+    async def measure_lag_async(self, pool: AsyncConnectionPool) -> float:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(LAG_QUERY)
+            return _lag(await cursor.fetchone())
+
+
+class ReplicaSet:
+    """
+    Picks the replica a read-only query goes to, shared by DatabaseManager and
+    AsyncDatabaseManager so both see the same health state.
+
+    `strategy` is "round_robin" or "least_latency" (lowest EWMA query time).
+    A replica failing `eject_after` times in a row (connection errors, pool
+    timeouts) is skipped for `cooldown` seconds; after that one more failure
+    ejects it again and one success brings it back. With no healthy replica
+    `choose()` returns None and reads go to the primary.
+
+    With `max_lag` set, a replica's replay lag is measured before its first
+    read, every `lag_check_interval` seconds after that and again when it
+    comes back from an ejection. A replica more than `max_lag` seconds behind
+    is ejected like a failing one.
+    """
+
+    def __init__(
+        self,
+        dsns: List[str],
+        strategy: str = "round_robin",
+        eject_after: int = 3,
+        cooldown: float = 30.0,
+        alpha: float = 0.2,
+        pool_config: dict | None = None,
+        max_lag: float = 0.0,
+        lag_check_interval: float = 5.0,
+    ):
+        if strategy not in ("round_robin", "least_latency"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.replicas = [Replica(dsn, f"replica{i}") for i, dsn in enumerate(dsns)]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.pool_config = pool_config or {}
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.stats = {"replica_reads": 0, "primary_fallbacks": 0, "pinned_reads": 0, "ejections": 0, "lag_ejections": 0}
+        self._counter = itertools.count()
+
+    def choose(self) -> Replica | None:
+        now = time.monotonic()
+        healthy = [replica for replica in self.replicas if replica.ejected_until <= now]
+        if not healthy:
+            return None
+        if self.strategy == "least_latency":
+            return min(healthy, key=lambda replica: replica.latency)
+        return healthy[next(self._counter) % len(healthy)]
+
+    def record_success(self, replica: Replica, elapsed: float):
+        replica.latency = elapsed if replica.latency == 0 else self.alpha * elapsed + (1 - self.alpha) * replica.latency
+        replica.failures = 0
+        replica.reads += 1
+        self.stats["replica_reads"] += 1
+
+    def record_failure(self, replica: Replica):
+        replica.failures += 1
+        self.stats["primary_fallbacks"] += 1
+        if replica.failures >= self.eject_after:
+            self._eject(replica)
+            self.stats["ejections"] += 1
+
+    def lag_due(self, replica: Replica) -> bool:
+        """True if the replica's lag must be measured (`record_lag`) before it serves a read."""
+        return self.max_lag > 0 and replica.lag_checked_until <= time.monotonic()
+
+    def record_lag(self, replica: Replica, lag: float) -> bool:
+        """Store a lag measurement, False (and the replica ejected) if it is too far behind."""
+        replica.lag = lag
+        replica.lag_checked_until = time.monotonic() + self.lag_check_interval
+        if lag > self.max_lag:
+            self._eject(replica)
+            self.stats["lag_ejections"] += 1
+            self.stats["primary_fallbacks"] += 1
+            return False
+        return True
+
+    def _eject(self, replica: Replica):
+        replica.ejected_until = time.monotonic() + self.cooldown
+        # measured again before the first read after the cooldown
+        replica.lag_checked_until = 0.0
+
+    def report(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "name": replica.name,
+                "healthy": replica.ejected_until <= now,
+                "latency_ms": round(replica.latency * 1000, 3),
+                # None until a replica that never replayed anything catches up
+                "lag_s": round(replica.lag, 3) if replica.lag != float("inf") else None,
+                "failures": replica.failures,
+                "reads": replica.reads,
+            }
+            for replica in self.replicas
+        ]
+
+    def close(self):
+        for replica in self.replicas:
+            if replica.pool is not None:
+                replica.pool.close()
+                replica.pool = None
+
+    async def close_async(self):
+        for replica in self.replicas:
+            if replica.async_pool is not None:
+                await replica.async_pool.close()
+                replica.async_pool = None
+
+
+__all__ = ["ReplicaSet", "Replica"]
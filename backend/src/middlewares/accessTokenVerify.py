@@ -0,0 +1,57 @@
+import os
+import time
+import hmac
+import hashlib
+import jwt
+from typing import Annotated
+from fastapi import Cookie, Header, HTTPException
+from src.services.auth_cache import token_cache
+from src.utils.ttl_cache import MISSING
+
+jwt_algorithm = "HS256"
+auth_secret = os.environ["AUTH_SECRET"]
+# operational endpoints (profiler, connection report) are disabled unless ADMIN_TOKEN is set
+admin_token = os.getenv("ADMIN_TOKEN")
+
+
+def decode_access_token(token: str) -> dict:
+    """Decode and validate a JWT, reusing the result for repeated tokens until they expire."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is MISSING:
+        # raises jwt.ExpiredSignatureError / jwt.PyJWTError, failures are never cached
+        payload = jwt.decode(token, auth_secret, algorithms=[jwt_algorithm])
+        exp = payload.get("exp")
+        token_cache.set(key, payload, expires_in=exp - time.time() if exp else None)
+    return payload
+
+
+def get_current_username(
+    token: Annotated[str | None, Header()] = None,
+    accessToken: Annotated[str | None, Cookie()] = None,
+) -> str:
+    """Dependency for protected routes, returns the username from the `token` header or the accessToken cookie."""
+    access_token = token or accessToken
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Access token is missing.")
+
+    try:
+        payload = decode_access_token(access_token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired.")
+    except jwt.PyJWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
+
+    username = payload.get("username")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Invalid token: No username found.")
+    return username
+
+
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None):
+    """Dependency for operational endpoints, checks the X-Admin-Token header against ADMIN_TOKEN."""
+    if not admin_token or not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+__all__ = ["get_current_username", "require_admin", "decode_access_token", "auth_secret", "jwt_algorithm"]
@@ -17,4 +17,13 @@ class verifyModel(BaseModel):
     otp: str
 
 
-__all__ = ["signUpModel", "loginModel", "verifyModel"]
+class roomModel(BaseModel):
+    name: str
+    members: list[str] = []
+
+
+class roomMemberModel(BaseModel):
+    username: str
+
+
+__all__ = ["signUpModel", "loginModel", "verifyModel", "roomModel", "roomMemberModel"]
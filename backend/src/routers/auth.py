@@ -2,8 +2,6 @@ import os
 import jwt
 from datetime import datetime, timedelta
 from typing import Annotated
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
 from fastapi import (
     APIRouter,
     HTTPException,
@@ -15,28 +13,56 @@ from fastapi import (
 from fastapi_login import LoginManager, exceptions
 from fastapi.security import OAuth2PasswordRequestForm
 from src.utils.ApiResponse import Apiresponse
-from src.utils.email import send_mail
+from src.utils.email import create_email_provider
 from src.utils.otp_gen import generate_otp
 from src.utils.email_temp import (
     create_otp_mail_template,
     create_verified_mail_template,
 )
 from src.model.req_body_model import signUpModel, verifyModel
-from src.db.database import DatabaseManager
+from src.db.database import get_db_manager
+from src.db.async_database import get_async_db_manager
+from src.services.password_hashing import get_password_hasher
+from src.services.email_outbox import EmailOutbox
+from src.services.pending_signups import PendingSignups
 from src.utils.manage_cookies import manage_cookie
+from src.middlewares.accessTokenVerify import auth_secret, jwt_algorithm, decode_access_token
+from src.services.auth_cache import user_cache
 
 router = APIRouter(prefix="/v1", tags=["API"])
 
-# jwt usable variables
-jwt_algorithm = "HS256"
-auth_secret = os.environ["AUTH_SECRET"]
+db_manager = get_db_manager()
+async_db_manager = get_async_db_manager()
+loginManager = LoginManager(auth_secret, "/api/v1/login", use_cookie=True, use_header=True)
+
+email_outbox = EmailOutbox(
+    async_db_manager,
+    create_email_provider(),
+    concurrency=int(os.getenv("EMAIL_CONCURRENCY", "4")),
+    max_attempts=int(os.getenv("EMAIL_MAX_ATTEMPTS", "8")),
+    base_delay=float(os.getenv("EMAIL_RETRY_DELAY", "5")),
+    retention=float(os.getenv("EMAIL_RETENTION", "86400")),
+    purge_interval=float(os.getenv("EMAIL_PURGE_INTERVAL", "300")),
+    purge_batch=int(os.getenv("EMAIL_PURGE_BATCH", "1000")),
+)
+
+pending_signups = PendingSignups(
+    async_db_manager,
+    ttl=float(os.getenv("SIGNUP_OTP_TTL", "600")),
+    max_attempts=int(os.getenv("VERIFY_MAX_ATTEMPTS", "5")),
+    purge_interval=float(os.getenv("SIGNUP_PURGE_INTERVAL", "300")),
+    purge_batch=int(os.getenv("SIGNUP_PURGE_BATCH", "1000")),
+)
 
-db_manager = DatabaseManager()
-loginManager = LoginManager(
-    auth_secret, "/api/v1/login", use_cookie=True, use_header=True)
 
-# this variable is being used globally for hashing and verifying as ph.hash or ph.verify
-ph = PasswordHasher()
+def get_user(username: str):
+    """user_exists for a username, served from the user cache when possible."""
+    user = user_cache.get(username, None)
+    if user is None:
+        user = db_manager.user_exists(username)
+        if user:
+            user_cache.set(username, user)
+    return user
 
 
 @router.get("/hs", status_code=200)
@@ -46,9 +72,9 @@ def healthCheck():
 
 # route to check if username exist or not
 @router.get("/checkUsername", status_code=200)
-def checkUsername(username: str = Query(..., min_length=3, max_length=50)):
-    isUsernameExist = db_manager.user_exists(username)
-    if isUsernameExist:
+async def checkUsername(username: str = Query(..., min_length=3, max_length=50)):
+    # a sign-up waiting for verification holds its username until it expires
+    if await async_db_manager.usernameTaken(username):
         return Apiresponse(statusCode=409, message="username Already taken!")
 
     return Apiresponse(statusCode=200, message="Username Available")
@@ -56,94 +82,106 @@ def checkUsername(username: str = Query(..., min_length=3, max_length=50)):
 
 # Route to register a new user
 @router.post("/signUp", status_code=201)
-def create_user_account(user: signUpModel):
+async def create_user_account(user: signUpModel):
     # Check if the email exists
-    isEmailExist = db_manager.user_exists(email=user.email)
-    if isEmailExist:
-        raise HTTPException(
-            status_code=409, detail="A user with this email ID is already registered.")
-
-    # Common logic for sending OTP and inserting user data
-    def send_otp_and_create_user(verified_status: bool):
-        hashed_pass = ph.hash(user.password)
+    if await async_db_manager.emailTaken(user.email):
+        raise HTTPException(status_code=409, detail="A user with this email ID is already registered.")
+
+    # Store the sign-up and queue the OTP mail in one statement, the outbox dispatcher sends it
+    async def queue_otp_and_create_signup():
+        hashed_pass = await get_password_hasher().hash(user.password)
         code = generate_otp()
-        otp_template = create_otp_mail_template(
-            username=user.username, verifycode=code)
-        email_sent = send_mail(
-            email=user.email,
-            username=user.username,
-            verifycode=code,
-            html_template=otp_template,
+        otp_template = create_otp_mail_template(username=user.username, verifycode=code)
+        created = await async_db_manager.insertPendingSignup(
+            user.copy(update={"password": hashed_pass}),
+            otp=code,
+            ttl=timedelta(seconds=pending_signups.ttl),
+            email={
+                "dedupe_key": f"otp:{user.username}:{code}",
+                "recipient": user.email,
+                "subject": "Account Verification",
+                "html": otp_template,
+            },
         )
-
-        if email_sent:
-            db_manager.insert_user_data(
-                user.copy(update={"password": hashed_pass}),
-                otp=code,
-                verified=verified_status,
-            )
-            return Apiresponse(201, message="Account created successfully. An OTP has been sent to your email for verification.")
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="An unexpected error occurred while sending OTP mail!",
-            )
+        if not created:
+            raise HTTPException(status_code=409, detail="username Already taken!")
+        pending_signups.clear(user.username)
+        email_outbox.wake()
+        return Apiresponse(201, message="Account created successfully. An OTP has been sent to your email for verification.")
 
     # User does not exist, so we create a new account
-    return send_otp_and_create_user(verified_status=True)
+    return await queue_otp_and_create_signup()
 
 
 # route to verify new users
 @router.post("/verify", status_code=200)
-def verify_user(req: verifyModel):
-    result = db_manager.verify_otp(req.username)
-
-    if req.otp != result["otp"]:
+async def verify_user(req: verifyModel):
+    # out of attempts: answered from memory, no query
+    if pending_signups.blocked(req.username):
+        raise HTTPException(status_code=429, detail="Too many attempts, sign up again.")
+
+    # OTP and expiry check, the move into users and the confirmation mail are one statement
+    result = await async_db_manager.verifyPendingSignup(
+        req.username,
+        req.otp,
+        max_attempts=pending_signups.max_attempts,
+        email={
+            "dedupe_key": f"verified:{req.username}",
+            "subject": "Your Account is Now Verified",
+            "html": create_verified_mail_template(username=req.username),
+        },
+    )
+
+    if not result:
+        raise HTTPException(status_code=404, detail="User not found!")
+
+    if not result["attempts_left"]:
+        pending_signups.record_failure(req.username, None, result["expires_in"])
+        raise HTTPException(status_code=429, detail="Too many attempts, sign up again.")
+
+    if not result["otp_valid"]:
+        pending_signups.record_failure(req.username, result["attempts"], result["expires_in"])
         raise HTTPException(status_code=403, detail="OTP is not valid!")
 
-    if (datetime.now() - datetime.strptime(str(result["createdat"]), "%Y-%m-%d %H:%M:%S.%f")) >= timedelta(minutes=10):
+    if not result["otp_fresh"]:
         raise HTTPException(status_code=403, detail="OTP has expired")
 
-    db_manager.verified_user(username=req.username)
-
-    verify_mail = create_verified_mail_template(username=req.username)
-    send_mail(username=req.username,
-              email=result["email"], html_template=verify_mail, subject="Your Account is Now Verified")
-
+    pending_signups.clear(req.username)
+    email_outbox.wake()
     return Apiresponse(200, message="User verified successfully!")
 
 
 # middleware for protected api's
 @loginManager.user_loader()
 def load_user(username: str):
-    user = db_manager.user_exists(username)
-    return user[0] if user else None
+    return get_user(username)
 
 
 # Route to login verified users
 @router.post("/login", status_code=200)
-def login_user(
+async def login_user(
     response: Response,
     data: OAuth2PasswordRequestForm = Depends(),
 ):
     username = data.username
     password = data.password
-    isUserExist = db_manager.user_exists(username=username)
+    loginState = await async_db_manager.getLoginState(username)
 
-    if not isUserExist:
+    if not loginState:
         raise exceptions.InvalidCredentialsException
 
-    hashedPass = db_manager.getPass(username)
+    hashedPass = loginState["password"]
 
-    try:
-        ph.verify(hashedPass, password)
-    except VerifyMismatchError:
+    if not await get_password_hasher().verify(hashedPass, password):
         raise exceptions.InvalidCredentialsException
 
+    # argon2 parameters were changed since this hash was made, upgrade it while we have the password
+    if get_password_hasher().needs_rehash(hashedPass):
+        await async_db_manager.updatePassword(username, await get_password_hasher().hash(password))
+
     expiration_date = datetime.utcnow() + timedelta(days=7)
 
-    access_token = jwt.encode(
-        {"username": username, "exp": expiration_date}, auth_secret, jwt_algorithm)
+    access_token = jwt.encode({"username": username, "exp": expiration_date}, auth_secret, jwt_algorithm)
 
     manage_cookie(response, "set", value=access_token)
     return Apiresponse(200, data={"accessToken": access_token, "username": username}, message="user loggedIn successfully")
@@ -158,15 +196,14 @@ def verify_access_token(res: Response, token: Annotated[str | None, Header()]):
 
     try:
         # Decode the token
-        payload = jwt.decode(token, auth_secret, algorithms=[jwt_algorithm])
+        payload = decode_access_token(token)
         username = payload.get("username")
 
         if username is None:
-            raise HTTPException(
-                status_code=401, detail="Invalid token: No username found.")
+            raise HTTPException(status_code=401, detail="Invalid token: No username found.")
 
-        # Load user from the database
-        user = db_manager.user_exists(username)
+        # Load user from the cache or the database
+        user = get_user(username)
 
         if not user:
             manage_cookie(res, "delete")
@@ -189,4 +226,4 @@ def logoutUser(res: Response):
     return Apiresponse(statusCode=200, message="Logged out successfully")
 
 
-__all__ = ["router", "loginManager"]
+__all__ = ["router", "loginManager", "email_outbox", "pending_signups"]
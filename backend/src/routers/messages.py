@@ -0,0 +1,67 @@
+import os
+import hashlib
+from datetime import datetime
+from typing import Annotated
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from src.db.async_database import get_async_db_manager
+from src.middlewares.accessTokenVerify import get_current_username
+from src.utils.ApiResponse import Apiresponse
+
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["API"],
+)
+
+db_manager = get_async_db_manager()
+
+default_page_size = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+max_page_size = int(os.getenv("MESSAGE_MAX_PAGE_SIZE", "200"))
+
+
+# cursor format is "<createdat isoformat>_<message_id>" of the oldest message on the previous page
+def parse_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created, message_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def make_cursor(row: dict) -> str:
+    return f"{row['createdat'].isoformat()}_{row['message_id']}"
+
+
+@router.get("/messages/{peer}", status_code=200)
+async def getMessages(
+    peer: str,
+    response: Response,
+    username: Annotated[str, Depends(get_current_username)],
+    before: str | None = None,
+    limit: int = Query(default_page_size, ge=1, le=max_page_size),
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    rows = await db_manager.getConversation(username, peer, parse_cursor(before) if before else None, limit)
+
+    # a page is identified by who asked, where it starts and the ids it holds, unchanged page -> same tag
+    page_key = f"{username}|{peer}|{before}|{limit}|" + ",".join(str(row["message_id"]) for row in rows)
+    etag = '"' + hashlib.sha1(page_key.encode()).hexdigest() + '"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    messages = [
+        {
+            "id": row["message_id"],
+            "from": row["sender"],
+            "to": peer if row["sender"] == username else username,
+            "message": row["body"],
+            "createdAt": row["createdat"].isoformat(),
+        }
+        for row in reversed(rows)
+    ]
+    next_cursor = make_cursor(rows[-1]) if len(rows) == limit else None
+    return Apiresponse(statusCode=200, data={"messages": messages, "nextCursor": next_cursor}, message="Got messages successfully!")
+
+
+__all__ = ["router"]
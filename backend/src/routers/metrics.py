@@ -0,0 +1,157 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from src.db.database import get_pool_stats, peek_replica_set
+from src.db.async_database import get_async_pool_stats
+from src.middlewares.accessTokenVerify import require_admin
+from src.routers.auth import email_outbox, pending_signups
+from src.routers.websocket import manager, message_store, rooms, heartbeat
+from src.services.metrics import CallbackMetric, render_metrics
+from src.services.password_hashing import peek_password_hasher
+from src.services.profiler import profiler
+from src.utils.ApiResponse import Apiresponse
+
+router = APIRouter(tags=["metrics"])
+
+
+def pool_stats():
+    for pool, stats in (("sync", get_pool_stats()), ("async", get_async_pool_stats())):
+        for key in ("pool_size", "pool_available", "requests_waiting"):
+            if key in stats:
+                yield (pool, key), stats[key]
+
+
+def replica_stats():
+    replicas = peek_replica_set()
+    if replicas is None:
+        return
+    for replica in replicas.report():
+        yield (replica["name"], "healthy"), int(replica["healthy"])
+        yield (replica["name"], "latency_ms"), replica["latency_ms"]
+        yield (replica["name"], "reads"), replica["reads"]
+        if replica["lag_s"] is not None:
+            yield (replica["name"], "lag_seconds"), replica["lag_s"]
+
+
+# state that already lives elsewhere is read at scrape time instead of being counted twice
+CallbackMetric("chatcraze_db_pool_connections", "Connection pool state.", "gauge", ["pool", "state"], pool_stats)
+CallbackMetric("chatcraze_db_replica", "Read replica health, latency, replay lag and reads.", "gauge", ["replica", "stat"], replica_stats)
+CallbackMetric(
+    "chatcraze_db_replica_routing_total",
+    "Reads sent to replicas, kept on the primary or failed over.",
+    "counter",
+    ["event"],
+    lambda: [((event,), value) for event, value in replicas.stats.items()] if (replicas := peek_replica_set()) else [],
+)
+CallbackMetric(
+    "chatcraze_ws_active_connections", "Websocket sessions on this process.", "gauge", [], lambda: [((), manager.session_count())]
+)
+CallbackMetric(
+    "chatcraze_ws_connected_users",
+    "Users with at least one websocket session on this process.",
+    "gauge",
+    [],
+    lambda: [((), len(manager.active_connections))],
+)
+CallbackMetric("chatcraze_ws_queued_frames", "Frames waiting in outbound queues.", "gauge", [], lambda: [((), manager.pending_frames())])
+CallbackMetric(
+    "chatcraze_ws_frames_total",
+    "Outbound frames by outcome (queued, sent, dropped, ...).",
+    "counter",
+    ["event"],
+    lambda: [((event,), value) for event, value in manager.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_ws_batching_ratio",
+    "Outbound frames per websocket send, 1.0 means no coalescing.",
+    "gauge",
+    [],
+    lambda: [((), (manager.stats["sent"] + manager.stats["coalesced"]) / (manager.stats["sent"] or 1))],
+)
+CallbackMetric(
+    "chatcraze_message_store",
+    "Message store write-behind state.",
+    "gauge",
+    ["stat"],
+    lambda: [(("buffered",), message_store.buffered)] + [((key,), value) for key, value in message_store.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_email_outbox_total",
+    "Email outbox dispatch counters.",
+    "counter",
+    ["event"],
+    lambda: [((event,), value) for event, value in email_outbox.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_room_fanout_total",
+    "Room messages fanned out and the recipients they were sent to.",
+    "counter",
+    ["stat"],
+    lambda: [((key,), value) for key, value in rooms.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_ws_heartbeat_total",
+    "Heartbeat pings sent and idle sessions reaped.",
+    "counter",
+    ["event"],
+    lambda: [((event,), value) for event, value in heartbeat.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_pending_signups_total",
+    "Expired sign-ups purged and verify calls rejected from memory.",
+    "counter",
+    ["event"],
+    lambda: [((event,), value) for event, value in pending_signups.stats.items()],
+)
+CallbackMetric(
+    "chatcraze_argon2_pending",
+    "Argon2 jobs queued or running.",
+    "gauge",
+    [],
+    lambda: [((), hasher.pending)] if (hasher := peek_password_hasher()) else [],
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# toggle the sampling profiler, starting it clears previous samples
+@router.post("/metrics/profiler", dependencies=[Depends(require_admin)])
+def toggleProfiler(enabled: bool, interval: float = Query(0.01, gt=0.0005, le=1.0)):
+    if enabled:
+        profiler.reset()
+        profiler.start(interval)
+    else:
+        profiler.stop()
+    return Apiresponse(200, data={"running": profiler.running}, message="Profiler updated")
+
+
+# samples in folded-stack format, feed to flamegraph.pl or speedscope
+@router.get("/metrics/profiler", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def profilerReport():
+    return PlainTextResponse(profiler.report())
+
+
+# pool and replica state, kept off the public health check
+@router.get("/metrics/db", dependencies=[Depends(require_admin)])
+def databaseReport():
+    replicas = peek_replica_set()
+    return Apiresponse(
+        200,
+        data={
+            "dbPool": get_pool_stats(),
+            "asyncDbPool": get_async_pool_stats(),
+            "replicas": replicas.report() if replicas else [],
+        },
+        message="Database report",
+    )
+
+
+# connection count, age distribution and approximate memory per connection
+@router.get("/metrics/connections", dependencies=[Depends(require_admin)])
+def connectionReport():
+    return Apiresponse(200, data=heartbeat.report(), message="Connection report")
+
+
+__all__ = ["router"]
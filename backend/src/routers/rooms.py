@@ -0,0 +1,58 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException
+from src.middlewares.accessTokenVerify import get_current_username
+from src.model.req_body_model import roomModel, roomMemberModel
+from src.routers.websocket import rooms
+from src.utils.ApiResponse import Apiresponse
+
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["API"],
+)
+
+
+def room_members(room_id: int, username: str) -> list[str]:
+    """Members of a room the caller belongs to, 404 otherwise so room ids can't be probed."""
+    if not rooms.is_member(room_id, username):
+        raise HTTPException(status_code=404, detail="Room not found.")
+    return sorted(rooms.members_of(room_id))
+
+
+@router.post("/rooms", status_code=201)
+async def createRoom(data: roomModel, username: Annotated[str, Depends(get_current_username)]):
+    room_id = await rooms.create(data.name, username, data.members)
+    return Apiresponse(
+        statusCode=201,
+        data={"roomId": room_id, "name": data.name, "members": room_members(room_id, username)},
+        message="Room created successfully!",
+    )
+
+
+# rooms of the current user, answered from the in-memory member -> rooms index
+@router.get("/rooms", status_code=200)
+async def getRooms(username: Annotated[str, Depends(get_current_username)]):
+    data = [{"roomId": room_id, "members": sorted(rooms.members_of(room_id))} for room_id in sorted(rooms.rooms_for(username))]
+    return Apiresponse(statusCode=200, data=data, message="Got rooms successfully!")
+
+
+@router.post("/rooms/{room_id}/members", status_code=200)
+async def addRoomMember(room_id: int, data: roomMemberModel, username: Annotated[str, Depends(get_current_username)]):
+    room_members(room_id, username)
+    await rooms.add_member(room_id, data.username)
+    return Apiresponse(statusCode=200, data=room_members(room_id, username), message="Member added successfully!")
+
+
+# members can leave, the room creator can remove anyone
+@router.delete("/rooms/{room_id}/members/{member}", status_code=200)
+async def removeRoomMember(room_id: int, member: str, username: Annotated[str, Depends(get_current_username)]):
+    room_members(room_id, username)
+    if member != username:
+        room = await rooms.db_manager.getRoom(room_id)
+        if room is None or room["createdby"] != username:
+            raise HTTPException(status_code=403, detail="Only the room creator can remove other members.")
+    if not await rooms.remove_member(room_id, member):
+        raise HTTPException(status_code=404, detail="User is not a member of this room.")
+    return Apiresponse(statusCode=200, data=sorted(rooms.members_of(room_id)), message="Member removed successfully!")
+
+
+__all__ = ["router"]
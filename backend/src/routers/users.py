@@ -1,5 +1,9 @@
-from src.db.database import DatabaseManager
-from fastapi import APIRouter
+import os
+import json
+from src.db.async_database import get_async_db_manager
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from src.middlewares.accessTokenVerify import require_admin
 from src.utils.ApiResponse import Apiresponse
 
 router = APIRouter(
@@ -7,13 +11,38 @@ router = APIRouter(
     tags=["API"],
 )
 
-db_manager = DatabaseManager()
+db_manager = get_async_db_manager()
 
+default_page_size = int(os.getenv("USER_PAGE_SIZE", "100"))
+max_page_size = int(os.getenv("USER_MAX_PAGE_SIZE", "500"))
 
+
+# `cursor` is the X-Next-Cursor header of the previous page, the header is absent on the last page
 @router.get("/getUsers", status_code=200)
-def getUsers():
-    users = db_manager.getAllUsers()
+async def getUsers(
+    response: Response,
+    cursor: str | None = None,
+    prefix: str | None = Query(None, min_length=1, max_length=50),
+    limit: int = Query(default_page_size, ge=1, le=max_page_size),
+):
+    users = await db_manager.getUsersPage(after=cursor, prefix=prefix, limit=limit)
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = users[-1]["username"]
     return Apiresponse(statusCode=200, data=users, message="Got users successfully!")
 
 
+# bulk export, streamed as one JSON array straight from a server-side cursor
+@router.get("/users/export", status_code=200, dependencies=[Depends(require_admin)])
+async def exportUsers():
+    async def generate():
+        yield "["
+        first = True
+        async for user in db_manager.streamAllUsers():
+            yield ("" if first else ",") + json.dumps(user)
+            first = False
+        yield "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
 __all__ = ["router"]
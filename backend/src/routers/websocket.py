@@ -1,21 +1,93 @@
 from src.services.websocket_connectionManager import ConnectionManager
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-import json
-from src.db.database import DatabaseManager
+import os
+import time
+import orjson
+from src.db.async_database import get_async_db_manager
+from src.services.presence import PresenceRegistry
+from src.services.message_routing import create_routing_backend
+from src.services.message_store import MessageStore
+from src.services.offline_queue import OfflineQueue
+from src.services.presence_feed import PresenceFeed
+from src.services.rooms import RoomRegistry
+from src.services.heartbeat import HeartbeatScheduler
+from src.services.metrics import ws_messages_total
+from src.services.rate_limit import RateLimiter, ALLOW, TOO_LARGE
+from src.utils.wire_protocol import WireCodec, WireError, WireMessage
 
 router = APIRouter(prefix="/ws", tags=["websocket"])
 
 # ws implementation
-manager = ConnectionManager()
-db_manager = DatabaseManager()
+manager = ConnectionManager(
+    create_routing_backend(),
+    max_queue=int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+    overflow_policy=os.getenv("WS_OVERFLOW_POLICY", "drop"),
+    coalesce_delay=float(os.getenv("WS_COALESCE_DELAY_MS", "2")) / 1000,
+    coalesce_max_batch=int(os.getenv("WS_COALESCE_MAX_BATCH", "32")),
+)
+db_manager = get_async_db_manager()
+presence = PresenceRegistry(
+    db_manager,
+    flush_interval=float(os.getenv("PRESENCE_FLUSH_INTERVAL", "1.0")),
+    batch_size=int(os.getenv("PRESENCE_FLUSH_BATCH", "500")),
+)
+message_store = MessageStore(
+    max_batch=int(os.getenv("MESSAGE_FLUSH_BATCH", "500")),
+    flush_interval=float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.2")),
+    max_buffer=int(os.getenv("MESSAGE_BUFFER_SIZE", "10000")),
+)
+offline_queue = OfflineQueue(db_manager, manager, batch_size=int(os.getenv("OFFLINE_BATCH_SIZE", "200")))
+presence_feed = PresenceFeed(
+    manager,
+    tick=float(os.getenv("PRESENCE_FEED_TICK", "0.25")),
+    max_subscriptions=int(os.getenv("PRESENCE_MAX_SUBSCRIPTIONS", "1000")),
+)
+manager.backend.presence_listeners.append(presence_feed.publish)
+rooms = RoomRegistry(db_manager, manager)
+heartbeat = HeartbeatScheduler(
+    manager,
+    ping_interval=float(os.getenv("WS_PING_INTERVAL", "25")),
+    idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT", "60")),
+    tick=float(os.getenv("WS_HEARTBEAT_TICK", "1.0")),
+)
+rate_limiter = RateLimiter(
+    client_rate=float(os.getenv("WS_CLIENT_RATE", "20")),
+    client_burst=float(os.getenv("WS_CLIENT_BURST", "40")),
+    connection_rate=float(os.getenv("WS_CONNECTION_RATE", "10")),
+    connection_burst=float(os.getenv("WS_CONNECTION_BURST", "20")),
+    max_frame_bytes=int(os.getenv("WS_MAX_FRAME_BYTES", "16384")),
+    policy=os.getenv("WS_RATE_LIMIT_POLICY", "throttle"),
+)
+
+codec = WireCodec(
+    compress_threshold=int(os.getenv("WS_COMPRESS_THRESHOLD", "1024")),
+    compress_level=int(os.getenv("WS_COMPRESS_LEVEL", "6")),
+    max_payload=int(os.getenv("WS_MAX_PAYLOAD_BYTES", "65536")),
+)
+
+
+def dumps(frame: dict) -> str:
+    return orjson.dumps(frame).decode()
+
+
+# preallocated counters, the receive loop only increments them
+received_count = ws_messages_total.labels("received")
+forwarded_count = ws_messages_total.labels("forwarded")
+offline_count = ws_messages_total.labels("offline")
 
 
 @router.websocket("/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
-    query = "UPDATE users SET isonline = true WHERE username = %s"
-    db_manager.makeCustomQuery(query=query, param=(client_id,))
+async def websocket_endpoint(websocket: WebSocket, client_id: str, protocol: str = "json", coalesce: bool = False):
+    # ?protocol=binary: chat messages are sent to this session as binary frames (see utils/wire_protocol.py)
+    # ?coalesce=1: frames that pile up within a few ms are sent together as one JSON array
+    session = await manager.connect(websocket, client_id, binary=protocol == "binary", coalesce=coalesce)
+    heartbeat.add(session)
+    presence.set_online(client_id)
+    bucket = rate_limiter.open(client_id)
     try:
+        # the backlog goes to all sessions, a later tab doesn't need it sent again
+        if manager.session_count(client_id) == 1:
+            await offline_queue.deliver(client_id)
         while True:
 
             # data format of message
@@ -27,33 +99,161 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 message: "Hello there!"
             }
             """
-            # data format if reciever is offline
+            # data format if reciever is offline, the message is queued and delivered when they connect
             """
             {
                 type: "offline",
-                message: "user is offline"
+                message: "user is offline",
+                queued: true
+            }
+            """
+            # acknowledgement of a backlog frame
+            """
+            {
+                type: "ack",
+                ackId: 42
+            }
+            """
+            # message to a group chat room, members receive it with the sender added as "from"
+            """
+            {
+                type: "room",
+                room: 7,
+                message: "Hello everyone!"
+            }
+            """
+            # the server pings sessions that have been quiet for a while, any frame keeps the session alive
+            """
+            server: {type: "ping"}    client: {type: "pong"}
+            """
+            # presence updates for contacts, answered with {type: "presence", online: [...], offline: [...]}
+            """
+            {
+                type: "subscribe" | "unsubscribe",
+                users: ["user2", "user3"]
             }
             """
 
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            receiver_name = message["to"]
+            # text frames are JSON, binary frames are message frames from utils/wire_protocol.py
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            data = event["text"] if event.get("text") is not None else event["bytes"]
+            session.last_seen = time.monotonic()
+            received_count.inc()
 
-            isOnline = db_manager.makeCustomQuery(
-                query="SELECT isonline FROM users WHERE username = %s",
-                param=(receiver_name,),
-                update=False,
-            )
+            # limits are checked on the raw frame size in bytes, before paying for parsing
+            size = len(data) if type(data) is bytes else len(data.encode())
+            verdict = rate_limiter.check(client_id, bucket, size)
+            if verdict != ALLOW:
+                if rate_limiter.policy == "disconnect":
+                    await websocket.close(code=1009 if verdict == TOO_LARGE else 1008)
+                    return
+                if verdict == TOO_LARGE:
+                    notice = {"type": "error", "message": f"Message is larger than {rate_limiter.max_frame_bytes} bytes"}
+                    manager.send_session(session, dumps(notice))
+                    continue
+                if rate_limiter.policy == "drop":
+                    continue
+                # throttle: tell the client, stop reading until a token is available, then handle the frame
+                notice = {"type": "rate_limited", "message": "You are sending messages too fast"}
+                manager.send_session(session, dumps(notice))
+                await rate_limiter.wait(client_id, bucket)
 
-            offline = {"type": "offline", "message": f"{receiver_name} is offline"}
-            if isOnline['isonline']:
-                await manager.send_personal_message(data, receiver_name)
+            if type(data) is bytes:
+                # binary message: validated once here, then forwarded and stored as received
+                try:
+                    wire, message = WireMessage.decode_frame(codec, data)
+                except WireError as e:
+                    manager.send_session(session, dumps({"type": "error", "message": f"Bad frame: {e}"}))
+                    continue
             else:
-                await manager.send_personal_message(json.dumps(offline), client_id)
+                # fields are read up front so a malformed frame gets a notice instead of ending the session
+                try:
+                    message = orjson.loads(data)
+                    if not isinstance(message, dict):
+                        raise ValueError("frame is not a JSON object")
+                    message_type = message.get("type")
+                    if message_type == "ack":
+                        ack_id = int(message["ackId"])
+                    elif message_type in ("subscribe", "unsubscribe"):
+                        users = [user for user in message["users"] if isinstance(user, str)]
+                    elif message_type == "room":
+                        room_id = int(message["room"])
+                    elif message_type != "pong" and not isinstance(message["to"], str):
+                        raise ValueError("recipient is not a string")
+                except (orjson.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                    manager.send_session(session, dumps({"type": "error", "message": f"Bad frame: {e}"}))
+                    continue
+
+                if message_type == "pong":
+                    continue
+                if message_type == "ack":
+                    await offline_queue.ack(client_id, ack_id)
+                    continue
+                if message_type == "subscribe":
+                    await presence_feed.subscribe(client_id, users)
+                    continue
+                if message_type == "unsubscribe":
+                    presence_feed.unsubscribe(client_id, users)
+                    continue
+                if message_type == "room":
+                    if not rooms.is_member(room_id, client_id):
+                        notice = {"type": "error", "message": f"You are not a member of room {room_id}"}
+                        manager.send_session(session, dumps(notice))
+                        continue
+                    # serialized once, every member gets the same string
+                    frame = dumps({"type": "room", "room": room_id, "from": client_id, "message": message.get("message", "")})
+                    if manager.backend.max_message_bytes is not None and len(frame.encode()) > manager.backend.max_message_bytes:
+                        notice = {"type": "error", "message": f"Message is larger than {manager.backend.max_message_bytes} bytes"}
+                        manager.send_session(session, dumps(notice))
+                        continue
+                    forwarded_count.inc(await rooms.fanout(room_id, client_id, frame))
+                    continue
+
+                wire = WireMessage(codec, message["to"], text=data)
+
+            receiver_name = wire.to
+
+            # larger messages cannot be handed to another node, reject them whoever the receiver is
+            max_message_bytes = manager.backend.max_message_bytes
+            if max_message_bytes is not None and len(wire.text.encode()) > max_message_bytes:
+                notice = {"type": "error", "message": f"Message is larger than {max_message_bytes} bytes"}
+                manager.send_session(session, dumps(notice))
+                continue
+
+            offline = {"type": "offline", "message": f"{receiver_name} is offline", "queued": True}
+            # a receiver who could not be reached after all (queue full, node gone) gets it from the offline queue
+            if manager.is_online(receiver_name) and await manager.send_personal_message(wire, receiver_name):
+                forwarded_count.inc()
+            else:
+                offline_count.inc()
+                await offline_queue.store(receiver_name, wire.text)
+                manager.send_session(session, dumps(offline))
+
+            message_store.add(client_id, receiver_name, message.get("message", ""))
 
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
-        query = "UPDATE users SET isonline = FALSE WHERE username = %s"
-        db_manager.makeCustomQuery(query=query, param=(client_id,))
+        pass
+    finally:
+        heartbeat.remove(session)
+        await manager.disconnect(session)
+        # presence is per user: only the last session going away makes them offline
+        if not manager.has_sessions(client_id):
+            presence.set_offline(client_id)
+            presence_feed.remove_subscriber(client_id)
+        rate_limiter.close(client_id)
+
 
-__all__ = ["router", "manager"]
+__all__ = [
+    "router",
+    "manager",
+    "presence",
+    "message_store",
+    "offline_queue",
+    "presence_feed",
+    "rate_limiter",
+    "rooms",
+    "heartbeat",
+    "codec",
+]
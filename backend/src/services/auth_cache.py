@@ -0,0 +1,22 @@
+import os
+from src.utils.ttl_cache import TTLCache
+
+# username -> user row of verified lookups ({"isverified": ...}), only existing users are cached
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+
+# sha256(token) -> decoded payload, never kept past the token's `exp`
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+)
+
+
+def invalidate_user(username: str):
+    """Drop cached state for a user whose row was changed or deleted."""
+    user_cache.invalidate(username)
+
+
+__all__ = ["user_cache", "token_cache", "invalidate_user"]
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from typing import List
+from src.db.async_database import AsyncDatabaseManager
+from src.utils.email import EmailProvider, build_mail
+from src.services.metrics import email_send_seconds
+
+send_ok_time = email_send_seconds.labels("ok")
+send_error_time = email_send_seconds.labels("error")
+
+
+class EmailOutbox:
+    """
+    Background dispatcher for the email_outbox table.
+
+    Request handlers only insert outbox rows and call `wake`. The dispatcher
+    claims due rows, sends them in provider sized batches with at most
+    `concurrency` batches in flight, and retries failures with exponential
+    backoff (`base_delay` * 2^(attempt - 1)) until `max_attempts`.
+
+    Every email goes out with its dedupe_key as the provider idempotency key,
+    so a batch sent again after an uncertain outcome (a worker dying or the
+    database failing after the provider accepted it) is not delivered twice.
+
+    Sent and failed rows still hold the rendered email, OTP included. Rows older
+    than `retention` seconds are deleted in batches of `purge_batch` every
+    `purge_interval` seconds between dispatch rounds.
+    """
+
+    def __init__(
+        self,
+        db_manager: AsyncDatabaseManager,
+        provider: EmailProvider,
+        concurrency: int = 4,
+        claim_size: int = 200,
+        max_attempts: int = 8,
+        base_delay: float = 5.0,
+        poll_interval: float = 5.0,
+        lease_seconds: float = 300.0,
+        mark_retries: int = 3,
+        retention: float = 86400.0,
+        purge_interval: float = 300.0,
+        purge_batch: int = 1000,
+    ):
+        self.db_manager = db_manager
+        self.provider = provider
+        self.claim_size = claim_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.mark_retries = mark_retries
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        self._next_purge = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.stats = {"sent": 0, "failed_attempts": 0, "batches": 0, "mark_errors": 0, "purged": 0, "purge_errors": 0}
+
+    async def enqueue(self, dedupe_key: str, recipient: str, subject: str, html: str) -> bool:
+        queued = await self.db_manager.enqueueEmail(dedupe_key, recipient, subject, html)
+        self.wake()
+        return queued
+
+    def wake(self):
+        """Tell the dispatcher new rows are waiting instead of letting it sleep until the next poll."""
+        self._wakeup.set()
+
+    async def dispatch_once(self) -> int:
+        """Claim and send one round of due emails, returns how many were claimed."""
+        rows = await self.db_manager.claimOutboxEmails(self.claim_size, self.lease_seconds, self.max_attempts)
+        if not rows:
+            return 0
+        # batches are cut in outbox_id order so a retried batch gets the same idempotency key
+        rows.sort(key=lambda row: row["outbox_id"])
+        size = self.provider.batch_limit
+        await asyncio.gather(*(self._send(rows[i : i + size]) for i in range(0, len(rows), size)))
+        return len(rows)
+
+    async def _send(self, rows: List[dict]):
+        ids = [row["outbox_id"] for row in rows]
+        emails = [build_mail(row["recipient"], row["html"], row["subject"]) for row in rows]
+        keys = [row["dedupe_key"] for row in rows]
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                # provider clients are blocking HTTP calls
+                await asyncio.to_thread(self.provider.send_batch, emails, keys)
+            except Exception as err:
+                send_error_time.observe(time.perf_counter() - start)
+                self.stats["failed_attempts"] += len(rows)
+                await self.db_manager.markOutboxFailed(ids, str(err), self.base_delay, self.max_attempts)
+                return
+            send_ok_time.observe(time.perf_counter() - start)
+        self.stats["batches"] += 1
+        self.stats["sent"] += len(rows)
+        await self._mark_sent(ids)
+
+    async def _mark_sent(self, ids: List[int]):
+        """
+        Record a batch the provider accepted. Never goes back through markOutboxFailed: if every
+        retry fails the rows are reclaimed after the lease and the idempotency key stops a resend.
+        """
+        for attempt in range(self.mark_retries):
+            try:
+                await self.db_manager.markOutboxSent(ids)
+                return
+            except Exception:
+                self.stats["mark_errors"] += 1
+                if attempt + 1 < self.mark_retries:
+                    await asyncio.sleep(self.base_delay * 2**attempt)
+
+    async def purge(self) -> int:
+        """Delete sent and failed rows past the retention, returns how many were deleted."""
+        purged = 0
+        while True:
+            deleted = await self.db_manager.purgeOutbox(self.purge_batch, self.retention)
+            purged += deleted
+            if deleted < self.purge_batch:
+                break
+        self.stats["purged"] += purged
+        return purged
+
+    async def _run(self):
+        while True:
+            if time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + self.purge_interval
+                try:
+                    await self.purge()
+                except Exception:
+                    self.stats["purge_errors"] += 1
+            try:
+                claimed = await self.dispatch_once()
+            except Exception:
+                claimed = 0
+            # a full claim means more rows are probably due, go again straight away
+            if claimed >= self.claim_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+__all__ = ["EmailOutbox"]
@@ -0,0 +1,145 @@
+import asyncio
+import math
+import sys
+import time
+from typing import List, Set
+from src.services.websocket_connectionManager import ClientConnection, ConnectionManager
+
+PING_FRAME = '{"type": "ping"}'
+
+# upper bounds in seconds of the connection age buckets in the admin report
+AGE_BUCKETS = ((60, "<1m"), (600, "<10m"), (3600, "<1h"), (86400, "<1d"))
+
+
+def process_rss() -> int | None:
+    """Resident set size of this process in bytes, None where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return None
+
+
+class HeartbeatScheduler:
+    """
+    Detects dead websocket sessions with application level ping frames.
+
+    Sessions sit in a timer wheel of `tick` sized slots. One task advances the
+    wheel a slot per tick and only looks at the sessions due in that slot:
+
+    - idle (no inbound frame) for `idle_timeout`: the session is closed (1001)
+    - idle for `ping_interval`: it gets {"type": "ping"}, clients answer {"type": "pong"}
+    - otherwise it is put back in the slot where it will be due again
+
+    Any inbound frame counts as a sign of life, so active clients are never pinged.
+    """
+
+    def __init__(self, manager: ConnectionManager, ping_interval: float = 25.0, idle_timeout: float = 60.0, tick: float = 1.0):
+        self.manager = manager
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.tick = tick
+        self.slots = math.ceil(max(ping_interval, idle_timeout) / tick) + 1
+        self.wheel: List[Set[ClientConnection]] = [set() for _ in range(self.slots)]
+        self.position = 0
+        self.stats = {"pings": 0, "reaped": 0}
+        self._task: asyncio.Task | None = None
+
+    def add(self, connection: ClientConnection):
+        self._schedule(connection, self.ping_interval)
+
+    def remove(self, connection: ClientConnection):
+        if connection.wheel_slot >= 0:
+            self.wheel[connection.wheel_slot].discard(connection)
+            connection.wheel_slot = -1
+
+    def _schedule(self, connection: ClientConnection, delay: float):
+        ticks = min(self.slots - 1, max(1, math.ceil(delay / self.tick)))
+        slot = (self.position + ticks) % self.slots
+        self.wheel[slot].add(connection)
+        connection.wheel_slot = slot
+
+    def advance(self, now: float):
+        """Move the wheel one slot and handle the sessions due in it."""
+        self.position = (self.position + 1) % self.slots
+        due, self.wheel[self.position] = self.wheel[self.position], set()
+        for connection in due:
+            connection.wheel_slot = -1
+            if connection.closing:
+                continue
+            idle = now - connection.last_seen
+            if idle >= self.idle_timeout:
+                self.stats["reaped"] += 1
+                # 1001 "going away"
+                self.manager.close_session(connection, 1001)
+            elif idle >= self.ping_interval:
+                self.stats["pings"] += 1
+                self.manager.send_session(connection, PING_FRAME)
+                self._schedule(connection, min(self.ping_interval, self.idle_timeout - idle))
+            else:
+                self._schedule(connection, self.ping_interval - idle)
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            now = time.monotonic()
+            # catch up on ticks missed while the loop was busy
+            while next_tick <= now:
+                self.advance(now)
+                next_tick += self.tick
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self, sample_size: int = 200) -> dict:
+        """Connection count, age distribution and approximate memory per connection."""
+        now = time.monotonic()
+        ages = {label: 0 for _, label in AGE_BUCKETS}
+        ages[">=1d"] = 0
+        sessions = [connection for group in self.manager.active_connections.values() for connection in group]
+        for connection in sessions:
+            age = now - connection.connected_at
+            label = next((label for bound, label in AGE_BUCKETS if age < bound), ">=1d")
+            ages[label] += 1
+
+        # shallow sizes of the objects each session owns, averaged over a sample
+        sample = sessions[:sample_size]
+        estimated = None
+        if sample:
+            estimated = round(sum(self._session_size(connection) for connection in sample) / len(sample))
+        rss = process_rss()
+        return {
+            "connections": len(sessions),
+            "users": len(self.manager.active_connections),
+            "age": ages,
+            "oldest_seconds": round(max((now - c.connected_at for c in sessions), default=0), 1),
+            "memory": {
+                "estimated_bytes_per_connection": estimated,
+                "rss_bytes": rss,
+                "rss_per_connection_bytes": round(rss / len(sessions)) if rss and sessions else None,
+            },
+            "heartbeat": dict(self.stats),
+        }
+
+    @staticmethod
+    def _session_size(connection: ClientConnection) -> int:
+        queue = connection.queue
+        size = sys.getsizeof(connection) + sys.getsizeof(queue) + sys.getsizeof(queue._queue)
+        size += sum(sys.getsizeof(frame) for frame in queue._queue)
+        size += sys.getsizeof(connection.writer) + sys.getsizeof(connection.websocket)
+        size += sys.getsizeof(connection.websocket.__dict__)
+        return size
+
+
+__all__ = ["HeartbeatScheduler", "PING_FRAME"]
@@ -0,0 +1,699 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+import psycopg
+from psycopg import sql
+from src.db.async_database import async_connection
+from src.db.database import get_db_settings
+
+logger = logging.getLogger(__name__)
+
+# callback used by a backend to hand a message to a socket connected to this process
+DeliverFn = Callable[[str, str], Awaitable[None]]
+# called with (username, online) whenever a user connects to or leaves any node
+PresenceListener = Callable[[str, bool], None]
+# called with (room_id, username, joined) whenever room membership changes on any node
+RoomListener = Callable[[int, str, bool], None]
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+# bytes of a node channel payload kept for the recipient header, the message gets the rest
+NOTIFY_HEADER_RESERVE = 512
+
+# automatic node ids are the hostname plus a slot, "host", "host-1", ... one per process on the host
+MAX_NODE_SLOTS = 64
+
+
+class RoutingBackend(ABC):
+    """
+    Decides where a user is connected and gets messages to them.
+
+    Every backend keeps a user -> nodes map so a message is sent only to the
+    nodes holding the recipient's sessions instead of being broadcast. A user
+    is online while at least one live node holds a session of theirs.
+
+    `max_message_bytes` is the largest message (utf-8 bytes) the backend can
+    hand to another node, None when there is no limit.
+    """
+
+    max_message_bytes: int | None = None
+
+    def __init__(self, node_id: str | None):
+        self.node_id = node_id
+        # a key only exists while its set is non-empty
+        self.user_nodes: Dict[str, Set[str]] = {}
+        self.presence_listeners: List[PresenceListener] = []
+        self.room_listeners: List[RoomListener] = []
+        self._deliver: DeliverFn | None = None
+
+    async def start(self, deliver: DeliverFn):
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    def _node_alive(self, node: str) -> bool:
+        """False for a node known to be gone whose sessions have not been purged yet."""
+        return True
+
+    def locate(self, username: str) -> Set[str]:
+        """Return the nodes the user is connected to, empty if they are offline everywhere."""
+        return {node for node in self.user_nodes.get(username, ()) if self._node_alive(node)}
+
+    def has_remote(self, username: str) -> bool:
+        """True if the user has sessions on a live node other than this one."""
+        return any(node != self.node_id and self._node_alive(node) for node in self.user_nodes.get(username, ()))
+
+    async def register(self, username: str):
+        self._add_node(username, self.node_id)
+
+    async def unregister(self, username: str):
+        self._remove_node(username, self.node_id)
+
+    def _add_node(self, username: str, node: str):
+        nodes = self.user_nodes.get(username)
+        if nodes is None:
+            self.user_nodes[username] = {node}
+            self._emit(username, True)
+        else:
+            nodes.add(node)
+
+    def _remove_node(self, username: str, node: str):
+        nodes = self.user_nodes.get(username)
+        if nodes is None or node not in nodes:
+            return
+        nodes.discard(node)
+        if not nodes:
+            del self.user_nodes[username]
+            self._emit(username, False)
+
+    def _emit(self, username: str, online: bool):
+        for listener in self.presence_listeners:
+            listener(username, online)
+
+    async def room_changed(self, room_id: int, username: str, joined: bool):
+        """Tell every node (this one included) that `username` joined or left `room_id`."""
+        self._emit_room(room_id, username, joined)
+
+    def _emit_room(self, room_id: int, username: str, joined: bool):
+        for listener in self.room_listeners:
+            listener(room_id, username, joined)
+
+    async def route(self, username: str, message: str, skip_local: bool = False) -> bool:
+        """
+        Deliver `message` to every node `username` is connected to, False if it reached none.
+        `skip_local` leaves out this node, for callers that already queued it to the local sessions.
+        """
+        delivered = False
+        for node in self.locate(username):
+            if node == self.node_id:
+                if skip_local:
+                    continue
+                await self._deliver(username, message)
+                delivered = True
+            elif await self._forward(node, username, message):
+                delivered = True
+        return delivered
+
+    async def route_many(self, usernames: Iterable[str], message: str, skip_local: bool = False) -> Set[str]:
+        """
+        Deliver one `message` to many users, returns the users it reached.
+        Remote recipients are grouped by node so each node gets the message once.
+        """
+        by_node: Dict[str, List[str]] = {}
+        for username in usernames:
+            for node in self.locate(username):
+                if not (skip_local and node == self.node_id):
+                    by_node.setdefault(node, []).append(username)
+        reached: Set[str] = set()
+        for node, recipients in by_node.items():
+            if node == self.node_id:
+                for username in recipients:
+                    await self._deliver(username, message)
+                reached.update(recipients)
+            elif await self._forward_many(node, recipients, message):
+                reached.update(recipients)
+        return reached
+
+    @abstractmethod
+    async def _forward(self, node: str, username: str, message: str) -> bool:
+        """Hand `message` for `username` to another node, False if it could not be sent."""
+
+    async def _forward_many(self, node: str, usernames: List[str], message: str) -> bool:
+        return all([await self._forward(node, username, message) for username in usernames])
+
+
+class InProcessBackend(RoutingBackend):
+    """Single process backend, every user is either connected here or offline."""
+
+    async def _forward(self, node: str, username: str, message: str) -> bool:
+        return False
+
+
+class Subscription(ABC):
+    """Notifications of the channels passed to `Broker.listen`, until the connection is lost."""
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (channel, payload) pairs, raises when the connection is lost."""
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class Broker(ABC):
+    """
+    Transport and shared user -> nodes directory behind a BrokerBackend.
+
+    Every node holds a lease it renews while it runs. Sessions of a node whose
+    lease ran out (the process died without cleaning up) are purged by
+    whichever node notices first.
+    """
+
+    @abstractmethod
+    async def listen(self, channels: List[str]) -> Subscription:
+        """Subscribe to `channels`; nothing published after this returns is missed."""
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: str):
+        pass
+
+    @abstractmethod
+    async def claim(self, node_id: str, owner: str, lease: float, force: bool = False) -> bool:
+        """
+        Take the lease of `node_id` if it is free, expired or already ours, and
+        drop any sessions left under that id. `force` takes it regardless.
+        """
+
+    @abstractmethod
+    async def renew(self, node_id: str, owner: str, lease: float) -> bool:
+        """Extend our lease, False if it was lost (expired and purged or claimed by someone else)."""
+
+    @abstractmethod
+    async def release(self, node_id: str, owner: str):
+        """Drop the lease and every session of the node."""
+
+    @abstractmethod
+    async def purge_expired(self) -> List[str]:
+        """Remove nodes whose lease ran out together with their sessions, returns their ids."""
+
+    @abstractmethod
+    async def sessions(self) -> Dict[str, Set[str]]:
+        """username -> nodes, for nodes holding a live lease."""
+
+    @abstractmethod
+    async def add_session(self, username: str, node_id: str):
+        pass
+
+    @abstractmethod
+    async def remove_session(self, username: str, node_id: str):
+        pass
+
+
+class BrokerBackend(RoutingBackend):
+    """
+    Routes between workers/containers through a Broker.
+
+    Each node listens on its own channel plus a shared presence channel. The
+    user -> nodes map is loaded from the broker after subscribing and kept in
+    sync in memory from presence notifications, so routing a message is one
+    dict lookup and one notification per recipient node.
+
+    Every `lease / 3` seconds a node renews its lease, announces itself on the
+    presence channel and purges nodes whose lease expired. A node not heard
+    from for a whole lease is treated as gone straight away, so messages to
+    its users go to the offline queue instead of a channel nobody listens on.
+
+    With no `node_id` a stable one is claimed: the hostname, or the hostname
+    plus the first free slot when several processes share a host.
+    """
+
+    presence_channel = "chatcraze_presence"
+    max_message_bytes = MAX_NOTIFY_PAYLOAD - NOTIFY_HEADER_RESERVE
+
+    def __init__(self, broker: Broker, node_id: str | None = None, lease: float = 30.0, max_reconnect_delay: float = 30.0):
+        super().__init__(node_id)
+        self.broker = broker
+        self.lease = lease
+        self.max_reconnect_delay = max_reconnect_delay
+        # fixed ids are taken over on start, an earlier run of the same node may still hold them
+        self.fixed_id = node_id is not None
+        self.owner = uuid.uuid4().hex
+        self.node_channel = self.channel_for(node_id) if node_id else ""
+        # node -> monotonic time its lease is expected to run out, refreshed by its heartbeats
+        self.node_expiry: Dict[str, float] = {}
+        self._subscription: Subscription | None = None
+        self._listener: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+
+    @staticmethod
+    def channel_for(node_id: str) -> str:
+        return "chatcraze_node_" + hashlib.sha1(node_id.encode()).hexdigest()[:16]
+
+    async def start(self, deliver: DeliverFn):
+        await super().start(deliver)
+        if self.fixed_id:
+            await self.broker.claim(self.node_id, self.owner, self.lease, force=True)
+        else:
+            self.node_id = await self._claim_slot()
+            self.node_channel = self.channel_for(self.node_id)
+        self._subscription = await self._subscribe()
+        self._listener = asyncio.create_task(self._listen())
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def stop(self):
+        for task in (self._heartbeat, self._listener):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._heartbeat = self._listener = None
+        if self._subscription is not None:
+            await self._subscription.close()
+            self._subscription = None
+        await self.broker.release(self.node_id, self.owner)
+        # other nodes drop our users now instead of when the lease would have run out
+        await self._notify(self.presence_channel, {"event": "purge", "node": self.node_id, "nodes": [self.node_id]})
+
+    async def _claim_slot(self) -> str:
+        hostname = socket.gethostname()
+        for slot in range(MAX_NODE_SLOTS):
+            node_id = hostname if slot == 0 else f"{hostname}-{slot}"
+            if await self.broker.claim(node_id, self.owner, self.lease):
+                return node_id
+        raise RuntimeError(f"No free node id slot on {hostname}, set NODE_ID")
+
+    def _node_alive(self, node: str) -> bool:
+        return node == self.node_id or self.node_expiry.get(node, 0.0) > time.monotonic()
+
+    async def _subscribe(self) -> Subscription:
+        """Subscribe, then load the user -> nodes map, so no change in between is missed."""
+        subscription = await self.broker.listen([self.presence_channel, self.node_channel])
+        try:
+            sessions = await self.broker.sessions()
+        except BaseException:
+            await subscription.close()
+            raise
+        expires = time.monotonic() + self.lease
+        # our own sessions are tracked locally, the broker copy may be older
+        local = [username for username, nodes in self.user_nodes.items() if self.node_id in nodes]
+        sessions = {username: nodes - {self.node_id} for username, nodes in sessions.items()}
+        for username in local:
+            sessions.setdefault(username, set()).add(self.node_id)
+        previous, self.user_nodes = self.user_nodes, {username: nodes for username, nodes in sessions.items() if nodes}
+        self.node_expiry = {node: expires for nodes in self.user_nodes.values() for node in nodes}
+        # tell listeners about changes missed while we were not subscribed
+        for username in previous.keys() - self.user_nodes.keys():
+            self._emit(username, False)
+        for username in self.user_nodes.keys() - previous.keys():
+            self._emit(username, True)
+        return subscription
+
+    async def _listen(self):
+        first_delay = delay = min(0.5, self.max_reconnect_delay)
+        while True:
+            try:
+                if self._subscription is None:
+                    self._subscription = await self._subscribe()
+                    logger.info("Routing listener of node %s reconnected", self.node_id)
+                delay = first_delay
+                async for channel, payload in self._subscription:
+                    try:
+                        await self._handle(channel, payload)
+                    except Exception:
+                        logger.exception("Dropped routing notification on %s: %.200s", channel, payload)
+                raise ConnectionError("notification stream ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Routing listener of node %s lost its connection, retrying in %.1fs", self.node_id, delay)
+            if self._subscription is not None:
+                try:
+                    await self._subscription.close()
+                except Exception:
+                    pass
+                self._subscription = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _handle(self, channel: str, payload: str):
+        if channel == self.node_channel:
+            # a JSON header line with the recipients, then the message as sent
+            header, separator, message = payload.partition("\n")
+            if not separator:
+                raise ValueError("node notification without a message")
+            recipients = json.loads(header)["to"]
+            for username in recipients if isinstance(recipients, list) else (recipients,):
+                await self._deliver(username, message)
+            return
+        data = json.loads(payload)
+        node = data["node"]
+        if node == self.node_id:
+            return
+        event = data["event"]
+        if event == "room":
+            self._emit_room(data["room"], data["username"], data["joined"])
+        elif event == "beat":
+            self.node_expiry[node] = time.monotonic() + self.lease
+        elif event == "join":
+            self.node_expiry[node] = time.monotonic() + self.lease
+            self._add_node(data["username"], node)
+        elif event == "leave":
+            self._remove_node(data["username"], node)
+        elif event == "purge":
+            self._drop_nodes(data["nodes"])
+
+    def _drop_nodes(self, nodes: Iterable[str]):
+        # never our own users: a lapsed lease of ours is claimed back on the next heartbeat
+        gone = set(nodes) - {self.node_id}
+        if not gone:
+            return
+        for node in gone:
+            self.node_expiry.pop(node, None)
+        for username in [username for username, held in self.user_nodes.items() if held & gone]:
+            for node in gone & self.user_nodes[username]:
+                self._remove_node(username, node)
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception("Heartbeat of node %s failed", self.node_id)
+
+    async def heartbeat(self):
+        """Renew our lease, announce ourselves and purge nodes whose lease expired."""
+        if not await self.broker.renew(self.node_id, self.owner, self.lease):
+            # paused or cut off for longer than the lease, our sessions may have been purged
+            logger.warning("Lease of node %s was lost, claiming it again", self.node_id)
+            if not await self.broker.claim(self.node_id, self.owner, self.lease, force=self.fixed_id):
+                logger.error("Node id %s was taken by another process", self.node_id)
+                return
+            for username, nodes in list(self.user_nodes.items()):
+                if self.node_id in nodes:
+                    await self.broker.add_session(username, self.node_id)
+                    await self._notify(self.presence_channel, {"event": "join", "node": self.node_id, "username": username})
+        await self._notify(self.presence_channel, {"event": "beat", "node": self.node_id})
+        dead = await self.broker.purge_expired()
+        if dead:
+            self._drop_nodes(dead)
+            await self._notify(self.presence_channel, {"event": "purge", "node": self.node_id, "nodes": dead})
+
+    async def register(self, username: str):
+        await super().register(username)
+        await self.broker.add_session(username, self.node_id)
+        await self._notify(self.presence_channel, {"event": "join", "node": self.node_id, "username": username})
+
+    async def unregister(self, username: str):
+        await super().unregister(username)
+        await self.broker.remove_session(username, self.node_id)
+        await self._notify(self.presence_channel, {"event": "leave", "node": self.node_id, "username": username})
+
+    async def room_changed(self, room_id: int, username: str, joined: bool):
+        await super().room_changed(room_id, username, joined)
+        await self._notify(
+            self.presence_channel,
+            {"event": "room", "node": self.node_id, "room": room_id, "username": username, "joined": joined},
+        )
+
+    async def _forward(self, node: str, username: str, message: str) -> bool:
+        return await self._send_to_node(node, username, message)
+
+    async def _forward_many(self, node: str, usernames: List[str], message: str) -> bool:
+        # recipients are split over several notifications when their names do not fit one header
+        budget = MAX_NOTIFY_PAYLOAD - len(message.encode()) - 1
+        chunk: List[str] = []
+        sent = True
+        for username in usernames:
+            if chunk and len(json.dumps({"to": chunk + [username]}, ensure_ascii=False).encode()) > budget:
+                sent = await self._send_to_node(node, chunk, message) and sent
+                chunk = []
+            chunk.append(username)
+        return await self._send_to_node(node, chunk, message) and sent
+
+    async def _send_to_node(self, node: str, to: str | List[str], message: str) -> bool:
+        # the message is appended as is, escaping it into a JSON string could grow it up to six times
+        data = json.dumps({"to": to}, ensure_ascii=False) + "\n" + message
+        if len(data.encode()) > MAX_NOTIFY_PAYLOAD:
+            return False
+        await self.broker.publish(self.channel_for(node), data)
+        return True
+
+    async def _notify(self, channel: str, payload: dict) -> bool:
+        data = json.dumps(payload, ensure_ascii=False)
+        if len(data.encode()) > MAX_NOTIFY_PAYLOAD:
+            return False
+        await self.broker.publish(channel, data)
+        return True
+
+
+class PostgresSubscription(Subscription):
+
+    def __init__(self, conn: psycopg.AsyncConnection):
+        self.conn = conn
+
+    async def __aiter__(self):
+        async for notify in self.conn.notifies():
+            yield notify.channel, notify.payload
+
+    async def close(self):
+        await self.conn.close()
+
+
+class PostgresBroker(Broker):
+    """
+    Broker on Postgres: LISTEN/NOTIFY for transport, `user_nodes` for the
+    sessions (one row per user and node) and `nodes` for the leases.
+    """
+
+    async def listen(self, channels: List[str]) -> Subscription:
+        conn = await psycopg.AsyncConnection.connect(**get_db_settings()["conn_params"], autocommit=True)
+        try:
+            for channel in channels:
+                await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+        except BaseException:
+            await conn.close()
+            raise
+        return PostgresSubscription(conn)
+
+    async def publish(self, channel: str, payload: str):
+        await self._execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+    async def claim(self, node_id: str, owner: str, lease: float, force: bool = False) -> bool:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                """
+                INSERT INTO nodes (node_id, owner, expires_at)
+                VALUES (%(node)s, %(owner)s, CURRENT_TIMESTAMP + make_interval(secs => %(lease)s))
+                ON CONFLICT (node_id) DO UPDATE SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+                WHERE %(force)s OR nodes.owner = EXCLUDED.owner OR nodes.expires_at <= CURRENT_TIMESTAMP
+                RETURNING node_id
+                """,
+                {"node": node_id, "owner": owner, "lease": lease, "force": force},
+            )
+            if await cursor.fetchone() is None:
+                return False
+            # rows left by an earlier run under this id are stale
+            await conn.execute("DELETE FROM user_nodes WHERE node_id = %s", (node_id,))
+        return True
+
+    async def renew(self, node_id: str, owner: str, lease: float) -> bool:
+        async with async_connection() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE nodes SET expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                WHERE node_id = %s AND owner = %s
+                """,
+                (lease, node_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    async def release(self, node_id: str, owner: str):
+        async with async_connection() as conn:
+            await conn.execute("DELETE FROM user_nodes WHERE node_id = %s", (node_id,))
+            await conn.execute("DELETE FROM nodes WHERE node_id = %s AND owner = %s", (node_id, owner))
+
+    async def purge_expired(self) -> List[str]:
+        # purged users are marked offline unless they are still connected to a live node
+        async with async_connection() as conn:
+            cursor = await conn.execute("""
+                WITH expired AS (
+                    DELETE FROM nodes WHERE expires_at <= CURRENT_TIMESTAMP RETURNING node_id
+                ),
+                gone AS (
+                    DELETE FROM user_nodes WHERE node_id IN (SELECT node_id FROM expired) RETURNING username
+                ),
+                offline AS (
+                    UPDATE users AS u SET isonline = FALSE
+                    WHERE u.username IN (SELECT username FROM gone)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM user_nodes AS n
+                          WHERE n.username = u.username AND n.node_id NOT IN (SELECT node_id FROM expired)
+                      )
+                )
+                SELECT node_id FROM expired
+                """)
+            return [row["node_id"] for row in await cursor.fetchall()]
+
+    async def sessions(self) -> Dict[str, Set[str]]:
+        async with async_connection() as conn:
+            cursor = await conn.execute("""
+                SELECT s.username, s.node_id FROM user_nodes AS s
+                JOIN nodes AS n ON n.node_id = s.node_id
+                WHERE n.expires_at > CURRENT_TIMESTAMP
+                """)
+            sessions: Dict[str, Set[str]] = {}
+            for row in await cursor.fetchall():
+                sessions.setdefault(row["username"], set()).add(row["node_id"])
+            return sessions
+
+    async def add_session(self, username: str, node_id: str):
+        await self._execute(
+            """
+            INSERT INTO user_nodes (username, node_id) VALUES (%s, %s)
+            ON CONFLICT (username, node_id) DO UPDATE SET updatedat = CURRENT_TIMESTAMP
+            """,
+            (username, node_id),
+        )
+
+    async def remove_session(self, username: str, node_id: str):
+        await self._execute("DELETE FROM user_nodes WHERE username = %s AND node_id = %s", (username, node_id))
+
+    @staticmethod
+    async def _execute(query: str, param: tuple):
+        async with async_connection() as conn:
+            await conn.execute(query, param)
+
+
+class LocalSubscription(Subscription):
+
+    def __init__(self, broker: "LocalBroker", channels: List[str]):
+        self.broker = broker
+        self.channels = set(channels)
+        self.queue: asyncio.Queue[Tuple[str, str] | None] = asyncio.Queue()
+
+    async def __aiter__(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                raise ConnectionError("local broker connection dropped")
+            yield item
+
+    async def close(self):
+        self.broker.subscriptions.discard(self)
+
+
+class LocalBroker(Broker):
+    """
+    In-memory broker shared by the backends of one process, the local stand-in
+    for Postgres in tests. `drop_connections` cuts every subscription the way
+    a lost database connection would.
+    """
+
+    def __init__(self):
+        self.subscriptions: Set[LocalSubscription] = set()
+        # node -> (owner, monotonic expiry)
+        self.leases: Dict[str, Tuple[str, float]] = {}
+        self.rows: Set[Tuple[str, str]] = set()
+
+    async def listen(self, channels: List[str]) -> Subscription:
+        subscription = LocalSubscription(self, channels)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    async def publish(self, channel: str, payload: str):
+        for subscription in self.subscriptions:
+            if channel in subscription.channels:
+                subscription.queue.put_nowait((channel, payload))
+
+    def drop_connections(self):
+        for subscription in self.subscriptions:
+            subscription.queue.put_nowait(None)
+        self.subscriptions.clear()
+
+    async def claim(self, node_id: str, owner: str, lease: float, force: bool = False) -> bool:
+        held = self.leases.get(node_id)
+        if held is not None and not force and held[0] != owner and held[1] > time.monotonic():
+            return False
+        self.leases[node_id] = (owner, time.monotonic() + lease)
+        self.rows = {row for row in self.rows if row[1] != node_id}
+        return True
+
+    async def renew(self, node_id: str, owner: str, lease: float) -> bool:
+        held = self.leases.get(node_id)
+        if held is None or held[0] != owner:
+            return False
+        self.leases[node_id] = (owner, time.monotonic() + lease)
+        return True
+
+    async def release(self, node_id: str, owner: str):
+        if self.leases.get(node_id, (None,))[0] == owner:
+            del self.leases[node_id]
+        self.rows = {row for row in self.rows if row[1] != node_id}
+
+    async def purge_expired(self) -> List[str]:
+        now = time.monotonic()
+        expired = [node for node, (_, expires) in self.leases.items() if expires <= now]
+        for node in expired:
+            del self.leases[node]
+        self.rows = {row for row in self.rows if row[1] not in expired}
+        return expired
+
+    async def sessions(self) -> Dict[str, Set[str]]:
+        now = time.monotonic()
+        sessions: Dict[str, Set[str]] = {}
+        for username, node in self.rows:
+            if node in self.leases and self.leases[node][1] > now:
+                sessions.setdefault(username, set()).add(node)
+        return sessions
+
+    async def add_session(self, username: str, node_id: str):
+        self.rows.add((username, node_id))
+
+    async def remove_session(self, username: str, node_id: str):
+        self.rows.discard((username, node_id))
+
+
+class PostgresNotifyBackend(BrokerBackend):
+    """Routes between workers/containers over Postgres LISTEN/NOTIFY."""
+
+    def __init__(self, node_id: str | None = None, lease: float = 30.0):
+        super().__init__(PostgresBroker(), node_id, lease)
+
+
+def create_routing_backend() -> RoutingBackend:
+    """
+    Build the backend selected by MESSAGE_BACKEND ("memory" or "postgres").
+    NODE_ID fixes the node id, by default one is derived from the hostname.
+    """
+    node_id = os.getenv("NODE_ID")
+    backend = os.getenv("MESSAGE_BACKEND", "memory").lower()
+    if backend == "postgres":
+        return PostgresNotifyBackend(node_id, lease=float(os.getenv("NODE_LEASE_SECONDS", "30")))
+    if backend == "memory":
+        return InProcessBackend(node_id or socket.gethostname())
+    raise ValueError(f"Unknown MESSAGE_BACKEND: {backend}")
+
+
+__all__ = [
+    "RoutingBackend",
+    "InProcessBackend",
+    "Broker",
+    "Subscription",
+    "BrokerBackend",
+    "PostgresBroker",
+    "PostgresNotifyBackend",
+    "LocalBroker",
+    "create_routing_backend",
+]
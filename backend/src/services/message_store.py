@@ -0,0 +1,119 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Tuple
+from src.db.async_database import async_connection
+
+
+def conversation_key(user1: str, user2: str) -> Tuple[str, str]:
+    """Order a pair of usernames the way the messages table stores them."""
+    return (user1, user2) if user1 <= user2 else (user2, user1)
+
+
+class MessageStore:
+    """
+    Write-behind persistence for chat messages.
+
+    `add` only appends to an in-memory buffer, delivery never waits on the
+    database. The buffer is written with COPY once it holds `max_batch`
+    messages, and otherwise every `flush_interval` seconds.
+    Only the background loop writes. When the buffer reaches `max_buffer`
+    (the database is down or too slow) new messages are dropped and counted
+    in `stats["dropped"]` instead of growing memory without limit; `add`
+    never waits and never raises into the socket loop.
+    """
+
+    def __init__(self, max_batch: int = 500, flush_interval: float = 0.2, max_buffer: int = 10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[tuple] = []
+        self._oldest: float | None = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.stats = {
+            "flushes": 0,
+            "flushed_messages": 0,
+            "flush_errors": 0,
+            "dropped": 0,
+            "last_flush_size": 0,
+            "last_flush_lag": 0.0,
+            "max_flush_lag": 0.0,
+        }
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def add(self, sender: str, receiver: str, body: str) -> bool:
+        """Buffer a message for the next flush, False if the buffer is full and it was dropped."""
+        if len(self._buffer) >= self.max_buffer:
+            self.stats["dropped"] += 1
+            self._wakeup.set()
+            return False
+        user_a, user_b = conversation_key(sender, receiver)
+        if not self._buffer:
+            self._oldest = time.monotonic()
+        self._buffer.append((user_a, user_b, sender, body, datetime.now()))
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, oldest = self._buffer, self._oldest
+            self._buffer, self._oldest = [], None
+            try:
+                async with async_connection() as conn:
+                    async with conn.cursor() as cursor:
+                        async with cursor.copy("COPY messages (user_a, user_b, sender, body, createdat) FROM STDIN") as copy:
+                            for row in rows:
+                                await copy.write_row(row)
+            except Exception:
+                self.stats["flush_errors"] += 1
+                # keep the failed batch ahead of newer messages, the newest beyond the buffer bound are dropped
+                merged = rows + self._buffer
+                self.stats["dropped"] += max(0, len(merged) - self.max_buffer)
+                self._buffer = merged[: self.max_buffer]
+                self._oldest = oldest
+                raise
+
+            lag = time.monotonic() - oldest
+            self.stats["flushes"] += 1
+            self.stats["flushed_messages"] += len(rows)
+            self.stats["last_flush_size"] = len(rows)
+            self.stats["last_flush_lag"] = lag
+            self.stats["max_flush_lag"] = max(self.stats["max_flush_lag"], lag)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # retried on the next tick
+                pass
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+__all__ = ["MessageStore", "conversation_key"]
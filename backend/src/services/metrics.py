@@ -0,0 +1,232 @@
+import asyncio
+import functools
+import inspect
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# default latency buckets in seconds, 0.5ms .. 10s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric(ABC):
+    """
+    Base of every metric family.
+
+    Children for a label combination are created once by `labels()` and are
+    meant to be kept in a module level variable, so hot paths only do an
+    attribute increment: no lookups, no allocation.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """Value holder for one label combination."""
+
+    def labels(self, *values: str):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {child.value}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Metric read from existing state at scrape time (pool stats, stats dicts,
+    connection counts), so the code that owns the state pays nothing.
+    `callback` returns (label values, value) pairs.
+    """
+
+    def __init__(
+        self, name: str, help: str, type: str, labelnames: Iterable[str], callback: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]
+    ):
+        self.type = type
+        self.callback = callback
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        raise TypeError(f"{self.name} is read from its callback, it has no children to update")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, tuple(str(v) for v in values))} {value}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def instrument_methods(histogram: Histogram):
+    """Class decorator timing every public method into `histogram`, labelled with the class and method name."""
+
+    def decorate(cls):
+        for attr, fn in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.isfunction(fn) or inspect.isasyncgenfunction(fn):
+                continue
+            child = histogram.labels(cls.__name__, attr)
+            setattr(cls, attr, _timed(fn, child))
+        return cls
+
+    return decorate
+
+
+def _timed(fn, child: _HistogramValue):
+    if asyncio.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+# metrics shared across modules
+db_query_seconds = Histogram("chatcraze_db_query_seconds", "Latency of DatabaseManager methods.", ["manager", "method"])
+ws_messages_total = Counter("chatcraze_ws_messages_total", "Websocket messages by outcome.", ["event"])
+ws_send_seconds = Histogram("chatcraze_ws_send_seconds", "Time spent in websocket send calls.")
+ws_batch_size = Histogram(
+    "chatcraze_ws_batch_size", "Frames per websocket send for sessions with coalescing enabled.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+argon2_seconds = Histogram(
+    "chatcraze_argon2_seconds",
+    "Argon2 hash/verify time, including executor queueing.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+email_send_seconds = Histogram("chatcraze_email_send_seconds", "Latency of email provider batch sends.", ["result"])
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "CallbackMetric",
+    "render_metrics",
+    "instrument_methods",
+    "db_query_seconds",
+    "ws_messages_total",
+    "ws_send_seconds",
+    "ws_batch_size",
+    "argon2_seconds",
+    "email_send_seconds",
+]
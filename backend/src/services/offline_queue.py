@@ -0,0 +1,44 @@
+from src.db.async_database import AsyncDatabaseManager
+from src.services.websocket_connectionManager import ConnectionManager
+
+
+class OfflineQueue:
+    """
+    Store-and-forward for receivers who are offline.
+
+    Queued messages are sent on reconnect as a few `backlog` frames of up to
+    `batch_size` messages each:
+
+        {"type": "backlog", "ackId": 42, "messages": [...]}
+
+    The client answers with {"type": "ack", "ackId": 42}, which deletes
+    everything up to that id in one statement. Unacknowledged messages are
+    sent again on the next connect.
+    """
+
+    def __init__(self, db_manager: AsyncDatabaseManager, manager: ConnectionManager, batch_size: int = 200):
+        self.db_manager = db_manager
+        self.manager = manager
+        self.batch_size = batch_size
+
+    async def store(self, receiver: str, payload: str):
+        await self.db_manager.queuePendingMessage(receiver, payload)
+
+    async def deliver(self, client_id: str):
+        last_id = 0
+        while True:
+            rows = await self.db_manager.getPendingMessages(client_id, last_id, self.batch_size)
+            if not rows:
+                return
+            last_id = rows[-1]["pending_id"]
+            # payloads are the JSON frames as received, splice them in instead of decoding and re-encoding
+            frame = f'{{"type": "backlog", "ackId": {last_id}, "messages": [' + ",".join(row["payload"] for row in rows) + "]}"
+            await self.manager.send_personal_message(frame, client_id)
+            if len(rows) < self.batch_size:
+                return
+
+    async def ack(self, client_id: str, ack_id: int):
+        await self.db_manager.ackPendingMessages(client_id, ack_id)
+
+
+__all__ = ["OfflineQueue"]
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from fastapi import HTTPException
+from src.services.metrics import argon2_seconds
+
+hash_time = argon2_seconds.labels("hash")
+verify_time = argon2_seconds.labels("verify")
+
+
+class PasswordHashingService:
+    """
+    Runs Argon2 hashing and verification on a dedicated, separately sized thread pool.
+
+    argon2-cffi releases the GIL while hashing, so threads run in parallel and
+    a login storm only queues up here instead of exhausting the threadpool
+    Starlette shares with every sync endpoint. At most `max_pending` jobs may
+    be queued or running; past that requests fail fast with 503.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        time_cost: int,
+        memory_cost: int,
+        parallelism: int,
+    ):
+        self.hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+        self._pending = 0
+
+    async def _run(self, timer, fn, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Server is busy, please try again.")
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            timer.observe(time.perf_counter() - start)
+            self._pending -= 1
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_time, self.hasher.hash, password)
+
+    async def verify(self, hashed: str, password: str) -> bool:
+        try:
+            return await self._run(verify_time, self.hasher.verify, hashed, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if `hashed` was made with different parameters than the current ones (cheap, no hashing)."""
+        return self.hasher.check_needs_rehash(hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_password_hashing_service() -> PasswordHashingService:
+    """Build the service from the ARGON2_* environment variables, defaults follow argon2-cffi."""
+    workers = int(os.getenv("ARGON2_WORKERS", str(os.cpu_count() or 1)))
+    return PasswordHashingService(
+        workers=workers,
+        max_pending=int(os.getenv("ARGON2_MAX_PENDING", str(workers * 8))),
+        time_cost=int(os.getenv("ARGON2_TIME_COST", "3")),
+        memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "65536")),
+        parallelism=int(os.getenv("ARGON2_PARALLELISM", "4")),
+    )
+
+
+_service: PasswordHashingService | None = None
+
+
+def get_password_hasher() -> PasswordHashingService:
+    """The process wide hashing service, built on the first signup/login instead of at import."""
+    global _service
+    if _service is None:
+        _service = create_password_hashing_service()
+    return _service
+
+
+def peek_password_hasher() -> PasswordHashingService | None:
+    """The service if it has been built, without building it."""
+    return _service
+
+
+def shutdown_password_hasher():
+    global _service
+    if _service is not None:
+        _service.shutdown()
+        _service = None
+
+
+__all__ = [
+    "PasswordHashingService",
+    "create_password_hashing_service",
+    "get_password_hasher",
+    "peek_password_hasher",
+    "shutdown_password_hasher",
+]
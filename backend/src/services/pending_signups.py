@@ -0,0 +1,86 @@
+import asyncio
+from src.db.async_database import AsyncDatabaseManager
+from src.utils.ttl_cache import TTLCache
+
+
+class PendingSignups:
+    """
+    Housekeeping for the pending_signups table.
+
+    Wrong OTPs are counted in the table and mirrored here, so once a username
+    has used up its attempts further /verify calls are rejected from memory
+    without a query. A mirrored count expires with the sign-up it belongs to:
+    the username can only sign up again once that row expired, so a new
+    sign-up handled by another process never inherits an old block. Expired sign-ups are deleted in batches of `purge_batch`
+    every `purge_interval` seconds along the expires_at index.
+    """
+
+    def __init__(
+        self,
+        db_manager: AsyncDatabaseManager,
+        ttl: float = 600.0,
+        max_attempts: int = 5,
+        purge_interval: float = 300.0,
+        purge_batch: int = 1000,
+        max_tracked: int = 100_000,
+    ):
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        # username -> wrong OTPs so far, forgotten when the sign-up expires
+        self.failures = TTLCache(maxsize=max_tracked, ttl=ttl)
+        self.stats = {"purged": 0, "rejected": 0, "purge_errors": 0}
+        self._task: asyncio.Task | None = None
+
+    def blocked(self, username: str) -> bool:
+        """True if the username has no attempts left, counted as a rejection."""
+        if self.failures.get(username, 0) >= self.max_attempts:
+            self.stats["rejected"] += 1
+            return True
+        return False
+
+    def record_failure(self, username: str, attempts: int | None, expires_in: float):
+        """
+        Remember the attempt count the database reported until the sign-up expires in
+        `expires_in` seconds, `None` means all attempts are used.
+        """
+        self.failures.set(username, self.max_attempts if attempts is None else attempts, expires_in=expires_in)
+
+    def clear(self, username: str):
+        self.failures.invalidate(username)
+
+    async def purge(self) -> int:
+        purged = 0
+        while True:
+            deleted = await self.db_manager.purgeExpiredSignups(self.purge_batch)
+            purged += deleted
+            if deleted < self.purge_batch:
+                break
+        self.stats["purged"] += purged
+        return purged
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge()
+            except Exception:
+                self.stats["purge_errors"] += 1
+            await asyncio.sleep(self.purge_interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+__all__ = ["PendingSignups"]
@@ -0,0 +1,105 @@
+import asyncio
+from typing import Dict
+from src.db.async_database import AsyncDatabaseManager
+
+
+class PresenceRegistry:
+    """
+    Write-behind of `users.isonline` for the sessions on this process, who is
+    online right now is answered by the connection manager and routing backend.
+
+    Going offline is only written to the database once no node holds a
+    `user_nodes` row for the user, so closing the last session on one node
+    does not mark a user offline who is still connected to another.
+
+    State changes are written in the background, batched into a single
+    UPDATE every `flush_interval` seconds or as soon as `batch_size` changes
+    are pending.
+    """
+
+    def __init__(self, db_manager: AsyncDatabaseManager, flush_interval: float = 1.0, batch_size: int = 500):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Dict[str, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def set_online(self, username: str):
+        self._queue(username, True)
+
+    def set_offline(self, username: str):
+        self._queue(username, False)
+
+    def _queue(self, username: str, state: bool):
+        # only the latest state per user is kept, so connect/disconnect flapping collapses to one row
+        self._pending[username] = state
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def reconcile(self):
+        """Clear `isonline` flags left behind by a process that died without cleaning up."""
+        # users still mapped to a node whose lease is live are connected elsewhere, leave them alone
+        await self.db_manager.makeCustomQuery(
+            query="""
+                UPDATE users SET isonline = FALSE
+                WHERE isonline AND username NOT IN (
+                    SELECT s.username FROM user_nodes AS s
+                    JOIN nodes AS n ON n.node_id = s.node_id
+                    WHERE n.expires_at > CURRENT_TIMESTAMP
+                )
+            """,
+            param=(),
+        )
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.db_manager.makeCustomQuery(
+                # a user still holding a session on another node stays online
+                query="""
+                    UPDATE users AS u SET isonline = v.isonline
+                    FROM unnest(%s::text[], %s::boolean[]) AS v(username, isonline)
+                    WHERE u.username = v.username
+                      AND (v.isonline OR NOT EXISTS (SELECT 1 FROM user_nodes AS n WHERE n.username = u.username))
+                """,
+                param=(list(pending.keys()), list(pending.values())),
+            )
+        except Exception:
+            # put the batch back without clobbering changes queued while we were writing
+            for username, state in pending.items():
+                self._pending.setdefault(username, state)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # the database is unavailable; the batch was requeued and is retried next tick
+                pass
+
+    async def start(self):
+        await self.reconcile()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+__all__ = ["PresenceRegistry"]
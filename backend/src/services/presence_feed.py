@@ -0,0 +1,114 @@
+import asyncio
+import json
+from typing import Dict, Iterable, Set, Tuple
+from src.services.websocket_connectionManager import ConnectionManager
+
+
+class PresenceFeed:
+    """
+    Pushes online/offline changes to the sockets that subscribed to them.
+
+    Changes are collected for one `tick` and sent as at most one frame per
+    subscriber:
+
+        {"type": "presence", "online": ["bob"], "offline": ["carol"]}
+
+    A user who goes offline and back online within a tick ends where they
+    started and produces no event at all.
+    """
+
+    def __init__(self, manager: ConnectionManager, tick: float = 0.25, max_subscriptions: int = 1000):
+        self.manager = manager
+        self.tick = tick
+        self.max_subscriptions = max_subscriptions
+        # watched user -> subscribers, and subscriber -> watched users
+        self.watchers: Dict[str, Set[str]] = {}
+        self.subscriptions: Dict[str, Set[str]] = {}
+        # user -> (state before this tick, latest state)
+        self._changes: Dict[str, Tuple[bool, bool]] = {}
+        self._task: asyncio.Task | None = None
+
+    async def subscribe(self, subscriber: str, users: Iterable[str]):
+        """Watch `users` and immediately send their current state."""
+        watched = self.subscriptions.setdefault(subscriber, set())
+        added = []
+        for user in users:
+            if len(watched) >= self.max_subscriptions:
+                break
+            if user not in watched:
+                watched.add(user)
+                self.watchers.setdefault(user, set()).add(subscriber)
+                added.append(user)
+        if added:
+            online = [user for user in added if self.manager.is_online(user)]
+            offline = [user for user in added if not self.manager.is_online(user)]
+            await self._send(subscriber, online, offline)
+
+    def unsubscribe(self, subscriber: str, users: Iterable[str]):
+        watched = self.subscriptions.get(subscriber)
+        if not watched:
+            return
+        for user in users:
+            if user in watched:
+                watched.discard(user)
+                self._drop_watcher(user, subscriber)
+
+    def remove_subscriber(self, subscriber: str):
+        for user in self.subscriptions.pop(subscriber, ()):
+            self._drop_watcher(user, subscriber)
+
+    def _drop_watcher(self, user: str, subscriber: str):
+        subscribers = self.watchers.get(user)
+        if subscribers:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.watchers[user]
+
+    def publish(self, username: str, online: bool):
+        """Record a presence change, sent to subscribers on the next tick."""
+        if username not in self.watchers:
+            return
+        before, _ = self._changes.get(username, (not online, online))
+        self._changes[username] = (before, online)
+
+    async def flush(self):
+        if not self._changes:
+            return
+        changes, self._changes = self._changes, {}
+        frames: Dict[str, Tuple[list, list]] = {}
+        for user, (before, after) in changes.items():
+            if before == after:
+                continue
+            for subscriber in self.watchers.get(user, ()):
+                online, offline = frames.setdefault(subscriber, ([], []))
+                (online if after else offline).append(user)
+        for subscriber, (online, offline) in frames.items():
+            await self._send(subscriber, online, offline)
+
+    async def _send(self, subscriber: str, online: list, offline: list):
+        frame = json.dumps({"type": "presence", "online": online, "offline": offline})
+        await self.manager.send_personal_message(frame, subscriber)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+__all__ = ["PresenceFeed"]
@@ -0,0 +1,71 @@
+import sys
+import threading
+from collections import Counter
+from typing import Dict
+
+
+class SamplingProfiler:
+    """
+    Low overhead sampling profiler that can be switched on and off at runtime.
+
+    A background thread records the stack of every thread each `interval`
+    seconds. `report()` returns the samples in the folded-stack format
+    ("frame;frame;frame count") understood by flamegraph.pl and speedscope.
+    Nothing runs while the profiler is stopped.
+    """
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.interval = 0.01
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01):
+        if self.running:
+            return
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames: Dict[int, object] = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples.update(stacks)
+
+    def report(self) -> str:
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+profiler = SamplingProfiler()
+
+__all__ = ["SamplingProfiler", "profiler"]
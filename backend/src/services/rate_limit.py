@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Dict
+from src.services.metrics import Counter
+
+rate_limited_total = Counter(
+    "chatcraze_ws_rate_limited_total", "Inbound websocket frames rejected by the rate limiter.", ["reason", "action"]
+)
+
+# verdicts returned by RateLimiter.check
+ALLOW = 0
+LIMITED = 1
+TOO_LARGE = 2
+
+POLICIES = ("drop", "throttle", "disconnect")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Token bucket limits for inbound websocket frames.
+
+    Each connection has its own bucket and all connections of one client_id
+    share a second one, so opening more sockets does not raise a user's
+    limit. Frames larger than `max_frame_bytes` are rejected from their
+    length alone, before any JSON parsing.
+
+    `policy` decides what happens to an over-limit frame:
+    "drop" discards it, "throttle" tells the client and pauses reading that
+    socket until a token is available (TCP backpressure does the rest) and
+    "disconnect" closes the socket.
+    """
+
+    def __init__(
+        self,
+        client_rate: float,
+        client_burst: float,
+        connection_rate: float,
+        connection_burst: float,
+        max_frame_bytes: int,
+        policy: str = "throttle",
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown rate limit policy: {policy}")
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.connection_rate = connection_rate
+        self.connection_burst = connection_burst
+        self.max_frame_bytes = max_frame_bytes
+        self.policy = policy
+        self._clients: Dict[str, TokenBucket] = {}
+        self._client_refs: Dict[str, int] = {}
+        self._limited = rate_limited_total.labels("rate", policy)
+        self._too_large = rate_limited_total.labels("size", policy)
+
+    def open(self, client_id: str) -> TokenBucket:
+        """Register a new connection of `client_id` and return its connection bucket."""
+        if client_id not in self._clients:
+            self._clients[client_id] = TokenBucket(self.client_rate, self.client_burst)
+        self._client_refs[client_id] = self._client_refs.get(client_id, 0) + 1
+        return TokenBucket(self.connection_rate, self.connection_burst)
+
+    def close(self, client_id: str):
+        refs = self._client_refs.get(client_id, 0) - 1
+        if refs <= 0:
+            self._client_refs.pop(client_id, None)
+            self._clients.pop(client_id, None)
+        else:
+            self._client_refs[client_id] = refs
+
+    def check(self, client_id: str, connection_bucket: TokenBucket, size: int) -> int:
+        if size > self.max_frame_bytes:
+            self._too_large.inc()
+            return TOO_LARGE
+        if not self._take(connection_bucket, self._clients[client_id]):
+            self._limited.inc()
+            return LIMITED
+        return ALLOW
+
+    async def wait(self, client_id: str, connection_bucket: TokenBucket):
+        """Sleep until both buckets have a token, then take it. Used by the "throttle" policy."""
+        client_bucket = self._clients[client_id]
+        while True:
+            await asyncio.sleep(max(connection_bucket.wait_time(), client_bucket.wait_time()))
+            if self._take(connection_bucket, client_bucket):
+                return
+
+    @staticmethod
+    def _take(connection_bucket: TokenBucket, client_bucket: TokenBucket) -> bool:
+        # a token is only spent when both buckets have one, a rejected frame costs neither
+        now = time.monotonic()
+        connection_bucket.refill(now)
+        client_bucket.refill(now)
+        if connection_bucket.tokens < 1 or client_bucket.tokens < 1:
+            return False
+        connection_bucket.tokens -= 1
+        client_bucket.tokens -= 1
+        return True
+
+
+__all__ = ["RateLimiter", "TokenBucket", "ALLOW", "LIMITED", "TOO_LARGE"]
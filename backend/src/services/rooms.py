@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, Set
+from src.db.async_database import AsyncDatabaseManager
+from src.services.websocket_connectionManager import ConnectionManager
+
+
+class RoomRegistry:
+    """
+    Group chat rooms.
+
+    Membership lives in the `room_members` table and is mirrored in memory as
+    room -> members and member -> rooms indexes, loaded once on startup and
+    then updated one (room, user) pair at a time, on every node through the
+    routing backend. Fan-out walks the room's member set only, so its cost
+    depends on the room size and not on how many sockets are connected.
+    """
+
+    def __init__(self, db_manager: AsyncDatabaseManager, manager: ConnectionManager):
+        self.db_manager = db_manager
+        self.manager = manager
+        self.members: Dict[int, Set[str]] = {}
+        self.rooms_of: Dict[str, Set[int]] = {}
+        self.stats = {"fanouts": 0, "fanout_recipients": 0}
+
+    async def start(self):
+        self.members.clear()
+        self.rooms_of.clear()
+        for row in await self.db_manager.getAllRoomMembers():
+            self.apply(row["room_id"], row["username"], True)
+        if self.apply not in self.manager.backend.room_listeners:
+            self.manager.backend.room_listeners.append(self.apply)
+
+    def apply(self, room_id: int, username: str, joined: bool):
+        """Update both indexes for one membership change."""
+        if joined:
+            self.members.setdefault(room_id, set()).add(username)
+            self.rooms_of.setdefault(username, set()).add(room_id)
+            return
+        members = self.members.get(room_id)
+        if members is not None:
+            members.discard(username)
+            if not members:
+                del self.members[room_id]
+        rooms = self.rooms_of.get(username)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self.rooms_of[username]
+
+    def is_member(self, room_id: int, username: str) -> bool:
+        return username in self.members.get(room_id, ())
+
+    def members_of(self, room_id: int) -> Set[str]:
+        return self.members.get(room_id, set())
+
+    def rooms_for(self, username: str) -> Set[int]:
+        return self.rooms_of.get(username, set())
+
+    async def create(self, name: str, creator: str, members: Iterable[str]) -> int:
+        members = {creator, *members}
+        room_id = await self.db_manager.createRoom(name, creator, list(members))
+        for member in members:
+            await self.manager.backend.room_changed(room_id, member, True)
+        return room_id
+
+    async def add_member(self, room_id: int, username: str) -> bool:
+        added = await self.db_manager.addRoomMember(room_id, username)
+        if added:
+            await self.manager.backend.room_changed(room_id, username, True)
+        return added
+
+    async def remove_member(self, room_id: int, username: str) -> bool:
+        removed = await self.db_manager.removeRoomMember(room_id, username)
+        if removed:
+            await self.manager.backend.room_changed(room_id, username, False)
+        return removed
+
+    async def fanout(self, room_id: int, sender: str, frame: str) -> int:
+        """Send the serialized `frame` to every member of the room except the sender."""
+        recipients = [member for member in self.members.get(room_id, ()) if member != sender]
+        self.stats["fanouts"] += 1
+        self.stats["fanout_recipients"] += len(recipients)
+        return await self.manager.send_many(frame, recipients)
+
+
+__all__ = ["RoomRegistry"]
@@ -1,27 +1,255 @@
-from typing import Dict
+import asyncio
+import time
+from typing import Dict, Iterable, Set
 from fastapi import WebSocket
+from src.services.message_routing import RoutingBackend, InProcessBackend
+from src.services.metrics import ws_send_seconds, ws_batch_size
+from src.utils.wire_protocol import WireMessage
+
+send_latency = ws_send_seconds.labels()
+batch_size = ws_batch_size.labels()
+
+
+class ClientConnection:
+    """
+    One session of a user: a connected socket with a bounded outbound queue
+    drained by its own writer task. Slotted, a node holds a lot of these.
+    """
+
+    __slots__ = ("websocket", "client_id", "queue", "writer", "closing", "connected_at", "last_seen", "wheel_slot", "binary", "coalesce")
+
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int, binary: bool = False, coalesce: bool = False):
+        self.websocket = websocket
+        self.client_id = client_id
+        # text frames are str, binary frames bytes
+        self.queue: asyncio.Queue[str | bytes] = asyncio.Queue(maxsize=max_queue)
+        # negotiated binary protocol: chat messages are sent as binary frames
+        self.binary = binary
+        # client accepts JSON arrays of frames, see ConnectionManager._writer
+        self.coalesce = coalesce
+        self.writer: asyncio.Task | None = None
+        self.closing = False
+        # monotonic times, last_seen is bumped by every inbound frame
+        self.connected_at = self.last_seen = time.monotonic()
+        # heartbeat wheel slot this session is scheduled in, -1 when not scheduled
+        self.wheel_slot = -1
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    """
+    Sockets connected to this process, grouped by user.
+
+    A user can have several sessions (tabs, devices) at once. Messages go to
+    all of them, and the user is registered with the routing backend when the
+    first session opens and unregistered when the last one closes.
+    """
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    def __init__(
+        self,
+        backend: RoutingBackend | None = None,
+        max_queue: int = 256,
+        overflow_policy: str = "drop",
+        coalesce_delay: float = 0.002,
+        coalesce_max_batch: int = 32,
+    ):
+        if overflow_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        # username -> sessions, a key only exists while the user has at least one session
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        self.backend = backend or InProcessBackend("local")
+        self.max_queue = max_queue
+        # what to do with a client whose queue is full: "drop" the frame or "disconnect" the client
+        self.overflow_policy = overflow_policy
+        # sessions that opted into coalescing wait up to `coalesce_delay` seconds for more frames,
+        # sending at most `coalesce_max_batch` frames in one array
+        self.coalesce_delay = coalesce_delay
+        self.coalesce_max_batch = coalesce_max_batch
+        # "sent" counts socket sends, "coalesced" the frames that rode along in another frame's send
+        self.stats = {"queued": 0, "sent": 0, "coalesced": 0, "dropped": 0, "slow_disconnects": 0, "send_errors": 0}
+
+    async def start(self):
+        await self.backend.start(self._deliver_local)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    async def connect(self, websocket: WebSocket, client_id: str, binary: bool = False, coalesce: bool = False) -> ClientConnection:
+        """Accept the socket and add it as a session of `client_id`, returns the session."""
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        connection = ClientConnection(websocket, client_id, self.max_queue, binary, coalesce)
+        connection.writer = asyncio.create_task(self._writer(connection))
+        sessions = self.active_connections.get(client_id)
+        if sessions is None:
+            self.active_connections[client_id] = {connection}
+            await self.backend.register(client_id)
+        else:
+            sessions.add(connection)
+        return connection
+
+    async def disconnect(self, connection: ClientConnection) -> bool:
+        """Remove one session, returns True if it was the user's last one on this process."""
+        connection.writer.cancel()
+        sessions = self.active_connections.get(connection.client_id)
+        if sessions is None or connection not in sessions:
+            return False
+        sessions.discard(connection)
+        if sessions:
+            return False
+        del self.active_connections[connection.client_id]
+        await self.backend.unregister(connection.client_id)
+        return True
+
+    def has_sessions(self, client_id: str) -> bool:
+        """True if the user has a session on this process."""
+        return client_id in self.active_connections
+
+    def session_count(self, client_id: str | None = None) -> int:
+        """Sessions of one user, or of every user when `client_id` is None."""
+        if client_id is not None:
+            return len(self.active_connections.get(client_id, ()))
+        return sum(len(sessions) for sessions in self.active_connections.values())
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+    def is_online(self, client_id: str) -> bool:
+        """True if the user is connected to any node."""
+        return bool(self.backend.locate(client_id))
 
-    async def send_personal_message(self, message: str, client_id: str):
-        websocket = self.active_connections.get(client_id)
-        if websocket:
-            await websocket.send_text(message)
+    async def send_personal_message(self, message: str | WireMessage, client_id: str) -> bool:
+        sessions = self.active_connections.get(client_id)
+        delivered = bool(sessions) and self._enqueue_all(sessions, message) > 0
+        if self.backend.has_remote(client_id):
+            # other nodes get the text form, notify payloads are text
+            text = message.text if isinstance(message, WireMessage) else message
+            delivered = await self.backend.route(client_id, text, skip_local=True) or delivered
+        return delivered
+
+    async def send_many(self, message: str | WireMessage, client_ids: Iterable[str]) -> int:
+        """
+        Send one already serialized frame to several users, returns how many it reached.
+        The same string is put on every local queue; users with sessions on other nodes are routed in one go.
+        """
+        reached = set()
+        remote = []
+        for client_id in client_ids:
+            sessions = self.active_connections.get(client_id)
+            if sessions and self._enqueue_all(sessions, message) > 0:
+                reached.add(client_id)
+            if self.backend.has_remote(client_id):
+                remote.append(client_id)
+        if remote:
+            text = message.text if isinstance(message, WireMessage) else message
+            reached |= await self.backend.route_many(remote, text, skip_local=True)
+        return len(reached)
+
+    async def _deliver_local(self, client_id: str, message: str):
+        sessions = self.active_connections.get(client_id)
+        if sessions:
+            self._enqueue_all(sessions, message)
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections.values():
-            await connection.send_text(message)
+        # enqueue only, each writer sends at its own pace so a slow client delays nobody else
+        for sessions in list(self.active_connections.values()):
+            self._enqueue_all(sessions, message)
+
+    def pending_frames(self) -> int:
+        """Frames currently waiting in outbound queues."""
+        return sum(connection.queue.qsize() for sessions in self.active_connections.values() for connection in sessions)
+
+    def send_session(self, connection: ClientConnection, message: str | WireMessage) -> bool:
+        """Queue a frame for one session only."""
+        return self._enqueue(connection, message)
+
+    def close_session(self, connection: ClientConnection, code: int):
+        """
+        Stop writing to a session and close its socket in the background.
+        The receive loop sees the disconnect and cleans up.
+        """
+        connection.closing = True
+        connection.writer.cancel()
+        asyncio.create_task(self._close(connection.websocket, code))
+
+    def _enqueue_all(self, sessions: Set[ClientConnection], message: str | WireMessage) -> int:
+        # every session has its own queue and writer, so they are sent to in parallel
+        return sum(self._enqueue(connection, message) for connection in sessions)
+
+    def _enqueue(self, connection: ClientConnection, message: str | WireMessage) -> bool:
+        if connection.closing:
+            return False
+        if isinstance(message, WireMessage):
+            # the form is built once per message and shared by every session that wants it
+            message = message.raw if connection.binary else message.text
+        try:
+            connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if self.overflow_policy == "disconnect":
+                self._disconnect_slow(connection)
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def _disconnect_slow(self, connection: ClientConnection):
+        self.stats["slow_disconnects"] += 1
+        # 1013 "try again later"
+        self.close_session(connection, 1013)
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _writer(self, connection: ClientConnection):
+        queue = connection.queue
+        carry: str | bytes | None = None
+        while True:
+            if carry is None:
+                message = await queue.get()
+            else:
+                message, carry = carry, None
+            if connection.coalesce and type(message) is str:
+                message, carry = await self._coalesce(queue, message)
+            start = time.perf_counter()
+            try:
+                if type(message) is bytes:
+                    await connection.websocket.send_bytes(message)
+                else:
+                    await connection.websocket.send_text(message)
+            except Exception:
+                # dead socket: stop writing, the receive loop will get the disconnect
+                self.stats["send_errors"] += 1
+                return
+            send_latency.observe(time.perf_counter() - start)
+            self.stats["sent"] += 1
+
+    async def _coalesce(self, queue: asyncio.Queue, first: str) -> tuple[str, bytes | None]:
+        """
+        Collect the text frames queued right behind `first`, waiting one
+        `coalesce_delay` for more if the queue runs dry. Several frames are sent
+        as one JSON array; a lone frame is sent unchanged. A binary frame ends
+        the batch and is returned to be sent next.
+        """
+        batch = [first]
+        waited = False
+        while len(batch) < self.coalesce_max_batch:
+            if queue.empty():
+                if waited or self.coalesce_delay <= 0:
+                    break
+                waited = True
+                await asyncio.sleep(self.coalesce_delay)
+                continue
+            message = queue.get_nowait()
+            if type(message) is bytes:
+                return self._join(batch), message
+            batch.append(message)
+        return self._join(batch), None
+
+    def _join(self, batch: list) -> str:
+        batch_size.observe(len(batch))
+        if len(batch) == 1:
+            return batch[0]
+        self.stats["coalesced"] += len(batch) - 1
+        return "[" + ",".join(batch) + "]"
 
 
-__all__ = ["ConnectionManager"]
+__all__ = ["ConnectionManager", "ClientConnection"]
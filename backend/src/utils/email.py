@@ -1,29 +1,116 @@
+import hashlib
 import os
-import resend
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 
-load_dotenv()
+sender_address = "chatcraze <chatcraze@akashtwt.tech>"
 
+# SendParams, a plain dict
+SendParams = Dict[str, Any]
 
-resend.api_key = os.environ["RESEND_API"]
+_resend = None
 
 
-def send_mail(
-    email: str,
-    username: str,
-    html_template: str,
-    verifycode: str = None,
-    subject: str = "Account Verification",
-):
+def get_resend():
+    """
+    The resend module with its API key set. Imported on first use: it pulls in
+    `requests`, which is a large share of the app's import time.
+    """
+    global _resend
+    if _resend is None:
+        import resend
 
-    params: resend.Emails.SendParams = {
-        "from": "chatcraze <chatcraze@akashtwt.tech>",
+        load_dotenv()
+        resend.api_key = os.environ["RESEND_API"]
+        _resend = resend
+    return _resend
+
+
+class EmailProvider(ABC):
+    """
+    Sends already rendered emails, `send_batch` raises if the provider rejected the batch.
+
+    `idempotency_keys` has one key per email. A provider that supports it uses
+    them so a batch sent again after an uncertain outcome is not delivered twice.
+    """
+
+    # largest number of emails accepted by one send_batch call
+    batch_limit = 1
+
+    @abstractmethod
+    def send_batch(self, emails: List[SendParams], idempotency_keys: List[str]):
+        pass
+
+
+class ResendProvider(EmailProvider):
+    batch_limit = 100
+
+    def send_batch(self, emails: List[SendParams], idempotency_keys: List[str]):
+        # the resend SDK (2.4) cannot set the Idempotency-Key header, so the API is called directly
+        import requests
+
+        resend = get_resend()
+        if len(emails) == 1:
+            path, body, key = "/emails", emails[0], idempotency_keys[0]
+        else:
+            # one key covers the whole batch: the rows of a failed batch fall due together and are
+            # claimed in outbox_id order, so a retry normally carries the same key
+            path, body = "/emails/batch", emails
+            key = "batch-" + hashlib.sha256("\n".join(idempotency_keys).encode()).hexdigest()
+        response = requests.post(
+            f"{resend.api_url}{path}",
+            json=body,
+            headers={"Authorization": f"Bearer {resend.api_key}", "Idempotency-Key": key},
+            timeout=30,
+        )
+        response.raise_for_status()
+
+
+class FakeEmailProvider(EmailProvider):
+    """Keeps emails in memory instead of sending them, for local runs and tests."""
+
+    batch_limit = 100
+
+    def __init__(self, fail: bool = False):
+        self.sent: List[SendParams] = []
+        self.fail = fail
+        # like the real API, a key seen before is accepted without sending again
+        self.seen_keys: set[str] = set()
+
+    def send_batch(self, emails: List[SendParams], idempotency_keys: List[str]):
+        if self.fail:
+            raise RuntimeError("fake provider failure")
+        for email, key in zip(emails, idempotency_keys):
+            if key not in self.seen_keys:
+                self.seen_keys.add(key)
+                self.sent.append(email)
+
+
+def create_email_provider() -> EmailProvider:
+    """Provider selected by EMAIL_PROVIDER ("resend" or "fake")."""
+    provider = os.getenv("EMAIL_PROVIDER", "resend").lower()
+    if provider == "fake":
+        return FakeEmailProvider()
+    if provider == "resend":
+        return ResendProvider()
+    raise ValueError(f"Unknown EMAIL_PROVIDER: {provider}")
+
+
+def build_mail(email: str, html_template: str, subject: str = "Account Verification") -> SendParams:
+    return {
+        "from": sender_address,
         "to": [email],
         "subject": subject,
         "html": html_template,
     }
-    email: resend.Email = resend.Emails.send(params)
-    return email
 
 
-__all__ = ["send_mail"]
+__all__ = [
+    "build_mail",
+    "EmailProvider",
+    "ResendProvider",
+    "FakeEmailProvider",
+    "create_email_provider",
+    "get_resend",
+]
@@ -0,0 +1,129 @@
+import zlib
+import orjson
+
+# binary message frame, sent by clients that connect with ?protocol=binary:
+#
+#   byte 0      flags, FLAG_DEFLATE set when the payload is zlib compressed
+#   bytes 1-2   length of the recipient username, big endian
+#   ...         recipient username, utf-8
+#   ...         payload: the same JSON document the text protocol sends
+#
+# frames from clients are validated once on ingest (WireMessage.decode_frame: the payload must be a
+# JSON object addressed to the header's recipient), then forwarded and stored unchanged
+FLAG_DEFLATE = 0x01
+HEADER_SIZE = 3
+
+
+class WireError(ValueError):
+    pass
+
+
+class WireCodec:
+    """
+    Encodes and decodes binary message frames, compressing payloads of `compress_threshold` bytes or more.
+    Payloads are never inflated past `max_payload` bytes, so a small compressed frame cannot expand without bound.
+    """
+
+    def __init__(self, compress_threshold: int = 1024, compress_level: int = 6, max_payload: int = 65536):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.max_payload = max_payload
+
+    @staticmethod
+    def peek_to(frame: bytes) -> str:
+        """Recipient of a binary frame, read from the header without touching the payload."""
+        if len(frame) < HEADER_SIZE:
+            raise WireError("Frame is shorter than its header")
+        end = HEADER_SIZE + int.from_bytes(frame[1:HEADER_SIZE], "big")
+        if end > len(frame):
+            raise WireError("Recipient runs past the end of the frame")
+        try:
+            return frame[HEADER_SIZE:end].decode()
+        except UnicodeDecodeError as e:
+            raise WireError(str(e))
+
+    def payload(self, frame: bytes) -> str:
+        """The JSON text of a binary frame."""
+        start = HEADER_SIZE + int.from_bytes(frame[1:HEADER_SIZE], "big")
+        body = memoryview(frame)[start:]
+        try:
+            if frame[0] & FLAG_DEFLATE:
+                inflater = zlib.decompressobj()
+                payload = inflater.decompress(body, self.max_payload)
+                if inflater.unconsumed_tail:
+                    raise WireError(f"Payload inflates past {self.max_payload} bytes")
+                if not inflater.eof:
+                    raise WireError("Compressed payload is truncated")
+                return payload.decode()
+            if len(body) > self.max_payload:
+                raise WireError(f"Payload is larger than {self.max_payload} bytes")
+            return bytes(body).decode()
+        except (zlib.error, UnicodeDecodeError) as e:
+            raise WireError(str(e))
+
+    def encode(self, to: str, text: str) -> bytes:
+        recipient = to.encode()
+        payload = text.encode()
+        flags = 0
+        if len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload, self.compress_level)
+            if len(compressed) < len(payload):
+                payload, flags = compressed, FLAG_DEFLATE
+        return bytes((flags,)) + len(recipient).to_bytes(2, "big") + recipient + payload
+
+
+class WireMessage:
+    """
+    A chat message that may go to both text and binary sessions.
+
+    Holds whichever form it arrived in and builds the other one at most once,
+    the first time a session needs it, so fan-out to many sessions reuses the
+    same str/bytes object.
+    """
+
+    __slots__ = ("codec", "to", "_raw", "_text")
+
+    def __init__(self, codec: WireCodec, to: str, raw: bytes | None = None, text: str | None = None):
+        self.codec = codec
+        self.to = to
+        self._raw = raw
+        self._text = text
+
+    @classmethod
+    def from_frame(cls, codec: WireCodec, frame: bytes) -> "WireMessage":
+        return cls(codec, codec.peek_to(frame), raw=frame)
+
+    @classmethod
+    def decode_frame(cls, codec: WireCodec, frame: bytes) -> tuple["WireMessage", dict]:
+        """
+        Validate a frame received from a client, returns the message and its payload document.
+        Raises WireError unless the payload is a JSON object addressed to the recipient in the header.
+        """
+        wire = cls.from_frame(codec, frame)
+        try:
+            document = orjson.loads(wire.text)
+        except orjson.JSONDecodeError as e:
+            raise WireError(f"Payload is not JSON: {e}")
+        if not isinstance(document, dict):
+            raise WireError("Payload is not a JSON object")
+        if document.get("to") != wire.to:
+            raise WireError("Payload recipient does not match the header")
+        return wire, document
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = self.codec.encode(self.to, self._text)
+        return self._raw
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.codec.payload(self._raw)
+        return self._text
+
+    def document(self) -> dict:
+        return orjson.loads(self.text)
+
+
+__all__ = ["WireCodec", "WireMessage", "WireError", "FLAG_DEFLATE"]
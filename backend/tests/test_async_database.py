@@ -0,0 +1,27 @@
+import asyncio
+from src.db import async_database
+
+
+def test_concurrent_first_use_opens_one_async_pool(monkeypatch):
+    opened = []
+
+    class Pool:
+        check_connection = None
+
+        def __init__(self, **kwargs):
+            opened.append(self)
+
+        async def open(self):
+            await asyncio.sleep(0.01)
+
+    settings = {"conn_params": {}, "async_pool": {}}
+    monkeypatch.setattr(async_database, "AsyncConnectionPool", Pool)
+    monkeypatch.setattr(async_database, "get_db_settings", lambda: settings)
+    monkeypatch.setattr(async_database, "_async_pool", None)
+
+    async def scenario():
+        pools = await asyncio.gather(*(async_database.get_async_pool() for _ in range(8)))
+        assert len(opened) == 1
+        assert all(pool is opened[0] for pool in pools)
+
+    asyncio.run(scenario())
@@ -0,0 +1,118 @@
+import asyncio
+from src.services.websocket_connectionManager import ConnectionManager
+
+
+class FakeWebSocket:
+    """Records what the writer sent, `block` holds every send until it is set."""
+
+    def __init__(self):
+        self.sent: list = []
+        self.closed: int | None = None
+        self.block: asyncio.Event | None = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        if self.block is not None:
+            await self.block.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data)
+
+    async def close(self, code: int = 1000):
+        self.closed = code
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_message_reaches_every_session_of_the_user():
+    async def scenario():
+        manager = ConnectionManager()
+        phone, laptop, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(phone, "alice")
+        await manager.connect(laptop, "alice")
+        await manager.connect(other, "bob")
+        assert await manager.send_personal_message("hi", "alice")
+        assert not await manager.send_personal_message("hi", "nobody")
+        await settle()
+        assert phone.sent == laptop.sent == ["hi"]
+        assert other.sent == []
+
+    run(scenario())
+
+
+def test_slow_session_drops_frames_without_holding_up_others():
+    async def scenario():
+        manager = ConnectionManager(max_queue=2)
+        slow, fast = FakeWebSocket(), FakeWebSocket()
+        slow.block = asyncio.Event()
+        await manager.connect(slow, "slow")
+        await manager.connect(fast, "fast")
+        for i in range(5):
+            await manager.broadcast(str(i))
+            await settle()
+        assert fast.sent == ["0", "1", "2", "3", "4"]
+        # the writer holds one frame in its send, the queue two more
+        assert manager.stats["dropped"] == 2
+        slow.block.set()
+        await settle()
+        assert slow.sent == ["0", "1", "2"]
+
+    run(scenario())
+
+
+def test_disconnect_policy_closes_the_slow_session():
+    async def scenario():
+        manager = ConnectionManager(max_queue=1, overflow_policy="disconnect")
+        slow = FakeWebSocket()
+        slow.block = asyncio.Event()
+        session = await manager.connect(slow, "slow")
+        for i in range(3):
+            await manager.send_personal_message(str(i), "slow")
+        await settle()
+        assert session.closing
+        assert slow.closed == 1013
+        assert manager.stats["slow_disconnects"] == 1
+        assert not manager.send_session(session, "after close")
+
+    run(scenario())
+
+
+def test_coalescing_session_gets_queued_frames_as_one_array():
+    async def scenario():
+        manager = ConnectionManager(coalesce_delay=0.01, coalesce_max_batch=3)
+        plain, batched = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(plain, "alice")
+        await manager.connect(batched, "bob", coalesce=True)
+        for i in range(4):
+            await manager.send_personal_message(f'{{"n": {i}}}', "alice")
+            await manager.send_personal_message(f'{{"n": {i}}}', "bob")
+        await asyncio.sleep(0.05)
+        assert plain.sent == ['{"n": 0}', '{"n": 1}', '{"n": 2}', '{"n": 3}']
+        # at most coalesce_max_batch frames per array, a lone frame goes out unchanged
+        assert batched.sent == ['[{"n": 0},{"n": 1},{"n": 2}]', '{"n": 3}']
+        assert manager.stats["coalesced"] == 2
+
+    run(scenario())
+
+
+def test_binary_frame_ends_a_coalesced_batch():
+    async def scenario():
+        manager = ConnectionManager(coalesce_delay=0.01)
+        socket = FakeWebSocket()
+        session = await manager.connect(socket, "bob", coalesce=True)
+        for frame in ('{"n": 0}', '{"n": 1}', b"\x00binary", '{"n": 2}'):
+            manager.send_session(session, frame)
+        await asyncio.sleep(0.05)
+        assert socket.sent == ['[{"n": 0},{"n": 1}]', b"\x00binary", '{"n": 2}']
+
+    run(scenario())
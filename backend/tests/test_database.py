@@ -0,0 +1,34 @@
+import threading
+import time
+from src.db import database
+
+
+def test_concurrent_first_use_opens_one_pool(monkeypatch):
+    opened = []
+
+    class Pool:
+        check_connection = None
+
+        def __init__(self, **kwargs):
+            # slow enough for every thread to find no pool yet
+            time.sleep(0.01)
+            opened.append(self)
+
+    settings = {"conn_params": {}, "pool": {}}
+    monkeypatch.setattr(database, "ConnectionPool", Pool)
+    monkeypatch.setattr(database, "_settings", settings)
+    monkeypatch.setattr(database, "_pool", None)
+    start = threading.Barrier(8)
+    pools = []
+
+    def first_use():
+        start.wait()
+        pools.append(database.get_pool())
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    assert all(pool is opened[0] for pool in pools)
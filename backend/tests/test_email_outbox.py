@@ -0,0 +1,154 @@
+import asyncio
+from src.services.email_outbox import EmailOutbox
+from src.utils.email import FakeEmailProvider
+
+
+class OutboxTable:
+    """The email_outbox queries of AsyncDatabaseManager over an in-memory table."""
+
+    def __init__(self, failing_marks: int = 0):
+        self.rows: dict[int, dict] = {}
+        self.failing_marks = failing_marks
+
+    async def enqueueEmail(self, dedupe_key, recipient, subject, html):
+        if any(row["dedupe_key"] == dedupe_key for row in self.rows.values()):
+            return False
+        outbox_id = len(self.rows) + 1
+        self.rows[outbox_id] = {
+            "outbox_id": outbox_id,
+            "dedupe_key": dedupe_key,
+            "recipient": recipient,
+            "subject": subject,
+            "html": html,
+            "status": "pending",
+            "attempts": 0,
+        }
+        return True
+
+    async def claimOutboxEmails(self, limit, lease_seconds, max_attempts):
+        # a claim on a row still marked 'sending' stands for a reclaim after the lease expired
+        claimed = []
+        for row in self.rows.values():
+            if row["status"] not in ("pending", "sending") or len(claimed) >= limit:
+                continue
+            if row["attempts"] >= max_attempts:
+                row["status"] = "failed"
+                continue
+            row["status"] = "sending"
+            row["attempts"] += 1
+            claimed.append(dict(row))
+        return claimed
+
+    async def markOutboxSent(self, outbox_ids):
+        if self.failing_marks:
+            self.failing_marks -= 1
+            raise ConnectionError("database went away")
+        for outbox_id in outbox_ids:
+            self.rows[outbox_id]["status"] = "sent"
+
+    async def markOutboxFailed(self, outbox_ids, error, base_delay, max_attempts):
+        for outbox_id in outbox_ids:
+            row = self.rows[outbox_id]
+            row["status"] = "failed" if row["attempts"] >= max_attempts else "pending"
+
+    async def purgeOutbox(self, limit, retention_seconds):
+        # every row counts as older than the retention
+        done = [outbox_id for outbox_id, row in self.rows.items() if row["status"] in ("sent", "failed")][:limit]
+        for outbox_id in done:
+            del self.rows[outbox_id]
+        return len(done)
+
+
+def test_sends_queued_emails_in_batches():
+    async def scenario():
+        table = OutboxTable()
+        provider = FakeEmailProvider()
+        provider.batch_limit = 2
+        outbox = EmailOutbox(table, provider)
+        for i in range(5):
+            await outbox.enqueue(f"otp:{i}", f"user{i}@example.com", "Account Verification", "<p>hi</p>")
+        assert not await outbox.enqueue("otp:0", "user0@example.com", "Account Verification", "<p>hi</p>")
+        assert await outbox.dispatch_once() == 5
+        assert sorted(email["to"][0] for email in provider.sent) == [f"user{i}@example.com" for i in range(5)]
+        assert provider.seen_keys == {f"otp:{i}" for i in range(5)}
+        assert outbox.stats["batches"] == 3
+        assert {row["status"] for row in table.rows.values()} == {"sent"}
+
+    asyncio.run(scenario())
+
+
+def test_failed_sends_are_retried_until_max_attempts():
+    async def scenario():
+        table = OutboxTable()
+        provider = FakeEmailProvider(fail=True)
+        outbox = EmailOutbox(table, provider, max_attempts=2, base_delay=0)
+        await outbox.enqueue("otp:a", "a@example.com", "Account Verification", "<p>hi</p>")
+        assert await outbox.dispatch_once() == 1
+        assert table.rows[1]["status"] == "pending"
+        assert await outbox.dispatch_once() == 1
+        assert table.rows[1]["status"] == "failed"
+        assert await outbox.dispatch_once() == 0
+        assert outbox.stats["failed_attempts"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_mark_sent_failure_is_retried_without_resending():
+    async def scenario():
+        table = OutboxTable(failing_marks=1)
+        provider = FakeEmailProvider()
+        outbox = EmailOutbox(table, provider, base_delay=0)
+        await outbox.enqueue("otp:a", "a@example.com", "Account Verification", "<p>hi</p>")
+        await outbox.dispatch_once()
+        assert table.rows[1]["status"] == "sent"
+        assert outbox.stats["mark_errors"] == 1
+        assert len(provider.sent) == 1
+
+    asyncio.run(scenario())
+
+
+def test_reclaimed_batch_is_not_delivered_twice():
+    async def scenario():
+        table = OutboxTable(failing_marks=3)
+        provider = FakeEmailProvider()
+        outbox = EmailOutbox(table, provider, base_delay=0, max_attempts=3)
+        await outbox.enqueue("otp:a", "a@example.com", "Account Verification", "<p>hi</p>")
+        await outbox.dispatch_once()
+        # every mark failed, the row stays 'sending' and is reclaimed once the lease expires
+        assert table.rows[1]["status"] == "sending"
+        await outbox.dispatch_once()
+        assert table.rows[1]["status"] == "sent"
+        assert len(provider.sent) == 1
+
+    asyncio.run(scenario())
+
+
+def test_reclaim_past_max_attempts_marks_row_failed():
+    async def scenario():
+        table = OutboxTable(failing_marks=100)
+        provider = FakeEmailProvider()
+        outbox = EmailOutbox(table, provider, base_delay=0, max_attempts=2, mark_retries=1)
+        await outbox.enqueue("otp:a", "a@example.com", "Account Verification", "<p>hi</p>")
+        assert await outbox.dispatch_once() == 1
+        assert await outbox.dispatch_once() == 1
+        assert await outbox.dispatch_once() == 0
+        assert table.rows[1]["status"] == "failed"
+        assert table.rows[1]["attempts"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_purge_deletes_finished_rows_in_batches():
+    async def scenario():
+        table = OutboxTable()
+        provider = FakeEmailProvider()
+        outbox = EmailOutbox(table, provider, purge_batch=2)
+        for i in range(5):
+            await outbox.enqueue(f"otp:{i}", f"user{i}@example.com", "Account Verification", "<p>hi</p>")
+        await outbox.dispatch_once()
+        await outbox.enqueue("otp:pending", "late@example.com", "Account Verification", "<p>hi</p>")
+        assert await outbox.purge() == 5
+        assert [row["dedupe_key"] for row in table.rows.values()] == ["otp:pending"]
+        assert outbox.stats["purged"] == 5
+
+    asyncio.run(scenario())
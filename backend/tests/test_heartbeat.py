@@ -0,0 +1,76 @@
+from src.services.heartbeat import PING_FRAME, HeartbeatScheduler
+from src.services.websocket_connectionManager import ClientConnection
+
+
+class Manager:
+    """Records the pings and closes the scheduler asks for."""
+
+    def __init__(self):
+        self.pinged: list[str] = []
+        self.closed: list[tuple[str, int]] = []
+
+    def send_session(self, connection, message):
+        assert message == PING_FRAME
+        self.pinged.append(connection.client_id)
+        return True
+
+    def close_session(self, connection, code):
+        connection.closing = True
+        self.closed.append((connection.client_id, code))
+
+
+def session(client_id: str) -> ClientConnection:
+    connection = ClientConnection(None, client_id, max_queue=1)
+    connection.last_seen = 0.0
+    return connection
+
+
+def run_ticks(scheduler: HeartbeatScheduler, start: int, end: int, before_tick=None):
+    for now in range(start, end + 1):
+        if before_tick is not None:
+            before_tick(now)
+        scheduler.advance(float(now))
+
+
+def test_quiet_session_is_pinged_then_reaped():
+    manager = Manager()
+    scheduler = HeartbeatScheduler(manager, ping_interval=3, idle_timeout=6, tick=1)
+    quiet = session("quiet")
+    scheduler.add(quiet)
+    run_ticks(scheduler, 1, 2)
+    assert manager.pinged == []
+    run_ticks(scheduler, 3, 3)
+    assert manager.pinged == ["quiet"]
+    run_ticks(scheduler, 4, 6)
+    assert manager.closed == [("quiet", 1001)]
+    assert scheduler.stats == {"pings": 1, "reaped": 1}
+    assert quiet.wheel_slot == -1
+    # a reaped session is not rescheduled, the wheel goes round without it
+    run_ticks(scheduler, 7, 20)
+    assert manager.closed == [("quiet", 1001)]
+
+
+def test_active_session_is_never_pinged():
+    manager = Manager()
+    scheduler = HeartbeatScheduler(manager, ping_interval=3, idle_timeout=6, tick=1)
+    active = session("active")
+    scheduler.add(active)
+
+    def receive(now):
+        active.last_seen = now - 0.5
+
+    # more than two full turns of the wheel
+    run_ticks(scheduler, 1, 20, before_tick=receive)
+    assert manager.pinged == [] and manager.closed == []
+    assert active.wheel_slot >= 0
+
+
+def test_removed_session_is_forgotten():
+    manager = Manager()
+    scheduler = HeartbeatScheduler(manager, ping_interval=3, idle_timeout=6, tick=1)
+    gone = session("gone")
+    scheduler.add(gone)
+    scheduler.remove(gone)
+    assert gone.wheel_slot == -1
+    run_ticks(scheduler, 1, 20)
+    assert manager.pinged == [] and manager.closed == []
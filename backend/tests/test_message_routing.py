@@ -0,0 +1,227 @@
+import asyncio
+import json
+from src.services.message_routing import MAX_NOTIFY_PAYLOAD, BrokerBackend, LocalBroker
+
+
+class Node:
+    """A BrokerBackend with the messages delivered to its local users."""
+
+    def __init__(self, broker: LocalBroker, node_id: str | None = None, lease: float = 30.0):
+        self.backend = BrokerBackend(broker, node_id, lease=lease, max_reconnect_delay=0.05)
+        self.delivered: list[tuple[str, str]] = []
+        self.presence: list[tuple[str, bool]] = []
+        self.backend.presence_listeners.append(lambda username, online: self.presence.append((username, online)))
+
+    async def start(self):
+        await self.backend.start(self._deliver)
+        return self
+
+    async def _deliver(self, username: str, message: str):
+        self.delivered.append((username, message))
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_route_reaches_user_on_other_node():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        await b.backend.register("bob")
+        await settle()
+        assert a.backend.locate("bob") == {"b"}
+        assert await a.backend.route("bob", "hi")
+        await settle()
+        assert b.delivered == [("bob", "hi")]
+        assert not await a.backend.route("nobody", "hi")
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_route_many_sends_once_per_node():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        published = []
+        publish = broker.publish
+
+        async def counting_publish(channel, payload):
+            published.append(channel)
+            await publish(channel, payload)
+
+        await b.backend.register("bob")
+        await b.backend.register("carol")
+        await a.backend.register("alice")
+        await settle()
+        broker.publish = counting_publish
+        reached = await a.backend.route_many(["alice", "bob", "carol", "dave"], "hello")
+        await settle()
+        assert reached == {"alice", "bob", "carol"}
+        assert published == [BrokerBackend.channel_for("b")]
+        assert a.delivered == [("alice", "hello")]
+        assert sorted(b.delivered) == [("bob", "hello"), ("carol", "hello")]
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_user_stays_online_until_last_node_leaves():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        c = await Node(broker, "c").start()
+        await a.backend.register("alice")
+        await b.backend.register("alice")
+        await settle()
+        assert c.backend.locate("alice") == {"a", "b"}
+        await a.backend.unregister("alice")
+        await settle()
+        assert c.backend.locate("alice") == {"b"}
+        assert c.presence == [("alice", True)]
+        await b.backend.unregister("alice")
+        await settle()
+        assert c.presence == [("alice", True), ("alice", False)]
+        for node in (a, b, c):
+            await node.backend.stop()
+
+    run(scenario())
+
+
+def test_non_ascii_message_is_not_inflated_by_escaping():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        await b.backend.register("bob")
+        await settle()
+        # 6000 bytes of utf-8, 18000 once escaped as \ud83d\ude00 pairs
+        message = json.dumps({"type": "message", "to": "bob", "message": "\U0001f600" * 1500}, ensure_ascii=False)
+        assert await a.backend.route("bob", message)
+        await settle()
+        assert b.delivered == [("bob", message)]
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_message_over_notify_limit_is_not_routed():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        await b.backend.register("bob")
+        await settle()
+        message = "x" * (MAX_NOTIFY_PAYLOAD + 100)
+        assert len(message.encode()) > a.backend.max_message_bytes
+        assert not await a.backend.route("bob", message)
+        assert await a.backend.route_many(["bob"], message) == set()
+        await settle()
+        assert b.delivered == []
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_route_many_splits_recipients_over_notifications():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        users = [f"user_{i:04d}_" + "x" * 40 for i in range(300)]
+        for username in users:
+            await b.backend.register(username)
+        await settle()
+        message = "y" * a.backend.max_message_bytes
+        assert await a.backend.route_many(users, message) == set(users)
+        await settle()
+        assert sorted(b.delivered) == [(username, message) for username in sorted(users)]
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_malformed_notification_does_not_stop_listener():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        await broker.publish(a.backend.node_channel, "not json")
+        await broker.publish(a.backend.node_channel, json.dumps({"to": "alice"}))
+        await broker.publish(a.backend.node_channel, json.dumps({"from": "bob"}) + "\nno recipient")
+        await broker.publish(a.backend.node_channel, json.dumps({"to": "alice"}) + "\nhi")
+        await settle()
+        assert a.delivered == [("alice", "hi")]
+        await a.backend.stop()
+
+    run(scenario())
+
+
+def test_listener_resubscribes_and_resyncs_after_connection_loss():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a").start()
+        b = await Node(broker, "b").start()
+        broker.drop_connections()
+        # a join published while nobody listens is picked up from the snapshot taken on resubscribe
+        await b.backend.register("bob")
+        await asyncio.sleep(0.2)
+        assert a.backend.locate("bob") == {"b"}
+        assert await a.backend.route("bob", "after reconnect")
+        await settle()
+        assert b.delivered == [("bob", "after reconnect")]
+        await a.backend.stop()
+        await b.backend.stop()
+
+    run(scenario())
+
+
+def test_dead_node_is_purged_and_its_users_go_offline():
+    async def scenario():
+        broker = LocalBroker()
+        a = await Node(broker, "a", lease=0.1).start()
+        b = await Node(broker, "b", lease=0.1).start()
+        await b.backend.register("bob")
+        await settle()
+        # b dies without cleaning up: no more heartbeats, its lease runs out
+        b.backend._heartbeat.cancel()
+        b.backend._listener.cancel()
+        await asyncio.sleep(0.3)
+        assert a.backend.locate("bob") == set()
+        assert not await a.backend.route("bob", "lost")
+        assert "b" not in broker.leases
+        assert broker.rows == set()
+        assert a.presence == [("bob", True), ("bob", False)]
+        await a.backend.stop()
+
+    run(scenario())
+
+
+def test_automatic_node_ids_are_stable_per_slot():
+    async def scenario():
+        broker = LocalBroker()
+        first = await Node(broker).start()
+        second = await Node(broker).start()
+        assert first.backend.node_id != second.backend.node_id
+        assert second.backend.node_id == first.backend.node_id + "-1"
+        await second.backend.stop()
+        # a restarted process gets the slot back instead of leaving rows under a new id
+        third = await Node(broker).start()
+        assert third.backend.node_id == second.backend.node_id
+        await first.backend.stop()
+        await third.backend.stop()
+
+    run(scenario())
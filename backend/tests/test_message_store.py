@@ -0,0 +1,10 @@
+from src.services.message_store import MessageStore
+
+
+def test_add_drops_and_counts_once_buffer_is_full():
+    store = MessageStore(max_batch=2, max_buffer=3)
+    assert all(store.add("alice", "bob", str(i)) for i in range(3))
+    assert not store.add("alice", "bob", "overflow")
+    assert store.buffered == 3
+    assert store.stats["dropped"] == 1
+    assert [row[3] for row in store._buffer] == ["0", "1", "2"]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Response
+
+# the auth middleware reads its secret at import
+os.environ.setdefault("AUTH_SECRET", "test-secret")
+from src.routers import messages  # noqa: E402
+
+
+class Conversation:
+    """getConversation of AsyncDatabaseManager over an in-memory list, newest first like the query."""
+
+    def __init__(self, count: int):
+        start = datetime(2024, 1, 1)
+        self.rows = [
+            {"message_id": i, "sender": "alice" if i % 2 else "bob", "body": f"m{i}", "createdat": start + timedelta(seconds=i)}
+            for i in range(1, count + 1)
+        ]
+
+    async def getConversation(self, username, peer, cursor, limit):
+        rows = sorted(self.rows, key=lambda row: (row["createdat"], row["message_id"]), reverse=True)
+        if cursor is not None:
+            rows = [row for row in rows if (row["createdat"], row["message_id"]) < cursor]
+        return rows[:limit]
+
+
+def get_page(before=None, limit=2, if_none_match=None):
+    response = Response()
+    result = asyncio.run(messages.getMessages("bob", response, "alice", before, limit, if_none_match))
+    return response, result
+
+
+def test_pages_walk_back_with_the_cursor(monkeypatch):
+    monkeypatch.setattr(messages, "db_manager", Conversation(5))
+    _, first = get_page()
+    assert [m["id"] for m in first.data["messages"]] == [4, 5]
+    _, second = get_page(before=first.data["nextCursor"])
+    assert [m["id"] for m in second.data["messages"]] == [2, 3]
+    _, last = get_page(before=second.data["nextCursor"])
+    assert [m["id"] for m in last.data["messages"]] == [1]
+    assert last.data["nextCursor"] is None
+
+
+def test_unchanged_page_is_answered_with_304(monkeypatch):
+    conversation = Conversation(3)
+    monkeypatch.setattr(messages, "db_manager", conversation)
+    response, _ = get_page()
+    etag = response.headers["ETag"]
+    not_modified = get_page(if_none_match=etag)[1]
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    # a new message changes the newest page, so the old tag no longer matches
+    conversation.rows.append({"message_id": 4, "sender": "bob", "body": "m4", "createdat": datetime(2024, 1, 2)})
+    response, result = get_page(if_none_match=etag)
+    assert response.headers["ETag"] != etag
+    assert [m["id"] for m in result.data["messages"]] == [3, 4]
+
+
+def test_malformed_cursor_is_rejected(monkeypatch):
+    monkeypatch.setattr(messages, "db_manager", Conversation(1))
+    with pytest.raises(HTTPException) as error:
+        get_page(before="not-a-cursor")
+    assert error.value.status_code == 400
@@ -0,0 +1,84 @@
+import asyncio
+from contextlib import asynccontextmanager
+from src.db import migrate
+
+
+class Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class Connection:
+    """Answers the schema_migrations queries of run_migrations and records every statement."""
+
+    def __init__(self, applied):
+        self.applied = list(applied)
+        self.statements: list[str] = []
+
+    async def execute(self, query, params=None):
+        self.statements.append(" ".join(query.split()))
+        if query.startswith("SELECT max(version)"):
+            return Cursor([{"version": max(self.applied, default=None)}])
+        if query.startswith("SELECT version FROM"):
+            return Cursor([{"version": version} for version in self.applied])
+        if query.startswith("INSERT INTO schema_migrations"):
+            self.applied.append(params[0])
+        return Cursor([])
+
+    async def rollback(self):
+        pass
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def write_migrations(tmp_path, names):
+    for name in names:
+        (tmp_path / name).write_text(f"-- {name}\nSELECT 1;\n")
+
+
+def run_against(monkeypatch, conn):
+    @asynccontextmanager
+    async def connection():
+        yield conn
+
+    monkeypatch.setattr(migrate, "async_connection", connection)
+    return asyncio.run(migrate.run_migrations())
+
+
+def test_shipped_migrations_have_unique_versions_in_order():
+    versions = [migration.version for migration in migrate.load_migrations()]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_load_migrations_orders_by_version_and_skips_other_files(monkeypatch, tmp_path):
+    write_migrations(tmp_path, ["0010_ten.sql", "0002_two.sql", "README.md", "0003_notes.txt"])
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    assert [(m.version, m.name) for m in migrate.load_migrations()] == [(2, "two"), (10, "ten")]
+
+
+def test_up_to_date_database_costs_one_query(monkeypatch, tmp_path):
+    write_migrations(tmp_path, ["0001_one.sql", "0002_two.sql"])
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    conn = Connection(applied=[1, 2])
+    assert run_against(monkeypatch, conn) == []
+    assert len(conn.statements) == 1
+
+
+def test_only_pending_migrations_are_applied_under_the_lock(monkeypatch, tmp_path):
+    write_migrations(tmp_path, ["0001_one.sql", "0002_two.sql", "0003_three.sql"])
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    conn = Connection(applied=[1])
+    assert run_against(monkeypatch, conn) == [2, 3]
+    assert conn.applied == [1, 2, 3]
+    assert conn.statements[1].startswith("SELECT pg_advisory_xact_lock")
+    files = [statement for statement in conn.statements if statement.startswith("--")]
+    assert files == ["-- 0002_two.sql SELECT 1;", "-- 0003_three.sql SELECT 1;"]
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from src.services.offline_queue import OfflineQueue
+
+
+class PendingTable:
+    """The pending_messages queries of AsyncDatabaseManager over an in-memory list."""
+
+    def __init__(self):
+        self.rows: list[dict] = []
+
+    async def queuePendingMessage(self, receiver, payload):
+        self.rows.append({"pending_id": len(self.rows) + 1, "receiver": receiver, "payload": payload})
+
+    async def getPendingMessages(self, receiver, after_id, limit):
+        return [row for row in self.rows if row["receiver"] == receiver and row["pending_id"] > after_id][:limit]
+
+    async def ackPendingMessages(self, receiver, ack_id):
+        self.rows = [row for row in self.rows if row["receiver"] != receiver or row["pending_id"] > ack_id]
+
+
+class Sessions:
+    """Collects the frames send_personal_message would queue."""
+
+    def __init__(self):
+        self.frames: list[tuple[str, str]] = []
+
+    async def send_personal_message(self, message, client_id):
+        self.frames.append((client_id, message))
+        return True
+
+
+def test_backlog_is_spliced_into_batches_of_valid_json():
+    async def scenario():
+        table, sessions = PendingTable(), Sessions()
+        queue = OfflineQueue(table, sessions, batch_size=2)
+        sent = [{"type": "message", "to": "bob", "message": f"m{i} é☺"} for i in range(5)]
+        for frame in sent:
+            await queue.store("bob", json.dumps(frame, ensure_ascii=False))
+        await queue.store("carol", json.dumps({"type": "message", "to": "carol", "message": "not yours"}))
+        await queue.deliver("bob")
+        backlogs = [json.loads(frame) for client_id, frame in sessions.frames if client_id == "bob"]
+        assert [backlog["ackId"] for backlog in backlogs] == [2, 4, 5]
+        assert [message for backlog in backlogs for message in backlog["messages"]] == sent
+        assert len(sessions.frames) == 3
+
+    asyncio.run(scenario())
+
+
+def test_ack_removes_only_acknowledged_messages():
+    async def scenario():
+        table, sessions = PendingTable(), Sessions()
+        queue = OfflineQueue(table, sessions, batch_size=2)
+        for i in range(3):
+            await queue.store("bob", json.dumps({"message": i}))
+        await queue.deliver("bob")
+        await queue.ack("bob", 2)
+        # the unacknowledged message comes again on the next connect
+        sessions.frames.clear()
+        await queue.deliver("bob")
+        assert [json.loads(frame)["messages"] for _, frame in sessions.frames] == [[{"message": 2}]]
+
+    asyncio.run(scenario())
+
+
+def test_empty_backlog_sends_nothing():
+    async def scenario():
+        sessions = Sessions()
+        await OfflineQueue(PendingTable(), sessions).deliver("bob")
+        assert sessions.frames == []
+
+    asyncio.run(scenario())
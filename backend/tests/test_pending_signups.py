@@ -0,0 +1,17 @@
+import time
+from src.services.pending_signups import PendingSignups
+
+
+def test_block_ends_with_the_sign_up_it_belongs_to():
+    signups = PendingSignups(db_manager=None, ttl=600, max_attempts=3)
+    signups.record_failure("alice", None, expires_in=0.05)
+    assert signups.blocked("alice")
+    time.sleep(0.1)
+    # the sign-up expired, so a new one may exist that this process never saw
+    assert not signups.blocked("alice")
+
+
+def test_expired_sign_up_is_not_tracked():
+    signups = PendingSignups(db_manager=None, ttl=600, max_attempts=3)
+    signups.record_failure("alice", None, expires_in=-1)
+    assert not signups.blocked("alice")
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from src.services.presence_feed import PresenceFeed
+
+
+class Manager:
+    """The part of ConnectionManager the feed uses: who is online and where frames go."""
+
+    def __init__(self, online=()):
+        self.online = set(online)
+        self.frames: list[tuple[str, dict]] = []
+
+    def is_online(self, username):
+        return username in self.online
+
+    async def send_personal_message(self, message, client_id):
+        self.frames.append((client_id, json.loads(message)))
+        return True
+
+
+def presence(online=(), offline=()):
+    return {"type": "presence", "online": list(online), "offline": list(offline)}
+
+
+def test_subscribe_sends_the_current_state_once():
+    async def scenario():
+        manager = Manager(online={"bob"})
+        feed = PresenceFeed(manager)
+        await feed.subscribe("alice", ["bob", "carol"])
+        await feed.subscribe("alice", ["bob"])
+        assert manager.frames == [("alice", presence(["bob"], ["carol"]))]
+
+    asyncio.run(scenario())
+
+
+def test_changes_in_a_tick_go_out_as_one_frame_per_subscriber():
+    async def scenario():
+        manager = Manager()
+        feed = PresenceFeed(manager)
+        await feed.subscribe("alice", ["bob", "carol", "dave"])
+        await feed.subscribe("erin", ["bob"])
+        manager.frames.clear()
+        feed.publish("bob", True)
+        feed.publish("carol", True)
+        feed.publish("zed", True)
+        # offline and back within the tick: no event
+        feed.publish("dave", False)
+        feed.publish("dave", True)
+        await feed.flush()
+        assert sorted(manager.frames, key=lambda frame: frame[0]) == [
+            ("alice", presence(["bob", "carol"])),
+            ("erin", presence(["bob"])),
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribed_users_are_no_longer_watched():
+    async def scenario():
+        manager = Manager()
+        feed = PresenceFeed(manager)
+        await feed.subscribe("alice", ["bob", "carol"])
+        feed.unsubscribe("alice", ["bob"])
+        feed.remove_subscriber("alice")
+        assert feed.watchers == {} and feed.subscriptions == {}
+        manager.frames.clear()
+        feed.publish("carol", True)
+        await feed.flush()
+        assert manager.frames == []
+
+    asyncio.run(scenario())
+
+
+def test_subscriptions_are_capped():
+    async def scenario():
+        feed = PresenceFeed(Manager(), max_subscriptions=2)
+        await feed.subscribe("alice", ["a", "b", "c"])
+        assert feed.subscriptions["alice"] == {"a", "b"}
+
+    asyncio.run(scenario())
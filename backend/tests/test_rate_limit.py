@@ -0,0 +1,30 @@
+import asyncio
+from src.services.rate_limit import ALLOW, LIMITED, RateLimiter
+
+
+def limiter(**overrides):
+    settings = dict(client_rate=1000, client_burst=1, connection_rate=1000, connection_burst=5, max_frame_bytes=10)
+    settings.update(overrides)
+    return RateLimiter(**settings)
+
+
+def test_rejected_frame_does_not_spend_the_connection_token():
+    rate_limiter = limiter(client_rate=0.001)
+    bucket = rate_limiter.open("alice")
+    assert rate_limiter.check("alice", bucket, 1) == ALLOW
+    tokens = bucket.tokens
+    assert rate_limiter.check("alice", bucket, 1) == LIMITED
+    assert bucket.tokens >= tokens
+
+
+def test_wait_takes_the_token_it_waited_for():
+    async def scenario():
+        rate_limiter = limiter(client_rate=50)
+        bucket = rate_limiter.open("alice")
+        assert rate_limiter.check("alice", bucket, 1) == ALLOW
+        assert rate_limiter.check("alice", bucket, 1) == LIMITED
+        await rate_limiter.wait("alice", bucket)
+        # the token was taken by wait, the next frame is limited again
+        assert rate_limiter.check("alice", bucket, 1) == LIMITED
+
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from src.db import database
+from src.db import replicas as replicas_module
+from src.db.replicas import ReplicaSet
+
+
+def test_concurrent_first_use_opens_one_async_pool(monkeypatch):
+    opened = []
+
+    class Pool:
+        check_connection = None
+
+        def __init__(self, **kwargs):
+            opened.append(self)
+
+        async def open(self):
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(replicas_module, "AsyncConnectionPool", Pool)
+    replica = ReplicaSet(["host=replica"]).replicas[0]
+
+    async def scenario():
+        return await asyncio.gather(*(replica.get_async_pool({}) for _ in range(5)))
+
+    pools = asyncio.run(scenario())
+    assert len(opened) == 1
+    assert all(pool is opened[0] for pool in pools)
+
+
+def test_lagging_replica_is_ejected_and_rechecked_after_cooldown():
+    replica_set = ReplicaSet(["host=replica"], max_lag=5, lag_check_interval=60, cooldown=0)
+    replica = replica_set.replicas[0]
+    assert replica_set.lag_due(replica)
+    assert replica_set.record_lag(replica, 1.0)
+    assert not replica_set.lag_due(replica)
+    assert not replica_set.record_lag(replica, 30.0)
+    assert replica_set.stats["lag_ejections"] == 1
+    # back from the ejection, measured again before serving
+    assert replica_set.lag_due(replica)
+
+
+def test_lag_check_is_off_by_default():
+    replica_set = ReplicaSet(["host=replica"])
+    assert not replica_set.lag_due(replica_set.replicas[0])
+
+
+def test_request_reads_stay_on_the_primary_after_it_was_used():
+    replica_set = ReplicaSet(["host=replica"])
+    # background work has no pin, every read may use a replica
+    database.pin_primary()
+    assert database.choose_replica(replica_set) is replica_set.replicas[0]
+    token = database.primary_pin.set([False])
+    try:
+        assert database.choose_replica(replica_set) is replica_set.replicas[0]
+        database.pin_primary()
+        assert database.choose_replica(replica_set) is None
+        assert replica_set.stats["pinned_reads"] == 1
+    finally:
+        database.primary_pin.reset(token)
+    assert database.choose_replica(None) is None
+
+
+def test_queries_are_counted_per_request():
+    database.count_query()
+    counter = [0]
+    token = database.query_counter.set(counter)
+    try:
+        database.count_query()
+        database.count_query()
+    finally:
+        database.query_counter.reset(token)
+    database.count_query()
+    assert counter == [2]
+
+
+def test_concurrent_first_use_creates_one_replica_set(monkeypatch):
+    created = []
+
+    class SlowReplicaSet:
+        def __init__(self, dsns, **kwargs):
+            time.sleep(0.01)
+            created.append(self)
+
+    settings = {
+        "replica": {
+            "dsns": ["host=replica"],
+            "strategy": "round_robin",
+            "eject_after": 3,
+            "cooldown": 30,
+            "pool": {},
+            "max_lag": None,
+            "lag_check_interval": 5,
+        },
+    }
+    monkeypatch.setattr(database, "ReplicaSet", SlowReplicaSet)
+    monkeypatch.setattr(database, "get_db_settings", lambda: settings)
+    monkeypatch.setattr(database, "_replica_set", None)
+    start = threading.Barrier(8)
+    found = []
+
+    def first_use():
+        start.wait()
+        found.append(database.get_replica_set())
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(replica_set is created[0] for replica_set in found)
@@ -0,0 +1,74 @@
+import asyncio
+from src.services.rooms import RoomRegistry
+from src.services.websocket_connectionManager import ConnectionManager
+
+
+class RoomTable:
+    """The room_members queries of AsyncDatabaseManager over an in-memory set."""
+
+    def __init__(self, rows=()):
+        self.rows = set(rows)
+        self.next_id = 100
+
+    async def getAllRoomMembers(self):
+        return [{"room_id": room_id, "username": username} for room_id, username in self.rows]
+
+    async def createRoom(self, name, creator, members):
+        self.next_id += 1
+        self.rows.update((self.next_id, member) for member in members)
+        return self.next_id
+
+    async def addRoomMember(self, room_id, username):
+        added = (room_id, username) not in self.rows
+        self.rows.add((room_id, username))
+        return added
+
+    async def removeRoomMember(self, room_id, username):
+        removed = (room_id, username) in self.rows
+        self.rows.discard((room_id, username))
+        return removed
+
+
+class Recipients(ConnectionManager):
+    """Records send_many calls instead of queueing to sockets."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent: list[tuple[str, set]] = []
+
+    async def send_many(self, message, client_ids):
+        client_ids = set(client_ids)
+        self.sent.append((message, client_ids))
+        return len(client_ids)
+
+
+def test_indexes_follow_membership_changes():
+    async def scenario():
+        rooms = RoomRegistry(RoomTable({(1, "alice"), (1, "bob"), (2, "bob")}), Recipients())
+        await rooms.start()
+        assert rooms.members_of(1) == {"alice", "bob"}
+        assert rooms.rooms_for("bob") == {1, 2}
+        room_id = await rooms.create("new", "carol", ["alice"])
+        assert rooms.members_of(room_id) == {"alice", "carol"}
+        assert await rooms.add_member(1, "carol")
+        assert not await rooms.add_member(1, "carol")
+        assert await rooms.remove_member(2, "bob")
+        # empty entries are dropped, not left behind
+        assert 2 not in rooms.members
+        assert rooms.rooms_for("bob") == {1}
+        assert rooms.rooms_for("carol") == {1, room_id}
+
+    asyncio.run(scenario())
+
+
+def test_fanout_reaches_members_except_the_sender():
+    async def scenario():
+        manager = Recipients()
+        rooms = RoomRegistry(RoomTable({(1, "alice"), (1, "bob"), (1, "carol"), (2, "dave")}), manager)
+        await rooms.start()
+        assert await rooms.fanout(1, "alice", "frame") == 2
+        assert manager.sent == [("frame", {"bob", "carol"})]
+        assert rooms.stats == {"fanouts": 1, "fanout_recipients": 2}
+        assert rooms.is_member(1, "bob") and not rooms.is_member(1, "dave")
+
+    asyncio.run(scenario())
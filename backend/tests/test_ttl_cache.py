@@ -0,0 +1,45 @@
+import time
+from src.utils.ttl_cache import MISSING, TTLCache
+
+
+def test_entry_expires_after_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("alice", {"isverified": True})
+    assert cache.get("alice") == {"isverified": True}
+    time.sleep(0.1)
+    assert cache.get("alice") is MISSING
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_explicit_deadline_only_shortens_the_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    # a token expiring in an hour is still only kept for the cache ttl
+    cache.set("long", 1, expires_in=3600)
+    cache.set("short", 2, expires_in=0.01)
+    cache.set("expired", 3, expires_in=-1)
+    time.sleep(0.02)
+    assert cache.get("long") == 1
+    assert cache.get("short", None) is None
+    assert cache.get("expired", None) is None
+    time.sleep(0.05)
+    assert cache.get("long", None) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b", None) is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_invalidate_drops_the_entry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("alice", 1)
+    cache.invalidate("alice")
+    cache.invalidate("nobody")
+    assert cache.get("alice", None) is None
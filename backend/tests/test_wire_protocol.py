@@ -0,0 +1,31 @@
+import zlib
+import orjson
+import pytest
+from src.utils.wire_protocol import FLAG_DEFLATE, WireCodec, WireError, WireMessage
+
+
+def frame(to: str, payload: bytes, flags: int = 0) -> bytes:
+    recipient = to.encode()
+    return bytes((flags,)) + len(recipient).to_bytes(2, "big") + recipient + payload
+
+
+def test_decode_frame_round_trip():
+    codec = WireCodec(compress_threshold=16)
+    text = orjson.dumps({"type": "message", "to": "bob", "message": "x" * 100}).decode()
+    wire, document = WireMessage.decode_frame(codec, codec.encode("bob", text))
+    assert wire.to == "bob"
+    assert wire.text == text
+    assert document["message"] == "x" * 100
+
+
+def test_compressed_payload_is_bounded():
+    codec = WireCodec(max_payload=1024)
+    bomb = frame("bob", zlib.compress(b"{" + b" " * 10_000_000 + b"}"), FLAG_DEFLATE)
+    with pytest.raises(WireError, match="inflates"):
+        WireMessage.decode_frame(codec, bomb)
+
+
+@pytest.mark.parametrize("payload", [b"not json", b"[1, 2]", b'{"to": "carol", "message": "hi"}', b'{"message": "hi"}'])
+def test_invalid_payload_is_rejected(payload):
+    with pytest.raises(WireError):
+        WireMessage.decode_frame(WireCodec(), frame("bob", payload))
@@ -16,9 +16,18 @@ export default function ChatPage() {
   const username = usePathname().split('/').pop();
   const [inpMsg, setInpmsg] = useState('');
   const ws = useRef<WebSocket | null>(null);
+  // users shown in the sidebar, their presence is pushed by the server once subscribed
+  const contacts = useRef<string[]>([]);
+  const [presence, setPresence] = useState<Record<string, boolean>>({});
   const msgEndScroll = useRef<HTMLDivElement | null>(null);
   const { toast } = useToast();
 
+  function subscribe(users: string[]) {
+    if (users.length > 0 && ws.current?.readyState === WebSocket.OPEN) {
+      ws.current.send(JSON.stringify({ type: 'subscribe', users }));
+    }
+  }
+
   function scrollToEnd() {
     msgEndScroll.current?.scrollIntoView({ behavior: 'smooth' });
   }
@@ -32,19 +41,38 @@ export default function ChatPage() {
       `${process.env.NEXT_PUBLIC_WEB_SOCKET || 'ws://localhost:8000/ws'}/${username}`
     );
 
+    // a new socket starts without subscriptions
+    ws.current.onopen = () => subscribe(contacts.current);
+
     ws.current.onmessage = (e) => {
       const message = typeof e.data === 'string' ? JSON.parse(e.data) : e.data;
-      if (message.type === 'message') {
+      if (message.type === 'ping') {
+        // heartbeat, the server closes sessions that stay silent
+        ws.current?.send(JSON.stringify({ type: 'pong' }));
+      } else if (message.type === 'message') {
         setMessage((prev) => [...prev, message]);
         if (message.from !== selectedUser) {
           toast({
             title: `New Message from ${message.from}`,
           });
         }
+      } else if (message.type === 'backlog') {
+        // messages received while we were offline, ack so the server drops them
+        setMessage((prev) => [...prev, ...message.messages]);
+        ws.current?.send(JSON.stringify({ type: 'ack', ackId: message.ackId }));
+      } else if (message.type === 'presence') {
+        setPresence((prev) => {
+          const next = { ...prev };
+          message.online.forEach((user: string) => (next[user] = true));
+          message.offline.forEach((user: string) => (next[user] = false));
+          return next;
+        });
       } else if (message.type === 'offline') {
         toast({
           title: message.message,
-          description: 'Message is not delivered!',
+          description: message.queued
+            ? 'Message will be delivered when they come online.'
+            : 'Message is not delivered!',
         });
       }
     };
@@ -100,6 +128,11 @@ export default function ChatPage() {
     <ChatLayout
       ws={ws.current}
       onSelect={(user: string) => setSelectedUser(user)}
+      presence={presence}
+      onUsers={(users: string[]) => {
+        contacts.current = contacts.current.concat(users);
+        subscribe(users);
+      }}
     >
       {selectedUser === '' ? (
         <NotSelectedUser />
@@ -13,13 +13,23 @@ interface ChatLayoutProps {
   children: React.ReactNode;
   onSelect: (user: string) => void;
   ws: WebSocket | null;
+  // live online state pushed over the socket, wins over the isOnline loaded with the list
+  presence: Record<string, boolean>;
+  // called with every page of users loaded, so the page can subscribe to their presence
+  onUsers: (users: string[]) => void;
 }
 interface User {
   username: string;
   isOnline: boolean; // or boolean, depending on your actual data
 }
 
-export function ChatLayout({ children, onSelect, ws }: ChatLayoutProps) {
+export function ChatLayout({
+  children,
+  onSelect,
+  ws,
+  presence,
+  onUsers,
+}: ChatLayoutProps) {
   const [users, setUsers] = useState<User[]>([]);
   const [selectedUser, setSelecteduser] = useState<string>('');
   const router = useRouter();
@@ -31,12 +41,22 @@ export function ChatLayout({ children, onSelect, ws }: ChatLayoutProps) {
   useEffect(() => {
     async function getAllUsers() {
       try {
-        const res = await useAxios.get<ApiResponse>('/getUsers');
-        if (res.data.success) {
+        // the list is paged, X-Next-Cursor is absent on the last page
+        let cursor: string | undefined;
+        let all: User[] = [];
+        do {
+          const res = await useAxios.get<ApiResponse>('/getUsers', {
+            params: cursor ? { cursor } : {},
+          });
+          if (!res.data.success) break;
           let temp = Array.isArray(res.data?.data) ? res.data.data : [];
           temp = temp.filter((user) => user.username !== username);
-          setUsers(temp);
-        }
+          all = all.concat(temp);
+          setUsers(all);
+          onUsers(temp.map((user) => user.username));
+          setIsLoading(false);
+          cursor = res.headers['x-next-cursor'] as string | undefined;
+        } while (cursor);
       } catch (err) {
         router.push('/server-down');
       } finally {
@@ -130,6 +150,9 @@ export function ChatLayout({ children, onSelect, ws }: ChatLayoutProps) {
                       className="h-6 w-6 mr-2"
                     />
                     {user?.username}
+                    {(presence[user?.username] ?? user?.isOnline) && (
+                      <span className="ml-auto h-2 w-2 rounded-full bg-green-500" />
+                    )}
                   </Button>
                 ))
               )}
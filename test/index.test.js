@@ -2,6 +2,12 @@ const axios = require('axios');
 
 const BACKEND_URL = "http://localhost:8000/api/v1";
 
+// The backend must run with DB_QUERY_COUNT_HEADER=true, it then reports the
+// number of database queries of every request in the X-DB-Queries header.
+const expectQueryCount = (response, expected) => {
+    expect(Number(response.headers['x-db-queries'])).toBe(expected);
+};
+
 let username, email, password;
 let token = '';
 
@@ -41,6 +47,7 @@ describe('Authentication API Tests', () => {
         });
         expect(validResponse.status).toBe(200);
         expect(validResponse.data.message).toBe("Username Available");
+        expectQueryCount(validResponse, 1);
     });
 
     test('Check username availability with an invalid username (too short)', async () => {
@@ -62,6 +69,8 @@ describe('Authentication API Tests', () => {
         const response = await axios.post(`${BACKEND_URL}/signUp`, validUserData);
         expect(response.status).toBe(201);
         expect(response.data.message).toBe("Account created successfully. An OTP has been sent to your email for verification.");
+        // email lookup + pending sign-up insert with its outbox row
+        expectQueryCount(response, 2);
     });
 
     test('User cannot create an account with missing email', async () => {
@@ -98,6 +107,8 @@ describe('Authentication API Tests', () => {
         const response = await axios.post(`${BACKEND_URL}/verify`, correctOtpData);
         expect(response.status).toBe(200);
         expect(response.data.message).toBe("User verified successfully!");
+        // OTP check, move into users and mail queueing in one statement
+        expectQueryCount(response, 1);
     });
 
     test('User cannot verify account with incorrect OTP', async () => {
@@ -109,6 +120,7 @@ describe('Authentication API Tests', () => {
         await axios.post(`${BACKEND_URL}/verify`, incorrectOtpData).catch(error => {
             expect(error.response.status).toBe(403);
             expect(error.response.data.detail).toBe("OTP is not valid!");
+            expectQueryCount(error.response, 1);
         });
     });
 
@@ -122,6 +134,8 @@ describe('Authentication API Tests', () => {
         const response = await axios.post(`${BACKEND_URL}/login`, new URLSearchParams(loginData));
         expect(response.status).toBe(200);
         expect(response.data.message).toBe("user loggedIn successfully");
+        // credentials and verification state in one query
+        expectQueryCount(response, 1);
     });
 
     test('User cannot log in with incorrect password', async () => {
@@ -132,6 +146,7 @@ describe('Authentication API Tests', () => {
 
         await axios.post(`${BACKEND_URL}/login`, new URLSearchParams(incorrectLoginData)).catch(error => {
             expect(error.response.status).toBe(401);
+            expectQueryCount(error.response, 1);
         });
     });
 